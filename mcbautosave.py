@@ -0,0 +1,104 @@
+from mcbspectrum import format_spe
+from PyQt5 import QtCore
+import threading
+import queue
+import os
+
+# file name of automatically saved spectra, formatted with the fields of
+# save_path
+default_pattern = '{id:04d}_{name}_{start:%Y%m%d_%H%M%S}.Spe'
+
+def save_path(out_dir, spec, pattern=default_pattern):
+    name = ''.join(c if c.isalnum() or c in '-_' else '_'\
+        for c in spec.det_name)
+    return os.path.join(out_dir, pattern.format(id=spec.det_id, name=name,\
+        sample=spec.sample, start=spec.start))
+
+def fsync_dir(path):
+    # make renames in path durable; directories cannot be opened for this
+    # on Windows, where the rename is already committed by the file system
+    if os.name != 'posix':
+        return
+    fd = os.open(path or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_batch(items):
+    # write every (spectrum, path) to a temporary file next to its target,
+    # then rename them all and sync each directory once; returns
+    # (path, error) per item, error None when saved
+    results = []
+    written = []
+    for spec, path in items:
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path + '.tmp', 'w') as file:
+                file.write(format_spe(spec))
+                file.flush()
+                os.fsync(file.fileno())
+            written.append(path)
+        except Exception as err:
+            results.append((path, str(err)))
+    dirs = set()
+    for path in written:
+        try:
+            os.replace(path + '.tmp', path)
+            dirs.add(os.path.dirname(path))
+            results.append((path, None))
+        except Exception as err:
+            results.append((path, str(err)))
+    for path in dirs:
+        try:
+            fsync_dir(path)
+        except OSError:
+            pass
+    return results
+
+class SpectrumWriter(QtCore.QObject):
+    # results arrive in the GUI thread through queued signals
+    sigSaved = QtCore.Signal(str)
+    sigFailed = QtCore.Signal(str, str)
+
+    def __init__(self, **kwargs):
+        # one background thread writes all spectra in submission order;
+        # batches queued while it is busy are written together
+        super().__init__(**kwargs)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, items):
+        # items are (spectrum, path) with spectra that are not changed
+        # afterwards, e.g. from MCBWidget.snapshot
+        items = list(items)
+        if items:
+            self.queue.put(items)
+
+    def close(self, timeout=10):
+        # write what is queued and stop the thread
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            stop = batch is None
+            items = [] if stop else batch
+            while not stop:
+                try:
+                    batch = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is None:
+                    stop = True
+                else:
+                    items.extend(batch)
+            for path, err in write_batch(items):
+                if err is None:
+                    self.sigSaved.emit(path)
+                else:
+                    self.sigFailed.emit(path, err)
+            if stop:
+                return
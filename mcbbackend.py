@@ -0,0 +1,35 @@
+import importlib
+import os
+
+# backend name -> (module, class); modules are only imported when chosen so
+# e.g. mcbcio32.dll is never loaded unless the 'dll' backend is requested
+backends = {
+    'dll': ('mcbdriver', 'MCBDriver'),
+    'sim': ('mcbdriver_test', 'MCBDriver'),
+    'remote': ('mcbremote', 'MCBRemoteDriver'),
+    'replay': ('mcbrecord', 'MCBReplayDriver'),
+    'listmode': ('mcblistmode', 'ListModeDriver'),
+}
+
+default_backend = 'dll'
+
+def register_backend(name, module, cls):
+    backends[name] = (module, cls)
+
+def get_backend(name):
+    if name not in backends:
+        raise ValueError('Unknown driver backend {0}, expected one of {1}'\
+            .format(name, ', '.join(sorted(backends))))
+    module, cls = backends[name]
+    return getattr(importlib.import_module(module), cls)
+
+def get_driver(spec=None):
+    # spec is '<backend>' or '<backend>:<argument>', e.g. 'sim' or
+    # 'remote:192.168.1.20:7008'; falls back to $PYSTRO_BACKEND
+    if spec is None:
+        spec = os.environ.get('PYSTRO_BACKEND', default_backend)
+    name, sep, arg = spec.partition(':')
+    driver_cls = get_backend(name)
+    if sep:
+        return driver_cls(arg)
+    return driver_cls()
@@ -0,0 +1,64 @@
+from mcbdriver import MCBDriver, default_library
+from ctypes import *
+import numpy as np
+import argparse
+import os
+import timeit
+
+class LegacyCalls:
+    # the calls as MCBDriver made them before the typed binding layer:
+    # untyped attribute lookups and fresh buffers on every call
+    def __init__(self, library):
+        self.driver = WinDLL(library) if os.name == 'nt' else CDLL(library)
+
+    def comm(self, hdet, cmd):
+        max_resp = 128
+        resp = create_string_buffer(max_resp)
+        assert self.driver.MIOComm(hdet, cmd.encode(), b'', b'', max_resp,\
+            resp, 0) == 1, 'Command Failed'
+        return resp.value.decode()
+
+    def get_data(self, hdet, start_chan=0, num_chans=1):
+        buffer = np.zeros(num_chans, dtype=np.int32)
+        ret_chans = c_int16()
+        data_mask = c_uint32()
+        roi_mask = c_uint32()
+        assert self.driver.MIOGetData(hdet, start_chan, num_chans,\
+            buffer.ctypes.data_as(POINTER(c_int32)), byref(ret_chans),\
+            byref(data_mask), byref(roi_mask), b'') > 0,\
+            'Get Data Failed'
+        return np.bitwise_and(buffer, np.uint32(data_mask.value)),\
+            np.bitwise_and(buffer, np.uint32(roi_mask.value)) > 0
+
+    def is_active(self, hdet):
+        return self.driver.MIOIsActive(hdet) == 1
+
+def per_call(func, number):
+    # best of 5 runs, in microseconds per call
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(\
+        description='Per-call overhead of the MIO bindings, before and after')
+    parser.add_argument('--library', default=default_library)
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--chans', type=int, default=64)
+    args = parser.parse_args()
+
+    typed = MCBDriver(args.library)
+    legacy = LegacyCalls(args.library)
+    hdet = typed.open_detector(1)
+
+    calls = [
+        ('comm SHOW_TRUE', lambda driver: driver.comm(hdet, 'SHOW_TRUE')),
+        ('is_active', lambda driver: driver.is_active(hdet)),
+        ('get_data {}'.format(args.chans),\
+            lambda driver: driver.get_data(hdet, 0, args.chans))
+    ]
+    print('{0:<20}{1:>12}{2:>12}{3:>10}'.format('call (usec)', 'legacy',\
+        'typed', 'speedup'))
+    for name, call in calls:
+        before = per_call(lambda: call(legacy), args.number)
+        after = per_call(lambda: call(typed), args.number)
+        print('{0:<20}{1:>12.2f}{2:>12.2f}{3:>9.2f}x'.format(name, before,\
+            after, before / after))
@@ -0,0 +1,111 @@
+import numpy as np
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+import os
+
+default_path = os.path.join(os.path.expanduser('~'), '.pystro', 'cache.db')
+
+schema = '''
+create table if not exists results (
+    key blob primary key,
+    value blob not null,
+    size integer not null,
+    used real not null
+);
+create index if not exists results_used on results (used);
+'''
+
+def content_key(kind, version, *inputs):
+    # stable digest of an analysis and everything it reads: arrays by
+    # dtype, shape and data, anything else by repr
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((kind, version)).encode())
+    for value in inputs:
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            digest.update(repr((value.dtype.str, value.shape)).encode())
+            digest.update(value.data)
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b'\0')
+    return digest.digest()
+
+class AnalysisCache:
+    def __init__(self, path=default_path, max_bytes=256*2**20):
+        # pickled results by content key in one SQLite file shared by the
+        # GUI and the command line tools; least recently used results go
+        # first once the total size passes max_bytes
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False,\
+            isolation_level=None)
+        self.db.execute('pragma journal_mode=wal')
+        self.db.execute('pragma synchronous=normal')
+        self.db.executescript(schema)
+        self.total = self.db.execute(\
+            'select coalesce(sum(size), 0) from results').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.db.execute('select value from results where key = ?',\
+                (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.db.execute('update results set used = ? where key = ?',\
+                (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            old = self.db.execute('select size from results where key = ?',\
+                (key,)).fetchone()
+            self.db.execute('insert or replace into results values '\
+                '(?, ?, ?, ?)', (key, value, len(value), time.time()))
+            self.total += len(value) - (old[0] if old else 0)
+            if self.total > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # down to 90 % of max_bytes so eviction does not run on every put
+        target = self.max_bytes * 0.9
+        keys = []
+        for key, size in self.db.execute(\
+                'select key, size from results order by used'):
+            if self.total <= target:
+                break
+            keys.append((key,))
+            self.total -= size
+        self.db.executemany('delete from results where key = ?', keys)
+
+    def memoize(self, key, function, *args):
+        # result of function(*args), computed only on a miss
+        missing = object()
+        result = self.get(key, missing)
+        if result is missing:
+            result = function(*args)
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('delete from results')
+            self.total = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('select count(*) from results')\
+                .fetchone()[0]
@@ -0,0 +1,147 @@
+import numpy as np
+
+# FWHM of a gaussian in units of its sigma
+fwhm_per_sigma = 2 * np.sqrt(2 * np.log(2))
+
+def fit_poly(x, y, weights=None, degree=2, scale=1.0, origin=False):
+    # weighted least squares polynomial, highest power first like
+    # np.polyval; x is divided by scale first so the design matrix stays
+    # well conditioned for high channel numbers
+    x = np.asarray(x, dtype=np.float64) / scale
+    y = np.asarray(y, dtype=np.float64)
+    sw = np.ones(len(x)) if weights is None else\
+        np.sqrt(np.asarray(weights, dtype=np.float64))
+    powers = np.arange(degree, 0 if origin else -1, -1)
+    design = x[:, None] ** powers
+    coeffs = np.linalg.lstsq(design * sw[:, None], y * sw, rcond=None)[0]
+    coeffs = coeffs / scale ** powers
+    if origin:
+        coeffs = np.append(coeffs, 0.)
+    return coeffs
+
+class Calibration:
+    def __init__(self, chan_max, degree=2, fwhm_degree=2):
+        # energy(chan) and FWHM(chan) polynomials; derived per-channel arrays
+        # are cached until the coefficients change
+        self.chan_max = chan_max
+        self.degree = degree
+        self.fwhm_degree = fwhm_degree
+        self.set_coeffs(np.zeros(degree+1))
+        self.set_fwhm_coeffs(None)
+
+    def set_coeffs(self, coeffs):
+        coeffs = np.asarray(coeffs, dtype=np.float64)
+        self.coeffs = np.concatenate([np.zeros(self.degree+1-len(coeffs)),\
+            coeffs])
+        self.calibrated = bool(np.any(self.coeffs != 0))
+        self.energy_cache = None
+
+    def set_fwhm_coeffs(self, coeffs):
+        self.fwhm_coeffs = None if coeffs is None else\
+            np.asarray(coeffs, dtype=np.float64)
+        self.fwhm_cache = None
+
+    def valid_points(self, chans, values, weights):
+        chans = np.asarray(chans, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.ones(len(chans)) if weights is None else\
+            np.asarray(weights, dtype=np.float64)
+        valid = (chans > 0) & (values > 0) & np.isfinite(chans) &\
+            np.isfinite(values) & np.isfinite(weights) & (weights > 0)
+        return chans[valid], values[valid], weights[valid]
+
+    def fit(self, chans, energies, weights=None):
+        # points with chan = 0 or energy = 0 are ignored; a single point
+        # gives a line through the origin, two a line, more a least squares
+        # polynomial of up to self.degree
+        chans, energies, weights = self.valid_points(chans, energies,\
+            weights)
+        npts = len(chans)
+        if npts == 0:
+            self.set_coeffs(np.zeros(self.degree+1))
+            return False
+        degree = min(self.degree, max(npts-1, 1))
+        try:
+            coeffs = fit_poly(chans, energies, weights, degree,\
+                self.chan_max, origin=(npts == 1))
+        except np.linalg.LinAlgError:
+            coeffs = np.zeros(1)
+        if not np.all(np.isfinite(coeffs)):
+            coeffs = np.zeros(1)
+        self.set_coeffs(coeffs)
+        return self.calibrated
+
+    def fit_fwhm(self, chans, fwhms, weights=None):
+        # FWHM**2 is close to a polynomial in channel (electronic noise,
+        # counting statistics and charge collection terms), so fit that with
+        # the weights carried over from FWHM to FWHM**2
+        chans, fwhms, weights = self.valid_points(chans, fwhms, weights)
+        if len(chans) == 0:
+            self.set_fwhm_coeffs(None)
+            return False
+        degree = min(self.fwhm_degree, len(chans)-1)
+        try:
+            coeffs = fit_poly(chans, fwhms**2, weights / (2*fwhms)**2,\
+                degree, self.chan_max)
+        except np.linalg.LinAlgError:
+            coeffs = None
+        self.set_fwhm_coeffs(coeffs)
+        return coeffs is not None
+
+    def abc(self):
+        # quadratic coefficients as stored in .Spe files and settings
+        return tuple(float(coeff) for coeff in self.coeffs[-3:])
+
+    def energy(self, chan):
+        return np.polyval(self.coeffs, chan)
+
+    def energies(self):
+        if self.energy_cache is None:
+            self.energy_cache = np.polyval(self.coeffs,\
+                np.arange(self.chan_max, dtype=np.float64))
+        return self.energy_cache
+
+    def fwhm(self, chan):
+        # FWHM in channels, None without a FWHM calibration
+        if self.fwhm_coeffs is None:
+            return None
+        return np.sqrt(np.maximum(np.polyval(self.fwhm_coeffs, chan), 0))
+
+    def fwhms(self):
+        if self.fwhm_coeffs is None:
+            return None
+        if self.fwhm_cache is None:
+            self.fwhm_cache = self.fwhm(np.arange(self.chan_max,\
+                dtype=np.float64))
+        return self.fwhm_cache
+
+    def fwhm_energy(self, chan):
+        # FWHM in energy units through the local slope of energy(chan)
+        fwhm = self.fwhm(chan)
+        if fwhm is None:
+            return None
+        return fwhm * np.abs(np.polyval(np.polyder(self.coeffs), chan))
+
+    def fit_peaks(self, popts, energies):
+        # calibrate from fitted ROI centroids: popts as from MCBPlot.fit_roi
+        # and the known energy of each peak (nan where unknown), weighted by
+        # the centroid and width uncertainties
+        chans = np.full(len(popts), np.nan)
+        chan_errs = np.full(len(popts), np.nan)
+        fwhms = np.full(len(popts), np.nan)
+        fwhm_errs = np.full(len(popts), np.nan)
+        for n, popt in enumerate(popts):
+            if popt['mu_chan_opt'] is not None:
+                chans[n] = popt['mu_chan_opt']
+                chan_errs[n] = popt['mu_chan_err']
+            if popt['sig_chan_opt'] is not None:
+                fwhms[n] = abs(popt['sig_chan_opt']) * fwhm_per_sigma
+                fwhm_errs[n] = popt['sig_chan_err'] * fwhm_per_sigma
+        # keep the energy calibration unless at least two peaks are known
+        energies = np.asarray(energies, dtype=np.float64)
+        energy_ok = np.sum(np.isfinite(chans) & np.isfinite(energies)) >= 2
+        with np.errstate(divide='ignore'):
+            if energy_ok:
+                energy_ok = self.fit(chans, energies, 1 / chan_errs**2)
+            fwhm_ok = self.fit_fwhm(chans, fwhms, 1 / fwhm_errs**2)
+        return energy_ok, fwhm_ok
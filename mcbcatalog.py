@@ -0,0 +1,269 @@
+from mcbspectrum import read_spe
+from mcbregion import RegionIndex
+from mcbcache import AnalysisCache, content_key
+from datetime import datetime
+import argparse
+import sqlite3
+import os
+
+default_path = os.path.join(os.path.expanduser('~'), '.pystro', 'catalog.db')
+
+schema = '''
+create table if not exists spectra (
+    id integer primary key,
+    path text unique not null,
+    mtime real not null,
+    size integer not null,
+    det_id integer,
+    det_name text,
+    start text,
+    live integer,
+    real integer,
+    sample text,
+    calib_a real,
+    calib_b real,
+    calib_c real,
+    units text,
+    chans integer,
+    total real,
+    nrois integer
+);
+create index if not exists spectra_det on spectra (det_id, start);
+create index if not exists spectra_name on spectra (det_name, start);
+create index if not exists spectra_start on spectra (start);
+create index if not exists spectra_sample on spectra (sample);
+create table if not exists peaks (
+    spectrum integer not null references spectra (id) on delete cascade,
+    roi integer not null,
+    lo integer,
+    hi integer,
+    gross real,
+    net real,
+    net_err real,
+    centroid real,
+    energy real
+);
+create index if not exists peaks_spectrum on peaks (spectrum);
+create index if not exists peaks_energy on peaks (energy);
+'''
+
+# bump when peak_list changes its results, so cached peaks are not reused
+peak_version = 1
+
+# columns of spectra returned by queries, in order
+columns = ('path', 'det_id', 'det_name', 'start', 'live', 'real', 'sample',\
+    'calib_a', 'calib_b', 'calib_c', 'units', 'chans', 'total', 'nrois')
+
+def peak_list(spec):
+    # one peak per ROI: net counts over a linear background and their
+    # centroid, in energy too when the spectrum is calibrated
+    index = RegionIndex(spec.counts)
+    a, b, c = spec.calib
+    calibrated = a != 0 or b != 0
+    peaks = []
+    for n, (start_chan, num_chans) in enumerate(spec.rois):
+        lo, hi = start_chan, start_chan + num_chans
+        region = index.region(lo, hi)
+        centroid = index.net_centroid(lo, hi)
+        energy = a*centroid**2 + b*centroid + c if calibrated and\
+            centroid is not None else None
+        peaks.append((n, lo, hi, region['gross'], region['net'],\
+            region['net_err'], centroid, energy))
+    return peaks
+
+def cached_peak_list(spec, cache=None):
+    # peak_list through an AnalysisCache, so copies of a file and files
+    # indexed again after a change elsewhere are not searched twice
+    if cache is None:
+        return peak_list(spec)
+    return cache.memoize(content_key('peaks', peak_version, spec.counts,\
+        spec.rois, spec.calib), peak_list, spec)
+
+class SpectrumCatalog:
+    def __init__(self, path=default_path, cache=None):
+        # metadata and ROI peaks of .Spe files in one SQLite database;
+        # a file is parsed again only when its mtime or size changes
+        self.cache = cache
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('pragma journal_mode=wal')
+        self.db.execute('pragma synchronous=normal')
+        self.db.execute('pragma foreign_keys=on')
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def insert(self, path, stat, spec):
+        # replaces any earlier entry of path, peaks included
+        a, b, c = spec.calib
+        self.db.execute('delete from spectra where path = ?', (path,))
+        cur = self.db.execute('insert into spectra (path, mtime, size, '\
+            'det_id, det_name, start, live, real, sample, calib_a, calib_b, '\
+            'calib_c, units, chans, total, nrois) values '\
+            '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',\
+            (path, stat.st_mtime, stat.st_size, spec.det_id, spec.det_name,\
+            spec.start.strftime('%Y-%m-%d %H:%M:%S'), spec.live, spec.real,\
+            spec.sample, a, b, c, spec.units, len(spec.counts),\
+            float(spec.counts.sum()), len(spec.rois)))
+        self.db.executemany('insert into peaks values '\
+            '(?, ?, ?, ?, ?, ?, ?, ?, ?)',\
+            [(cur.lastrowid,) + peak for peak in\
+            cached_peak_list(spec, self.cache)])
+
+    def add(self, path, spec=None):
+        # index one file, e.g. right after it was saved or opened
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.db:
+            self.insert(path, stat, read_spe(path) if spec is None else spec)
+
+    def scan(self, directory, recursive=True, verbose=False):
+        # bring the entries under directory up to date with the files on
+        # disk in one transaction; returns (added, updated, removed, failed)
+        directory = os.path.abspath(directory)
+        prefix = os.path.join(directory, '')
+        known = {row['path']: (row['mtime'], row['size']) for row in\
+            self.db.execute('select path, mtime, size from spectra where '\
+            'substr(path, 1, ?) = ?', (len(prefix), prefix))}
+        added = updated = failed = 0
+        seen = set()
+        with self.db:
+            for path, stat in self.walk(directory, recursive):
+                seen.add(path)
+                old = known.get(path)
+                if old == (stat.st_mtime, stat.st_size):
+                    continue
+                try:
+                    spec = read_spe(path)
+                except Exception as err:
+                    failed += 1
+                    if verbose:
+                        print('{0}: {1}'.format(path, err))
+                    continue
+                self.insert(path, stat, spec)
+                if old is None:
+                    added += 1
+                else:
+                    updated += 1
+            gone = [(path,) for path in known if path not in seen]
+            self.db.executemany('delete from spectra where path = ?', gone)
+        return added, updated, len(gone), failed
+
+    def walk(self, directory, recursive=True):
+        # (path, stat) of every .Spe file, from the directory entries
+        # without extra stat calls where the platform allows
+        dirs = [directory]
+        while dirs:
+            try:
+                entries = list(os.scandir(dirs.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        dirs.append(entry.path)
+                elif entry.name.lower().endswith('.spe') and\
+                        entry.is_file():
+                    yield entry.path, entry.stat()
+
+    def query(self, det_id=None, det_name=None, sample=None, start=None,\
+            end=None, min_live=None, energy=None, tolerance=1.,\
+            significance=3., limit=None):
+        # spectra matching all given criteria, newest first; sample is a
+        # substring, start and end are datetimes, energy finds spectra
+        # with a peak within tolerance of it and net counts of at least
+        # significance standard deviations
+        where = []
+        args = []
+        if det_id is not None:
+            where.append('det_id = ?')
+            args.append(det_id)
+        if det_name is not None:
+            where.append('det_name = ?')
+            args.append(det_name)
+        if sample is not None:
+            where.append("sample like ? escape '\\'")
+            args.append('%' + sample.replace('\\', '\\\\')\
+                .replace('%', '\\%').replace('_', '\\_') + '%')
+        if start is not None:
+            where.append('start >= ?')
+            args.append(start.strftime('%Y-%m-%d %H:%M:%S'))
+        if end is not None:
+            where.append('start < ?')
+            args.append(end.strftime('%Y-%m-%d %H:%M:%S'))
+        if min_live is not None:
+            where.append('live >= ?')
+            args.append(min_live)
+        if energy is not None:
+            where.append('id in (select spectrum from peaks where energy '\
+                'between ? and ? and net > ? * net_err)')
+            args.extend([energy - tolerance, energy + tolerance,\
+                significance])
+        sql = 'select {} from spectra'.format(', '.join(columns))
+        if where:
+            sql += ' where ' + ' and '.join(where)
+        sql += ' order by start desc'
+        if limit is not None:
+            sql += ' limit ?'
+            args.append(limit)
+        return [dict(row) for row in self.db.execute(sql, args)]
+
+    def peaks(self, path):
+        return [dict(row) for row in self.db.execute('select roi, lo, hi, '\
+            'gross, net, net_err, centroid, energy from peaks where spectrum '\
+            '= (select id from spectra where path = ?) order by roi',\
+            (os.path.abspath(path),))]
+
+    def __len__(self):
+        return self.db.execute('select count(*) from spectra').fetchone()[0]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(\
+        description='Index saved spectra and search them by metadata')
+    parser.add_argument('--db', default=default_path)
+    parser.add_argument('--scan', action='append', default=[],\
+        help='directory to index (repeatable)')
+    parser.add_argument('--flat', action='store_true',\
+        help='do not scan subdirectories')
+    parser.add_argument('--det-id', type=int, default=None)
+    parser.add_argument('--det-name', default=None)
+    parser.add_argument('--sample', default=None)
+    parser.add_argument('--start', default=None, help='YYYY-MM-DD[THH:MM]')
+    parser.add_argument('--end', default=None, help='YYYY-MM-DD[THH:MM]')
+    parser.add_argument('--min-live', type=float, default=None,\
+        help='live time in sec')
+    parser.add_argument('--energy', type=float, default=None)
+    parser.add_argument('--tolerance', type=float, default=1.)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--peaks', action='store_true')
+    parser.add_argument('--no-cache', action='store_true',\
+        help='search peaks without the analysis cache')
+    args = parser.parse_args()
+
+    catalog = SpectrumCatalog(args.db,\
+        None if args.no_cache else AnalysisCache())
+    for directory in args.scan:
+        print('{0}: {1} added, {2} updated, {3} removed, {4} failed'\
+            .format(directory, *catalog.scan(directory, not args.flat,\
+            verbose=True)))
+
+    rows = catalog.query(det_id=args.det_id, det_name=args.det_name,\
+        sample=args.sample,\
+        start=args.start and datetime.fromisoformat(args.start),\
+        end=args.end and datetime.fromisoformat(args.end),\
+        min_live=None if args.min_live is None else args.min_live * 1000,\
+        energy=args.energy, tolerance=args.tolerance, limit=args.limit)
+    for row in rows:
+        print('{start}  {det_id:>4} {det_name:<16} {live:>10.1f} s  '\
+            '{nrois:>3} ROI  {sample}  {path}'.format(**dict(row,\
+            live=row['live'] / 1000)))
+        if args.peaks:
+            for peak in catalog.peaks(row['path']):
+                print('    ROI {roi}: [{lo}, {hi}) net {net:.0f} +- '\
+                    '{net_err:.0f}'.format(**peak) + ('' if peak['energy']\
+                    is None else ' at {0:.2f} {1}'.format(peak['energy'],\
+                    row['units'])))
+    print('{0} of {1} spectra'.format(len(rows), len(catalog)))
@@ -0,0 +1,154 @@
+from mcbspectrum import Spectrum
+from mcbroi import ROISet
+from datetime import datetime
+
+class MCBCommands:
+    # MCB command wrappers shared by MCBWidget and the headless MCBDetector;
+    # expects self.driver, self.hdet and self.chan_max
+    gate_index = {
+        'OFF' : 0,
+        'COIN': 1,
+        'ANTI': 2
+    }
+
+    def is_active(self):
+        return self.driver.is_active(self.hdet)
+
+    def start(self):
+        self.driver.comm(self.hdet, 'START')
+
+    def stop(self):
+        self.driver.comm(self.hdet, 'STOP')
+
+    def clear(self):
+        self.driver.comm(self.hdet, 'CLEAR')
+
+    def get_data(self):
+        return self.driver.get_data(self.hdet, 0, self.chan_max)
+
+    def read_windows(self, windows, counts, roi_mask):
+        # refresh only the given (start, num) windows of counts and roi_mask
+        for start_chan, num_chans in windows:
+            data, mask = self.driver.get_data(self.hdet, start_chan, num_chans)
+            counts[start_chan:start_chan+num_chans] = data
+            roi_mask[start_chan:start_chan+num_chans] = mask
+
+    def get_real(self):
+        resp = self.driver.comm(self.hdet, 'SHOW_TRUE')
+        msec = int(resp[2:-4]) * 20
+        return msec
+
+    def get_live(self):
+        resp = self.driver.comm(self.hdet, 'SHOW_LIVE')
+        msec = int(resp[2:-4]) * 20
+        return msec
+
+    def get_real_preset(self):
+        resp = self.driver.comm(self.hdet, 'SHOW_TRUE_PRESET')
+        msec = int(resp[2:-4]) * 20
+        return msec
+
+    def get_live_preset(self):
+        resp = self.driver.comm(self.hdet, 'SHOW_LIVE_PRESET')
+        msec = int(resp[2:-4]) * 20
+        return msec
+
+    def get_gate(self):
+        resp = self.driver.comm(self.hdet, 'SHOW_GATE')
+        index = self.gate_index[resp[3:-1]]
+        return index
+
+    def get_lld(self):
+        resp = self.driver.comm(self.hdet, 'SHOW_LLD')
+        lld = int(resp[2:-4])
+        return lld
+
+    def get_uld(self):
+        resp = self.driver.comm(self.hdet, 'SHOW_ULD')
+        uld = int(resp[2:-4])
+        return uld
+
+    def get_roi(self):
+        rois = []
+        resp = self.driver.comm(self.hdet, 'SHOW_ROI')
+        while int(resp[7:12]) > 0:
+            rois.append((int(resp[2:7]), int(resp[7:12])))
+            resp = self.driver.comm(self.hdet, 'SHOW_NEXT')
+        return rois
+
+    def set_data(self, start_chan, num_chans=1, value=0):
+        self.driver.comm(self.hdet, 'SET_DATA {}, {}, {}'.format(start_chan,\
+            num_chans, value))
+
+    def set_real(self, msec):
+        ticks = int(msec / 20)
+        self.driver.comm(self.hdet, 'SET_TRUE {}'.format(ticks))
+
+    def set_live(self, msec):
+        ticks = int(msec / 20)
+        self.driver.comm(self.hdet, 'SET_LIVE {}'.format(ticks))
+
+    def set_real_preset(self, msec):
+        ticks = int(msec / 20)
+        self.driver.comm(self.hdet, 'SET_TRUE_PRESET {}'.format(ticks))
+
+    def set_live_preset(self, msec):
+        ticks = int(msec / 20)
+        self.driver.comm(self.hdet, 'SET_LIVE_PRESET {}'.format(ticks))
+
+    def set_gate(self, index):
+        options = ['OFF', 'COINCIDENT', 'ANTICOINCIDENT']
+        self.driver.comm(self.hdet, 'SET_GATE_{}'.format(options[index]))
+
+    def set_lld(self, disc):
+        self.driver.comm(self.hdet, 'SET_LLD {}'.format(disc))
+
+    def set_uld(self, disc):
+        self.driver.comm(self.hdet, 'SET_ULD {}'.format(disc))
+
+    def set_roi(self, start_chan, num_chans):
+        self.driver.comm(self.hdet, 'SET_ROI {}, {}'.format(start_chan,\
+            num_chans))
+
+    def clear_roi(self, start_chan, num_chans):
+        self.driver.comm(self.hdet, 'SET_WINDOW {}, {}'.format(start_chan,\
+            num_chans))
+        self.driver.comm(self.hdet, 'CLEAR_ROI')
+        self.driver.comm(self.hdet, 'SET_WINDOW')
+
+    def get_roi_set(self):
+        return ROISet.from_rois(self.get_roi())
+
+    def apply_rois(self, target, current=None):
+        # bring the MCB's ROI's to target with the fewest commands, sent in
+        # one round trip when the driver supports batches
+        if current is None:
+            current = self.get_roi_set()
+        cmds = current.commands(target)
+        if hasattr(self.driver, 'batch'):
+            self.driver.batch([('comm', (self.hdet, cmd)) for cmd in cmds])
+        else:
+            for cmd in cmds:
+                self.driver.comm(self.hdet, cmd)
+        return len(cmds)
+
+class MCBDetector(MCBCommands):
+    def __init__(self, mcb_driver, ndet):
+        # establish connection with MCB and get info from it
+        self.driver = mcb_driver
+        self.ndet = ndet
+        self.hdet = self.driver.open_detector(ndet)
+        self.name, self.id = self.driver.get_config_name(ndet)
+        self.chan_max = self.driver.get_det_length(self.hdet)
+        self.title = '{0:04d} {1}'.format(self.id, self.name)
+
+    def get_start_datetime(self):
+        return datetime.fromtimestamp(self.driver.get_start_time(self.hdet))
+
+    def spectrum(self, sample='', calib=(0, 0, 0), units='keV'):
+        counts, roi_mask = self.get_data()
+        return Spectrum(counts, live=self.get_live(), real=self.get_real(),\
+            sample=sample, det_id=self.id, det_name=self.name,\
+            start=self.get_start_datetime(), rois=self.get_roi(),\
+            lpre=self.get_live_preset(), rpre=self.get_real_preset(),\
+            calib=calib, units=units)
@@ -0,0 +1,116 @@
+from mcbregion import RegionIndex
+import numpy as np
+import time
+
+def remap(counts, gain):
+    # undo a gain change: counts recorded at channel c belong at c / gain;
+    # each channel is spread over its new span by linear overlap, which
+    # keeps the total (counts beyond the last channel are dropped)
+    counts = np.asarray(counts, dtype=np.float64)
+    chan_max = len(counts)
+    cum = np.zeros(chan_max+1)
+    np.cumsum(counts, out=cum[1:])
+    edges = np.arange(chan_max+1) * gain
+    return np.diff(np.interp(edges, np.arange(chan_max+1), cum))
+
+class DriftMonitor:
+    def __init__(self, period=10.0, window=360, min_counts=100,\
+            gain_threshold=0.005, rate_threshold=0.002):
+        # net centroids of reference peaks are sampled from the counts
+        # gained in each period and kept for the last window samples (an
+        # hour by default); thresholds are a relative gain change and a
+        # relative drift per hour
+        self.period = period
+        self.window = window
+        self.min_counts = min_counts
+        self.gain_threshold = gain_threshold
+        self.rate_threshold = rate_threshold
+        self.set_references([])
+
+    def set_references(self, peaks, centroids=None):
+        # peaks are [lo, hi) channel windows; without reference centroids
+        # the first sample of each peak becomes its reference
+        self.peaks = [(int(lo), int(hi)) for lo, hi in peaks]
+        npeaks = len(self.peaks)
+        self.refs = np.full(npeaks, np.nan) if centroids is None else\
+            np.asarray(centroids, dtype=np.float64)
+        self.times = np.zeros(self.window)
+        self.ratios = np.full((self.window, npeaks), np.nan)
+        self.gains = np.full(self.window, np.nan)
+        self.n = 0
+        self.count = 0
+        self.last = None
+        self.last_time = None
+        self.t0 = None
+        self.gain = 1.
+        self.rate = 0.
+        self.alerts = []
+
+    def update(self, counts, now=None):
+        # returns True when a new sample was taken
+        if not self.peaks:
+            return False
+        now = time.monotonic() if now is None else now
+        if self.last is None or np.any(counts < self.last):
+            # first spectrum or cleared since
+            self.last = np.array(counts, dtype=np.float64)
+            self.last_time = now
+            if self.t0 is None:
+                self.t0 = now
+            return False
+        if now - self.last_time < self.period:
+            return False
+
+        index = RegionIndex(counts - self.last)
+        self.last[:] = counts
+        self.last_time = now
+        centroids = np.full(len(self.peaks), np.nan)
+        for i, (lo, hi) in enumerate(self.peaks):
+            if index.gross(lo, hi) >= self.min_counts:
+                centroid = index.net_centroid(lo, hi)
+                if centroid is not None:
+                    centroids[i] = centroid
+        new = np.isnan(self.refs) & ~np.isnan(centroids)
+        self.refs[new] = centroids[new]
+
+        self.times[self.n] = now - self.t0
+        self.ratios[self.n] = centroids / self.refs
+        self.gains[self.n] = np.nan if np.all(np.isnan(self.ratios[self.n]))\
+            else np.nanmean(self.ratios[self.n])
+        self.n = (self.n + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+        self.regress()
+        self.check()
+        return True
+
+    def regress(self):
+        # least squares line of gain over the samples in the window: its
+        # value now is the gain estimate, its slope the drift
+        valid = ~np.isnan(self.gains)
+        if self.count < self.window:
+            valid[self.count:] = False
+        if not np.any(valid):
+            return
+        t = self.times[valid]
+        g = self.gains[valid]
+        if len(t) < 3:
+            self.gain = float(g.mean())
+            self.rate = 0.
+            return
+        tm = t.mean()
+        gm = g.mean()
+        var = np.sum((t - tm)**2)
+        slope = np.sum((t - tm) * (g - gm)) / var if var > 0 else 0.
+        now = self.times[(self.n - 1) % self.window]
+        self.gain = float(gm + slope * (now - tm))
+        self.rate = float(slope * 3600)
+
+    def check(self):
+        self.alerts = []
+        if abs(self.gain - 1) > self.gain_threshold:
+            self.alerts.append('gain {0:+.2f} %'.format(100*(self.gain - 1)))
+        if abs(self.rate) > self.rate_threshold:
+            self.alerts.append('drift {0:+.2f} %/h'.format(100*self.rate))
+
+    def correct(self, counts):
+        return remap(counts, self.gain)
@@ -1,8 +1,114 @@
 from ctypes import *
 import numpy as np
-from time import time
+import os
+import threading
+import time
+
+# the vendor library; any library implementing the MIO API (e.g. a stub .so
+# built from mcbstub.c) can be given instead
+default_library = os.environ.get('MCBCIO_LIBRARY',\
+    r'C:\windows\system32\mcbcio32.dll')
+
+# MIO function prototypes: name -> (restype, argtypes)
+prototypes = {
+    'MIOStartup': (c_int, []),
+    'MIOCleanup': (c_int, []),
+    'MIOGetDetLength': (c_int, [c_int]),
+    'MIOGetLastError': (c_int, [POINTER(c_int), POINTER(c_int)]),
+    'MIOOpenDetector': (c_int, [c_int, c_char_p, c_char_p]),
+    'MIOCloseDetector': (c_int, [c_int]),
+    'MIOComm': (c_int, [c_int, c_char_p, c_char_p, c_char_p, c_int,\
+        c_char_p, POINTER(c_int)]),
+    'MIOGetConfigMax': (c_int, [c_char_p, POINTER(c_int32)]),
+    'MIOGetConfigName': (c_int, [c_int, c_char_p, c_int, c_char_p,\
+        POINTER(c_int), POINTER(c_int)]),
+    'MIOGetData': (c_int, [c_int, c_uint32, c_uint32, POINTER(c_int32),\
+        POINTER(c_int16), POINTER(c_uint32), POINTER(c_uint32), c_char_p]),
+    'MIOGetStartTime': (c_uint32, [c_int, POINTER(c_long)]),
+    'MIOIsActive': (c_int, [c_int])
+}
+
+def load_library(path):
+    # stdcall on Windows, cdecl elsewhere; prototypes are declared once here
+    # so calls skip ctypes' argument guessing
+    driver = WinDLL(path) if os.name == 'nt' else CDLL(path)
+    for name, (restype, argtypes) in prototypes.items():
+        function = getattr(driver, name)
+        function.restype = restype
+        function.argtypes = argtypes
+    return driver
+
+class MCBError(Exception):
+    # a failed MIO call with the codes from MIOGetLastError; subclasses mark
+    # the errors worth retrying
+    retryable = False
+    broken = False
+
+    def __init__(self, message, error=None, macro_err=0, micro_err=0,\
+            call=None):
+        super().__init__(message)
+        self.error = error
+        self.macro_err = macro_err
+        self.micro_err = micro_err
+        self.call = call
+
+class MCBCommBroken(MCBError):
+    # -1: the detector has to be closed and opened again
+    retryable = True
+    broken = True
+
+class MCBTimeout(MCBError):
+    retryable = True
+
+class MCBCommError(MCBError):
+    retryable = True
+
+class MCBCommandError(MCBError):
+    # 2: the MCB rejected the command (see macro_err/micro_err)
+    pass
+
+error_classes = {
+    -1: MCBCommBroken,
+    -2: MCBTimeout,
+    -3: MCBCommError,
+     2: MCBCommandError
+}
+
+def mcb_error(call, error, macro_err=0, micro_err=0):
+    err_msg, mac_msg, mic_msg = describe_error(error, macro_err, micro_err)
+    message = '{0} failed: {1} ({2}; {3})'.format(call, err_msg, mac_msg,\
+        mic_msg)
+    return error_classes.get(error, MCBError)(message, error, macro_err,\
+        micro_err, call)
+
+def describe_error(error, macro_err, micro_err):
+    err_msg = MCBDriver.error_codes.get(error,\
+        'Unknown error {}'.format(error))
+    mac_msg = MCBDriver.macro_codes.get(macro_err,\
+        'Unknown macro error {}'.format(macro_err))
+    if macro_err == 129 or macro_err == 131:
+        mic_msg = MCBDriver.macro_error_codes.get(micro_err,\
+            'Unknown micro error {}'.format(micro_err))
+    else:
+        mic_msg = MCBDriver.micro_codes.get(micro_err,\
+            'Unknown micro error {}'.format(micro_err))
+    return err_msg, mac_msg, mic_msg
+
+class RetryPolicy:
+    def __init__(self, retries=3, delay=0.02, max_delay=0.5):
+        # retries after the first failure, sleeping delay, 2*delay, ... up
+        # to max_delay in between, in seconds
+        self.retries = retries
+        self.delay = delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        return min(self.delay * (1<<attempt), self.max_delay)
 
 class MCBDriver:
+    max_resp = 128
+    max_cmds = 1024
+
     error_codes = {
          0: 'No error (maybe an MCB warning)',
          1: 'Det handle or other parameter is invalid',
@@ -56,74 +162,183 @@ class MCBDriver:
         128: 'No sample data available'
     }
 
-    def __init__(self):
+    def __init__(self, library=None):
         #### the driver file mcbcio32.dll is what makes this program windows only ####
-        self.driver = windll.LoadLibrary(r'C:\windows\system32\mcbcio32.dll')
-        assert self.driver.MIOStartup() == 1, 'Startup Failed'
+        self.driver = load_library(library or default_library)
+
+        # the vendor library is not known to be thread safe and its last
+        # error is process wide, so every call and the error read after it
+        # hold this lock (detectors are probed from several threads)
+        self.lock = threading.RLock()
+        if self.driver.MIOStartup() != 1:
+            raise self.last_error('MIOStartup')
+
+        # function pointers for the per-tick calls, looked up once
+        self.mio_comm = self.driver.MIOComm
+        self.mio_get_data = self.driver.MIOGetData
+        self.mio_is_active = self.driver.MIOIsActive
+
+        # response and data buffers are reused per detector handle (calls on
+        # one handle never overlap), and encoded commands are cached
+        self.resp_bufs = {}
+        self.data_bufs = {}
+        self.cmds = {}
+
+        # retry policy per detector handle (default for the rest), and the
+        # detector number and current MIO handle behind every handle given
+        # out, which changes when a broken link is reopened
+        self.policy = RetryPolicy()
+        self.policies = {}
+        self.ndets = {}
+        self.handles = {}
 
     def __del__(self):
-        assert self.driver.MIOCleanup() == 1, 'Cleanup Failed'
+        self.driver.MIOCleanup()
 
     def get_det_length(self, hdet):
-        return self.driver.MIOGetDetLength(hdet)
+        with self.lock:
+            return self.driver.MIOGetDetLength(hdet)
 
-    def get_last_error(self):
+    def last_error_codes(self):
         macro_err = c_int()
         micro_err = c_int()
-        error = self.driver.MIOGetLastError(byref(macro_err), byref(micro_err))
+        with self.lock:
+            error = self.driver.MIOGetLastError(byref(macro_err),\
+                byref(micro_err))
+        return error, macro_err.value, micro_err.value
 
-        err_msg = self.error_codes[error]
-        mac_msg = self.macro_codes[macro_err.value]
-        if macro_err.value == 129 or macro_err.value == 131:
-            mic_msg = self.macro_error_codes[micr_erro.value]
+    def get_last_error(self):
+        return describe_error(*self.last_error_codes())
+
+    def last_error(self, call):
+        return mcb_error(call, *self.last_error_codes())
+
+    def set_retry_policy(self, hdet, policy):
+        if hdet is None:
+            self.policy = policy
         else:
-            mic_msg = self.micro_codes[micro_err.value]
-        return err_msg, mac_msg, mic_msg
+            self.policies[hdet] = policy
+
+    def recover(self, hdet, call, function, args, ok, error):
+        # a call on hdet just failed with error: retry it with backoff
+        # while the error says to try again, reopening the detector when the
+        # link broke; gives the result of the first call that succeeds (the
+        # lock is released while waiting)
+        policy = self.policies.get(hdet, self.policy)
+        for attempt in range(policy.retries):
+            if not error.retryable or (error.broken and\
+                    hdet not in self.ndets):
+                break
+            time.sleep(policy.backoff(attempt))
+            with self.lock:
+                if error.broken and not self.reconnect(hdet):
+                    error = self.last_error('MIOOpenDetector')
+                    continue
+                result = function(self.handles.get(hdet, hdet), *args)
+                if ok(result):
+                    return result
+                error = self.last_error(call)
+        raise error
+
+    def reconnect(self, hdet):
+        # close the broken handle and open the detector again behind the
+        # same hdet, so callers never see the handle change
+        with self.lock:
+            self.driver.MIOCloseDetector(self.handles.get(hdet, hdet))
+            handle = self.driver.MIOOpenDetector(self.ndets[hdet], b'', b'')
+            if handle <= 0:
+                return False
+            self.handles[hdet] = handle
+            return True
 
     def open_detector(self, ndet):
-        hdet = self.driver.MIOOpenDetector(ndet, '', '')
-        assert hdet > 0, 'Open Detector Failed'
+        with self.lock:
+            hdet = self.driver.MIOOpenDetector(ndet, b'', b'')
+            if hdet <= 0:
+                raise self.last_error('MIOOpenDetector')
+            self.ndets[hdet] = ndet
         return hdet
 
     def close_detector(self, hdet):
-        assert self.driver.MIOCloseDetector(hdet) == 1, 'Close Detector Failed'
+        handle = self.handles.pop(hdet, hdet)
+        self.resp_bufs.pop(hdet, None)
+        self.data_bufs.pop(hdet, None)
+        self.ndets.pop(hdet, None)
+        self.policies.pop(hdet, None)
+        with self.lock:
+            if self.driver.MIOCloseDetector(handle) != 1:
+                raise self.last_error('MIOCloseDetector')
 
     def comm(self, hdet, cmd):
-        max_resp = 128
-        resp = create_string_buffer(max_resp)
-        assert self.driver.MIOComm(hdet, cmd.encode(), '', '', max_resp,\
-            resp, 0) == 1, 'Command Failed'
+        resp = self.resp_bufs.get(hdet)
+        if resp is None:
+            resp = self.resp_bufs[hdet] = create_string_buffer(self.max_resp)
+        cmd_bytes = self.cmds.get(cmd)
+        if cmd_bytes is None:
+            if len(self.cmds) >= self.max_cmds:
+                self.cmds.clear()
+            cmd_bytes = self.cmds[cmd] = cmd.encode()
+        args = (cmd_bytes, b'', b'', self.max_resp, resp, None)
+        with self.lock:
+            if self.mio_comm(self.handles.get(hdet, hdet), *args) == 1:
+                return resp.value.decode()
+            error = self.last_error('MIOComm ' + cmd)
+        self.recover(hdet, 'MIOComm ' + cmd, self.mio_comm, args,\
+            lambda result: result == 1, error)
         return resp.value.decode()
 
     def get_config_max(self):
         det_max = c_int32()
-        assert self.driver.MIOGetConfigMax('', byref(det_max)) == 1,\
-            'Get Config Max Failed'
+        with self.lock:
+            if self.driver.MIOGetConfigMax(b'', byref(det_max)) != 1:
+                raise self.last_error('MIOGetConfigMax')
         return det_max.value
 
     def get_config_name(self, ndet):
         name_max = 128
         name = create_string_buffer(name_max)
         id = c_int()
-        assert self.driver.MIOGetConfigName(ndet, '', name_max, name,\
-            byref(id), 0) == 1, 'Get Config Name Failed'
+        with self.lock:
+            if self.driver.MIOGetConfigName(ndet, b'', name_max, name,\
+                    byref(id), None) != 1:
+                raise self.last_error('MIOGetConfigName')
         return name.value.decode(), id.value
 
+    def data_buf(self, hdet, num_chans):
+        # buffer and out-parameters for a handle, with their pointers made
+        # once; grown when a longer read comes in
+        bufs = self.data_bufs.get(hdet)
+        if bufs is None or len(bufs[0]) < num_chans:
+            buffer = np.zeros(num_chans, dtype=np.int32)
+            data_mask = c_uint32()
+            roi_mask = c_uint32()
+            bufs = self.data_bufs[hdet] = (buffer, data_mask, roi_mask,\
+                (buffer.ctypes.data_as(POINTER(c_int32)), byref(c_int16()),\
+                byref(data_mask), byref(roi_mask), b''))
+        return bufs
+
     def get_data(self, hdet, start_chan=0, num_chans=1):
-        buffer = np.zeros(num_chans, dtype=np.int32)
-        ret_chans = c_int16()
-        data_mask = c_uint32()
-        roi_mask = c_uint32()
-        assert self.driver.MIOGetData(hdet, start_chan, num_chans,\
-            buffer.ctypes.data_as(POINTER(c_int32)), byref(ret_chans),\
-            byref(data_mask), byref(roi_mask), '') > 0,\
-            'Get Data Failed'
-        return np.bitwise_and(buffer, data_mask),\
-            np.bitwise_and(buffer, roi_mask) > 0
+        buffer, data_mask, roi_mask, args = self.data_buf(hdet, num_chans)
+        with self.lock:
+            ok = self.mio_get_data(self.handles.get(hdet, hdet), start_chan,\
+                num_chans, *args) > 0
+            if not ok:
+                error = self.last_error('MIOGetData')
+        if not ok:
+            self.recover(hdet, 'MIOGetData', self.mio_get_data,\
+                (start_chan, num_chans) + args, lambda result: result > 0,\
+                error)
+        # masked as uint32, the same values without int64 temporaries
+        data = buffer[:num_chans].view(np.uint32)
+        return (data & np.uint32(data_mask.value)).astype(np.int64),\
+            (data & np.uint32(roi_mask.value)) != 0
 
     def get_start_time(self, hdet):
-        current_time = c_long(int(time()))
-        return self.driver.MIOGetStartTime(hdet, byref(current_time))
+        current_time = c_long(int(time.time()))
+        with self.lock:
+            return self.driver.MIOGetStartTime(self.handles.get(hdet, hdet),\
+                byref(current_time))
 
     def is_active(self, hdet):
-        return self.driver.MIOIsActive(hdet) == 1
\ No newline at end of file
+        with self.lock:
+            return self.mio_is_active(self.handles.get(hdet, hdet)) == 1
@@ -56,25 +56,26 @@ class MCBDriver:
         128: 'No sample data available'
     }
 
-    def __init__(self):
+    def __init__(self, chan_max=2048):
+        self.chan_max = int(chan_max)
         self.active = False
-        self.buffer = np.zeros(2048)
-        self.roi_mask = np.full(2048, False)
+        self.buffer = np.zeros(self.chan_max)
+        self.roi_mask = np.full(self.chan_max, False)
         self.true = 0
         self.live = 0
         self.true_preset = 0
         self.live_preset = 0
         self.gate = 'OFF'
         self.lld = 0
-        self.uld = 2047
+        self.uld = self.chan_max-1
         self.start_time = int(time())
-        self.window = (0, 2048)
+        self.window = (0, self.chan_max)
 
     def __del__(self):
         pass
 
     def get_det_length(self, hdet):
-        return 2048
+        return self.chan_max
 
     def get_last_error(self):
         return '', '', ''
@@ -89,12 +90,12 @@ class MCBDriver:
         resp = ''
         if cmd == 'START':
             self.active = True
-            self.buffer = np.arange(2048)
+            self.buffer = np.arange(self.chan_max)
             self.start_time = int(time())
         if cmd == 'STOP':
             self.active = False
         if cmd == 'CLEAR':
-            self.buffer = np.zeros(2048)
+            self.buffer = np.zeros(self.chan_max)
             self.true = 0
             self.live = 0
         if cmd == 'CLEAR_ROI':
@@ -119,42 +120,42 @@ class MCBDriver:
             self.reached_end = False
             self.roi_search = 0
             while not self.roi_mask[self.roi_search]:
-                if self.roi_search == 2047:
+                if self.roi_search == self.chan_max-1:
                     self.reached_end = True
                     break
                 self.roi_search += 1
             if not self.reached_end:
                 start_chan = self.roi_search
                 while self.roi_mask[self.roi_search]:
-                    if self.roi_search == 2047:
+                    if self.roi_search == self.chan_max-1:
                         self.reached_end = True
                         break
                     self.roi_search += 1
                 if not self.reached_end:
                     num_chans = self.roi_search-start_chan
                 else:
-                    num_chans = 2048-start_chan
+                    num_chans = self.chan_max-start_chan
             else:
                 start_chan = 0
                 num_chans = 0
             resp = '$D{0:05d}{1:05d}cccn'.format(start_chan, num_chans)
         if cmd == 'SHOW_NEXT':
             while not self.roi_mask[self.roi_search]:
-                if self.roi_search == 2047:
+                if self.roi_search == self.chan_max-1:
                     self.reached_end = True
                     break
                 self.roi_search += 1
             if not self.reached_end:
                 start_chan = self.roi_search
                 while self.roi_mask[self.roi_search]:
-                    if self.roi_search == 2047:
+                    if self.roi_search == self.chan_max-1:
                         self.reached_end = True
                         break
                     self.roi_search += 1
                 if not self.reached_end:
                     num_chans = self.roi_search-start_chan
                 else:
-                    num_chans = 2048-start_chan
+                    num_chans = self.chan_max-start_chan
             else:
                 start_chan = 0
                 num_chans = 0
@@ -183,7 +184,7 @@ class MCBDriver:
                 self.roi_mask[start_chan + i] = True
         if cmd[:10] == 'SET_WINDOW':
             if len(cmd) < 12:
-                self.window = (0, 2048)
+                self.window = (0, self.chan_max)
             else:
                 start_chan, num_chans = map(int, cmd[11:].split(','))
                 self.window = (start_chan, num_chans)
@@ -195,8 +196,9 @@ class MCBDriver:
     def get_config_name(self, ndet):
         return 'test', 1
 
-    def get_data(self, hdet, start_chan=0, num_chans=2048):
-        return self.buffer, self.roi_mask
+    def get_data(self, hdet, start_chan=0, num_chans=1):
+        return self.buffer[start_chan:start_chan+num_chans],\
+            self.roi_mask[start_chan:start_chan+num_chans]
 
     def get_start_time(self, hdet):
         return self.start_time
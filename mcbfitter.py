@@ -0,0 +1,184 @@
+from mcbcache import content_key
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5 import QtCore
+import numpy as np
+from scipy.optimize import curve_fit
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+# bump when fit_rois changes its results, so cached fits are not reused
+fit_version = 1
+
+def gauss_bg(x, A, mu, sig, m, b):
+    return A * np.exp( - (x - mu)**2 / (2 * sig**2) ) + m*x + b
+
+def fit_rois(rebin, chans, chan_max, rois, energies=None):
+    # gaussian on a linear background for each (start, num) ROI of the
+    # rebinned spectrum; energies is the per-channel calibration, None if
+    # uncalibrated; returns the fit parameters per ROI and the fit curve
+    roi_chans_full = np.array([])
+    fit_counts_full = np.array([])
+    popts = []
+
+    for roi in rois:
+        # get starting channel and number of channels of rebinned ROI
+        start_chan, num_chans = roi
+        final_chan = int((start_chan+num_chans-1) * chans / chan_max)
+        start_chan = int(start_chan * chans / chan_max)
+        num_chans = final_chan - start_chan + 1
+
+        # create arrays of ROI channels, energies, and counts
+        roi_chans = (start_chan + np.arange(num_chans))
+        real_chans = roi_chans * chan_max / chans
+        roi_mid_chan = int(start_chan + num_chans / 2)
+        real_mid_chan = int((real_chans[0] + real_chans[-1]) / 2)
+        real_num_chans = num_chans * chan_max / chans
+        if energies is not None:
+            real_energies = energies[real_chans.astype(int)]
+            real_mid_energy = (real_energies[0] + real_energies[-1]) / 2
+            real_num_energies = real_energies[-1] - real_energies[0]
+        roi_counts = rebin[roi_chans]
+
+        # perform fit to both channels and energies
+        try:
+            chan_popt, chan_pcov = curve_fit(gauss_bg, real_chans,\
+                roi_counts, sigma=np.sqrt(np.maximum(roi_counts,1)),\
+                absolute_sigma=True, p0=(rebin[roi_mid_chan],\
+                real_mid_chan, real_num_chans/2, 0, 0))
+            chan_perr = np.sqrt(np.diag(chan_pcov))
+        except:
+            chan_popt = [None]*5
+            chan_perr = [None]*5
+        if energies is not None:
+            try:
+                energy_popt, energy_pcov = curve_fit(gauss_bg,\
+                    real_energies, roi_counts,\
+                    sigma=np.sqrt(np.maximum(roi_counts,1)),\
+                    absolute_sigma=True, p0=(rebin[roi_mid_chan],\
+                    real_mid_energy, real_num_energies/2, 0, 0))
+                energy_perr = np.sqrt(np.diag(energy_pcov))
+            except:
+                energy_popt = [None]*5
+                energy_perr = [None]*5
+            popts.append({
+                'mu_chan_opt': chan_popt[1],
+                'mu_chan_err': chan_perr[1],
+                'sig_chan_opt': chan_popt[2],
+                'sig_chan_err': chan_perr[2],
+                'mu_energy_opt': energy_popt[1],
+                'mu_energy_err': energy_perr[1],
+                'sig_energy_opt': energy_popt[2],
+                'sig_energy_err': energy_perr[2]
+            })
+        else:
+            popts.append({
+                'mu_chan_opt': chan_popt[1],
+                'mu_chan_err': chan_perr[1],
+                'sig_chan_opt': chan_popt[2],
+                'sig_chan_err': chan_perr[2]
+            })
+        try:
+            fit_counts = gauss_bg(real_chans, *chan_popt)
+        except:
+            fit_counts = roi_counts
+        roi_chans_full = np.concatenate([roi_chans_full, roi_chans + 0.5])
+        fit_counts_full = np.concatenate([fit_counts_full, fit_counts])
+
+    return popts, roi_chans_full, fit_counts_full
+
+class FitJob:
+    def __init__(self, rebin, chans, chan_max, rois, energies=None,\
+            cache=None):
+        # with an AnalysisCache, fits of inputs seen before are looked up
+        self.rebin = rebin
+        self.chans = chans
+        self.chan_max = chan_max
+        self.rois = [tuple(roi) for roi in rois]
+        self.energies = energies
+        self.cache = cache
+
+    def signature(self):
+        # identical inputs give identical fits: the ROI's, the counts in
+        # them and the calibration
+        parts = []
+        for start_chan, num_chans in self.rois:
+            start = int(start_chan * self.chans / self.chan_max)
+            final = int((start_chan+num_chans-1) * self.chans /\
+                self.chan_max)
+            parts.append(np.asarray(self.rebin[start:final+1]))
+        return content_key('fit', fit_version, self.chans, self.chan_max,\
+            self.rois, self.energies, *parts)
+
+    def run(self):
+        if self.cache is None:
+            return self.fit()
+        return self.cache.memoize(self.signature(), self.fit)
+
+    def fit(self):
+        return fit_rois(self.rebin, self.chans, self.chan_max, self.rois,\
+            self.energies)
+
+class FitService(QtCore.QObject):
+    # (owner, generation, result), emitted from a worker thread
+    sigFitted = QtCore.Signal(object, object, object)
+
+    def __init__(self, max_workers=2, **kwargs):
+        # ROI fits of all detectors on a bounded pool; each owner has at
+        # most one job waiting, newer jobs replace it and results of jobs
+        # that were overtaken are dropped
+        super().__init__(**kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,\
+            thread_name_prefix='fit')
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.callbacks = {}
+        self.generations = {}
+        self.signatures = {}
+        self.sigFitted.connect(self.deliver)
+
+    def shutdown(self):
+        with self.lock:
+            self.pending = {}
+        self.executor.shutdown(wait=False)
+
+    def submit(self, owner, job, callback, force=False):
+        # returns False when the inputs match the last job of owner
+        signature = job.signature()
+        with self.lock:
+            if not force and self.signatures.get(owner) == signature:
+                return False
+            self.signatures[owner] = signature
+            generation = self.generations.get(owner, 0) + 1
+            self.generations[owner] = generation
+            self.callbacks[owner] = callback
+            queued = owner in self.pending
+            self.pending[owner] = (generation, job)
+        if not queued:
+            self.executor.submit(self.run, owner)
+        return True
+
+    def run(self, owner):
+        # executes in the pool with the newest job of owner at that time
+        with self.lock:
+            generation, job = self.pending.pop(owner, (None, None))
+        if job is None:
+            return
+        try:
+            result = job.run()
+        except Exception as err:
+            result = err
+        self.sigFitted.emit(owner, generation, result)
+
+    def deliver(self, owner, generation, result):
+        # runs in the GUI thread
+        with self.lock:
+            if generation != self.generations.get(owner):
+                return
+            callback = self.callbacks.get(owner)
+        if isinstance(result, Exception):
+            log.warning('Fit failed: %s', result)
+            return
+        if callback is not None:
+            callback(result)
@@ -0,0 +1,107 @@
+from mcbdetector import MCBDetector
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PyQt5 import QtCore
+import numpy as np
+import threading
+
+# detector fields kept between sessions to build the panels before any MCB
+# has answered
+inventory_keys = ('ndet', 'name', 'id', 'chan_max')
+
+def probe_detector(mcb_driver, ndet):
+    # open a detector and read everything an MCBWidget starts from; only
+    # touches its own handle, so detectors can be probed side by side
+    det = MCBDetector(mcb_driver, ndet)
+    counts, roi_mask = det.get_data()
+    return {
+        'ndet': ndet,
+        'hdet': det.hdet,
+        'name': det.name,
+        'id': det.id,
+        'chan_max': det.chan_max,
+        'active': det.is_active(),
+        'start_time': mcb_driver.get_start_time(det.hdet),
+        'real': det.get_real(),
+        'live': det.get_live(),
+        'real_preset': det.get_real_preset(),
+        'live_preset': det.get_live_preset(),
+        'gate': det.get_gate(),
+        'lld': det.get_lld(),
+        'uld': det.get_uld(),
+        'counts': counts,
+        'roi_mask': roi_mask
+    }
+
+def idle_state(entry):
+    # stand-in state for a cached detector that is not open yet
+    chan_max = entry['chan_max']
+    state = dict(entry)
+    state.update({
+        'hdet': None,
+        'active': False,
+        'start_time': 0,
+        'real': 0,
+        'live': 0,
+        'real_preset': 0,
+        'live_preset': 0,
+        'gate': 0,
+        'lld': 0,
+        'uld': chan_max-1,
+        'counts': np.zeros(chan_max, dtype=np.int32),
+        'roi_mask': np.zeros(chan_max, dtype=bool)
+    })
+    return state
+
+def inventory_entry(info):
+    return {key: info[key] for key in inventory_keys}
+
+def discover(mcb_driver, max_workers=8):
+    # probe every configured detector with a bounded pool, in ndet order
+    det_max = mcb_driver.get_config_max()
+    if det_max == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, det_max),\
+            thread_name_prefix='mcb-probe') as pool:
+        return list(pool.map(lambda ndet: probe_detector(mcb_driver, ndet),\
+            range(1, det_max+1)))
+
+class InventoryLoader(QtCore.QObject):
+    # probes detectors in background threads; results arrive in the GUI
+    # thread through queued signals as each detector answers
+    sigProbed = QtCore.Signal(object)
+    sigFailed = QtCore.Signal(int, str)
+    sigFinished = QtCore.Signal(object)
+
+    def __init__(self, mcb_driver, max_workers=8, **kwargs):
+        super().__init__(**kwargs)
+        self.driver = mcb_driver
+        self.max_workers = max_workers
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        inventory = []
+        try:
+            det_max = self.driver.get_config_max()
+        except Exception as err:
+            self.sigFailed.emit(0, str(err))
+            self.sigFinished.emit(inventory)
+            return
+        if det_max > 0:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers,\
+                    det_max), thread_name_prefix='mcb-probe') as pool:
+                futures = {pool.submit(probe_detector, self.driver, ndet):\
+                    ndet for ndet in range(1, det_max+1)}
+                for future in as_completed(futures):
+                    try:
+                        info = future.result()
+                    except Exception as err:
+                        self.sigFailed.emit(futures[future], str(err))
+                        continue
+                    inventory.append(inventory_entry(info))
+                    self.sigProbed.emit(info)
+        inventory.sort(key=lambda entry: entry['ndet'])
+        self.sigFinished.emit(inventory)
@@ -0,0 +1,172 @@
+from mcbdriver_test import MCBDriver as MCBSimDriver
+import numpy as np
+import os
+import socket
+import threading
+import time
+
+# one list-mode event: timestamp in ns and ADC channel, packed little endian
+event_dtype = np.dtype([('time', '<u8'), ('chan', '<u2')])
+batch_size = 1<<20
+
+def read_events(path, batch_size=batch_size):
+    # yield batches of events from a raw event file without loading it whole
+    events = np.memmap(path, dtype=event_dtype, mode='r')
+    for i in range(0, len(events), batch_size):
+        yield np.array(events[i:i+batch_size])
+
+def stream_events(address, batch_size=batch_size):
+    # yield batches of events as they arrive on a 'host:port' socket
+    host, sep, port = address.rpartition(':')
+    buf = bytearray(batch_size * event_dtype.itemsize)
+    view = memoryview(buf)
+    fill = 0
+    with socket.create_connection((host or 'localhost', int(port))) as sock:
+        while True:
+            n = sock.recv_into(view[fill:])
+            if n == 0:
+                return
+            fill += n
+
+            # hand over whole events and keep any partial one for later
+            nevents = fill // event_dtype.itemsize
+            if nevents > 0:
+                yield np.frombuffer(buf, dtype=event_dtype,\
+                    count=nevents).copy()
+                used = nevents * event_dtype.itemsize
+                buf[:fill-used] = buf[used:fill]
+                fill -= used
+
+def open_events(source, batch_size=batch_size):
+    if os.path.exists(source):
+        return read_events(source, batch_size)
+    return stream_events(source, batch_size)
+
+def time_slice(events, t_start=None, t_stop=None):
+    # events are time ordered, so a window is two binary searches
+    times = events['time']
+    i0 = 0 if t_start is None else np.searchsorted(times, t_start, 'left')
+    i1 = len(events) if t_stop is None else\
+        np.searchsorted(times, t_stop, 'left')
+    return events[i0:i1]
+
+class ListModeHistogram:
+    def __init__(self, chan_max, lld=0, uld=None, t_start=None, t_stop=None):
+        self.chan_max = chan_max
+        self.lld = lld
+        self.uld = chan_max-1 if uld is None else uld
+        self.t_start = t_start
+        self.t_stop = t_stop
+        self.clear()
+
+    def clear(self):
+        self.counts = np.zeros(self.chan_max, dtype=np.int64)
+        self.nevents = 0
+        self.first_time = None
+        self.last_time = None
+
+    def add(self, events):
+        events = time_slice(events, self.t_start, self.t_stop)
+        if len(events) == 0:
+            return
+        if self.first_time is None:
+            self.first_time = int(events['time'][0])
+        self.last_time = int(events['time'][-1])
+
+        # gate on the discriminators, then histogram the whole batch at once
+        chans = events['chan']
+        chans = chans[(chans >= self.lld) & (chans <= self.uld)]
+        self.counts += np.bincount(chans, minlength=self.chan_max)
+        self.nevents += len(chans)
+
+    def elapsed(self):
+        # elapsed time covered by the events so far, in ns
+        if self.first_time is None:
+            return 0
+        return self.last_time - self.first_time
+
+class ListModeDriver(MCBSimDriver):
+    def __init__(self, source, chan_max=16384):
+        # source is an event file path or 'host:port', optionally followed by
+        # '@<channels>', e.g. 'run42.evt@4096'
+        if '@' in source:
+            source, chan_max = source.rsplit('@', 1)
+        super().__init__(chan_max)
+        self.source = source
+        self.events = None
+        self.hist = ListModeHistogram(self.chan_max)
+        # guards the histogram and every setting the reader uses; reading
+        # is true while a reader thread owns the event source
+        self.lock = threading.Lock()
+        self.thread = None
+        self.reading = False
+        self.buffer = self.hist.counts
+
+    def reader(self):
+        # histogram event batches in the background while active; only one
+        # reader runs at a time (see comm), so the source itself needs no lock
+        try:
+            if self.events is None:
+                self.events = open_events(self.source)
+            for events in self.events:
+                with self.lock:
+                    # cut the batch at a real/live time preset like the MCB
+                    # would
+                    presets = [p for p in (self.true_preset,\
+                        self.live_preset) if p > 0]
+                    if presets and len(events) > 0:
+                        t0 = self.hist.first_time
+                        if t0 is None:
+                            t0 = int(events['time'][0])
+                        t_stop = t0 + min(presets) * 20000000
+                        if events['time'][-1] >= t_stop:
+                            events = time_slice(events, None, t_stop + 1)
+                            self.active = False
+
+                    self.hist.lld = self.lld
+                    self.hist.uld = self.uld
+                    self.hist.add(events)
+                    self.true = self.live = self.hist.elapsed() // 20000000
+                    if not self.active:
+                        self.reading = False
+                        return
+        finally:
+            with self.lock:
+                if self.reading:
+                    # the source ran out or failed
+                    self.active = False
+                    self.reading = False
+
+    def comm(self, hdet, cmd):
+        if cmd == 'START':
+            with self.lock:
+                if self.active:
+                    return ''
+                self.active = True
+                self.start_time = int(time.time())
+                if self.reading:
+                    # stopped between two batches, the reader carries on
+                    return ''
+
+            # the old reader has given up the source; let it finish before
+            # the next one takes over
+            if self.thread is not None:
+                self.thread.join()
+            with self.lock:
+                self.reading = True
+            self.thread = threading.Thread(target=self.reader, daemon=True)
+            self.thread.start()
+            return ''
+        with self.lock:
+            if cmd == 'CLEAR':
+                self.hist.clear()
+                self.buffer = self.hist.counts
+                self.true = 0
+                self.live = 0
+                return ''
+            return super().comm(hdet, cmd)
+
+    def get_data(self, hdet, start_chan=0, num_chans=1):
+        with self.lock:
+            return self.buffer[start_chan:start_chan+num_chans].copy(),\
+                self.roi_mask[start_chan:start_chan+num_chans].copy()
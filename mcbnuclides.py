@@ -0,0 +1,133 @@
+import numpy as np
+
+# common gamma lines: nuclide, energy (keV), intensity (% per decay)
+gamma_lines = [
+    ('Am-241', 26.34, 2.27),
+    ('Am-241', 59.54, 35.9),
+    ('Ba-133', 81.00, 32.9),
+    ('Ba-133', 276.40, 7.16),
+    ('Ba-133', 302.85, 18.34),
+    ('Ba-133', 356.01, 62.05),
+    ('Ba-133', 383.85, 8.94),
+    ('Cd-109', 88.03, 3.64),
+    ('Co-57', 122.06, 85.6),
+    ('Co-57', 136.47, 10.68),
+    ('Tc-99m', 140.51, 89.0),
+    ('U-235', 143.76, 10.96),
+    ('Ce-139', 165.86, 79.9),
+    ('U-235', 185.72, 57.2),
+    ('Ra-226', 186.21, 3.64),
+    ('Pb-212', 238.63, 43.6),
+    ('Hg-203', 279.20, 81.6),
+    ('Pb-214', 295.22, 18.41),
+    ('Cr-51', 320.08, 9.91),
+    ('Pb-214', 351.93, 35.6),
+    ('I-131', 364.49, 81.5),
+    ('Sn-113', 391.70, 64.97),
+    ('Na-22', 511.00, 180.7),
+    ('Sr-85', 514.00, 96.0),
+    ('Tl-208', 583.19, 85.0),
+    ('Bi-214', 609.31, 45.49),
+    ('Cs-137', 661.66, 85.1),
+    ('Eu-152', 121.78, 28.53),
+    ('Eu-152', 244.70, 7.55),
+    ('Eu-152', 344.28, 26.59),
+    ('Eu-152', 778.90, 12.93),
+    ('Co-58', 810.76, 99.4),
+    ('Mn-54', 834.85, 99.98),
+    ('Y-88', 898.04, 93.7),
+    ('Ac-228', 911.20, 25.8),
+    ('Eu-152', 964.08, 14.51),
+    ('Ac-228', 968.97, 15.8),
+    ('Eu-152', 1085.84, 10.11),
+    ('Fe-59', 1099.25, 56.5),
+    ('Eu-152', 1112.08, 13.67),
+    ('Zn-65', 1115.54, 50.04),
+    ('Bi-214', 1120.29, 14.91),
+    ('Co-60', 1173.23, 99.85),
+    ('Na-22', 1274.54, 99.94),
+    ('Fe-59', 1291.60, 43.2),
+    ('Co-60', 1332.49, 99.98),
+    ('Eu-152', 1408.01, 20.87),
+    ('K-40', 1460.82, 10.66),
+    ('Bi-214', 1764.49, 15.31),
+    ('Y-88', 1836.06, 99.2),
+    ('Tl-208', 2614.51, 99.75)
+]
+
+# calibration units the library can be matched in, as factors to keV
+unit_factors = {
+    'eV': 1e-3,
+    'keV': 1.0,
+    'MeV': 1e3
+}
+
+class NuclideLibrary:
+    def __init__(self, names, nuclides, energies, intensities):
+        # lines are kept as parallel arrays sorted by energy so lookups are
+        # binary searches; nuclides[i] indexes into names
+        order = np.argsort(energies, kind='stable')
+        self.names = list(names)
+        self.nuclides = np.asarray(nuclides, dtype=np.int16)[order]
+        self.energies = np.asarray(energies, dtype=np.float64)[order]
+        self.intensities = np.asarray(intensities, dtype=np.float32)[order]
+
+    @classmethod
+    def from_lines(cls, lines):
+        names = sorted(set(name for name, energy, intensity in lines))
+        index = {name: n for n, name in enumerate(names)}
+        return cls(names, [index[line[0]] for line in lines],\
+            [line[1] for line in lines], [line[2] for line in lines])
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(list(data['names']), data['nuclides'], data['energies'],\
+            data['intensities'])
+
+    def save(self, path):
+        np.savez_compressed(path, names=np.array(self.names),\
+            nuclides=self.nuclides, energies=self.energies,\
+            intensities=self.intensities)
+
+    def match(self, energies, tols):
+        # index ranges [lo, hi) of library lines within tol of each energy
+        energies = np.atleast_1d(np.asarray(energies, dtype=np.float64))
+        tols = np.broadcast_to(tols, energies.shape)
+        lo = np.searchsorted(self.energies, energies - tols, 'left')
+        hi = np.searchsorted(self.energies, energies + tols, 'right')
+        return lo, hi
+
+    def score(self, energies, tols, emin=None, emax=None):
+        # fraction of each nuclide's line intensity (within the measured
+        # energy range) that is matched by a peak
+        lo, hi = self.match(energies, tols)
+        matched = np.zeros(len(self.energies), dtype=bool)
+        for i0, i1 in zip(lo.tolist(), hi.tolist()):
+            matched[i0:i1] = True
+
+        i0 = 0 if emin is None else np.searchsorted(self.energies, emin)
+        i1 = len(self.energies) if emax is None else\
+            np.searchsorted(self.energies, emax, 'right')
+        nuclides = self.nuclides[i0:i1]
+        intensities = self.intensities[i0:i1]
+        total = np.bincount(nuclides, intensities, len(self.names))
+        found = np.bincount(nuclides[matched[i0:i1]],\
+            intensities[matched[i0:i1]], len(self.names))
+        return np.divide(found, total, out=np.zeros(len(self.names)),\
+            where=total > 0)
+
+    def identify(self, energies, tols, emin=None, emax=None):
+        # for each peak, candidate (name, line energy, nuclide score) sorted
+        # by score so nuclides confirmed by several peaks come first
+        scores = self.score(energies, tols, emin, emax)
+        lo, hi = self.match(energies, tols)
+        candidates = []
+        for i0, i1 in zip(lo.tolist(), hi.tolist()):
+            lines = [(self.names[self.nuclides[i]], self.energies[i],\
+                scores[self.nuclides[i]]) for i in range(i0, i1)]
+            lines.sort(key=lambda line: -line[2])
+            candidates.append(lines)
+        return candidates
+
+default_library = NuclideLibrary.from_lines(gamma_lines)
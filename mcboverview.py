@@ -0,0 +1,60 @@
+from mcbplot import MCBViewBox, max_pyramid, envelope
+from PyQt5 import QtCore
+import pyqtgraph as pg
+import numpy as np
+
+class MCBOverview(pg.GraphicsLayoutWidget):
+    sigSelected = QtCore.Signal(int)
+
+    columns = 2
+    thumb_width = 400
+
+    def __init__(self, mcbs, **kwargs):
+        super().__init__(**kwargs)
+        self.mcbs = mcbs
+
+        # all thumbnails live in this one scene and repaint together
+        self.labels = []
+        self.plots = []
+        self.hists = []
+        for n, mcb in enumerate(mcbs):
+            row, col = divmod(n, self.columns)
+            label = self.addLabel(mcb.title, row=2*row, col=col,\
+                justify='left')
+            plot = self.addPlot(row=2*row+1, col=col)
+            plot.setMouseEnabled(False, False)
+            plot.setMenuEnabled(False)
+            plot.hideButtons()
+            plot.hideAxis('bottom')
+            plot.hideAxis('left')
+            plot.setXRange(0, mcb.chan_max, padding=0)
+            hist = pg.BarGraphItem(x0=[], width=1, height=[],\
+                pen=MCBViewBox.hist_color, brush=MCBViewBox.hist_color)
+            plot.addItem(hist)
+
+            self.labels.append(label)
+            self.plots.append(plot)
+            self.hists.append(hist)
+
+        # drill into a detector's full panel when its thumbnail is clicked
+        self.scene().sigMouseClicked.connect(self.mouse_clicked)
+
+    def mouse_clicked(self, ev):
+        for n, plot in enumerate(self.plots):
+            if plot.sceneBoundingRect().contains(ev.scenePos()):
+                self.sigSelected.emit(n)
+                ev.accept()
+                return
+
+    def update_overview(self):
+        for n, mcb in enumerate(self.mcbs):
+            # decimate each spectrum to the thumbnail width
+            levels = max_pyramid(mcb.counts)
+            x, width, height = envelope(levels, 0, mcb.chan_max,\
+                self.thumb_width)
+            self.hists[n].setOpts(x0=x, width=width, height=height)
+            self.plots[n].setYRange(0,\
+                1<<int(height.max(initial=0)).bit_length(), padding=0)
+
+            self.labels[n].setText('{0}    Rate: {1}    Dead: {2}'.format(\
+                mcb.title, mcb.rate_str, mcb.dead_str))
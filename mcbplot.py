@@ -1,11 +1,34 @@
+from mcbfitter import FitJob
 from PyQt5 import QtGui, QtCore
 import pyqtgraph as pg
 import pyqtgraph.functions as fn
 import numpy as np
-from scipy.optimize import curve_fit
 import types
 
+def max_pyramid(values):
+    # levels[k][i] is the max of values[i<<k:(i+1)<<k]
+    levels = [values]
+    while len(levels[-1]) > 1:
+        prev = levels[-1]
+        level = np.maximum(prev[0:len(prev)-1:2], prev[1::2])
+        if len(prev) % 2:
+            level = np.append(level, prev[-1])
+        levels.append(level)
+    return levels
+
+def envelope(levels, x0, x1, npix):
+    # pick the coarsest level with at least one block per pixel and return
+    # the visible blocks' start channels, width and max (peak-preserving)
+    bins_per_pix = max((x1 - x0) / max(npix, 1), 1)
+    k = min(int(np.log2(bins_per_pix)), len(levels)-1)
+    level = levels[k]
+    i0 = max(int(x0) >> k, 0)
+    i1 = min((int(np.ceil(x1)) >> k) + 1, len(level))
+    return np.arange(i0, i1) << k, 1 << k, level[i0:i1]
+
 class MCBPlot(pg.PlotWidget):
+    chan_min = 8
+
     def __init__(self, chan_max, counts, roi_mask, **kwargs):
         self.rebin = counts
         self.roi_rebin_mask = roi_mask
@@ -17,14 +40,26 @@ class MCBPlot(pg.PlotWidget):
         self.chan_max = chan_max
         self.chans = chan_max
         self.ylim = 1<<int(counts.max()).bit_length()
-
-        self.setMouseEnabled(False, False)
+        self.mode = 'Auto'
+        self.log_bufs = {}
+        self.fit_chans = np.array([])
+        self.fit_counts = np.array([])
+        self.pyramid = max_pyramid(self.rebin)
+        self.roi_pyramid = max_pyramid(self.roi_rebin)
+
+        # zoom (mouse wheel) and pan (middle drag) along channels only
+        self.setMouseEnabled(True, False)
+        self.view.setLimits(xMin=0, xMax=self.chans, minXRange=self.chan_min)
+        self.view.chans = self.chans
         self.hideAxis('bottom')
         self.hideAxis('left')
         self.setMinimumWidth(1024)
         self.setXRange(0, self.chans, padding=0)
         self.setYRange(0, self.ylim, padding=0)
 
+        # redraw only what is visible whenever the user zooms or pans
+        self.sigXRangeChanged.connect(self.redraw)
+
     def line(self):
         return self.view.line
 
@@ -40,113 +75,70 @@ class MCBPlot(pg.PlotWidget):
     def fit(self):
         return self.view.fit
 
-    def fit_roi(self, rois, calibrated, a, b, c):
-        roi_chans_full = np.arange(self.chans)[self.roi_rebin_mask] + 0.5
-        fit_counts_full = np.array([])
-        popts = []
-
-        for roi in rois:
-            # get starting channel and number of channels of rebinned ROI
-            start_chan, num_chans = roi
-            final_chan = int((start_chan+num_chans-1) * self.chans /\
-                self.chan_max)
-            start_chan = int(start_chan * self.chans / self.chan_max)
-            num_chans = final_chan - start_chan + 1
-
-            # create arrays of ROI channels, energies, and counts
-            roi_chans = (start_chan + np.arange(num_chans))
-            real_chans = roi_chans * self.chan_max / self.chans
-            roi_mid_chan = int(start_chan + num_chans / 2)
-            real_mid_chan = int((real_chans[0] + real_chans[-1]) / 2)
-            real_num_chans = num_chans * self.chan_max / self.chans
-            if calibrated:
-                roi_energies = a*roi_chans**2 + b*roi_chans + c
-                real_energies = roi_energies * self.chan_max /self.chans
-                real_mid_energy = (real_energies[0] + real_energies[-1]) / 2
-                real_num_energies = real_energies[-1] - real_energies[0]
-            roi_counts = self.rebin[roi_chans]
-
-            # perform fit to both channels and energies
-            try:
-                chan_popt, chan_pcov = curve_fit(self.gauss_bg, real_chans,\
-                    roi_counts, sigma=np.sqrt(np.maximum(roi_counts,1)),\
-                    absolute_sigma=True, p0=(self.rebin[roi_mid_chan],\
-                    real_mid_chan, real_num_chans/2, 0, 0))
-                chan_perr = np.sqrt(np.diag(chan_pcov))
-            except:
-                chan_popt = [None]*5
-                chan_perr = [None]*5
-            if calibrated:
-                try:
-                    energy_popt, energy_pcov = curve_fit(self.gauss_bg,\
-                        real_energies, roi_counts,\
-                        sigma=np.sqrt(np.maximum(roi_counts,1)),\
-                        absolute_sigma=True, p0=(self.rebin[roi_mid_chan],\
-                        real_mid_energy, real_num_energies/2, 0, 0))
-                    energy_perr = np.sqrt(np.diag(energy_pcov))
-                except:
-                    energy_popt = [None]*5
-                    energy_perr = [None]*5
-                popts.append({
-                    'mu_chan_opt': chan_popt[1],
-                    'mu_chan_err': chan_perr[1],
-                    'sig_chan_opt': chan_popt[2],
-                    'sig_chan_err': chan_perr[2],
-                    'mu_energy_opt': energy_popt[1],
-                    'mu_energy_err': energy_perr[1],
-                    'sig_energy_opt': energy_popt[2],
-                    'sig_energy_err': energy_perr[2]
-                })
-            else:
-                popts.append({
-                    'mu_chan_opt': chan_popt[1],
-                    'mu_chan_err': chan_perr[1],
-                    'sig_chan_opt': chan_popt[2],
-                    'sig_chan_err': chan_perr[2]
-                })
-            try:
-                fit_counts = self.gauss_bg(real_chans, *chan_popt)
-            except:
-                fit_counts = roi_counts
-            fit_counts_full = np.concatenate([fit_counts_full, fit_counts])
+    def fit_roi(self, rois, energies=None, cache=None):
+        # energies is the per-channel calibration, None if uncalibrated
+        popts, fit_chans, fit_counts = self.fit_job(rois, energies,\
+            cache).run()
+        self.set_fit(fit_chans, fit_counts)
+        return popts
+
+    def fit_job(self, rois, energies=None, cache=None):
+        # the same fit, to run elsewhere on the current spectrum
+        return FitJob(self.rebin, self.chans, self.chan_max, rois, energies,\
+            cache)
 
+    def set_fit(self, fit_chans, fit_counts):
         # plot fit points
+        self.fit_chans = fit_chans
+        self.fit_counts = fit_counts
+        self.draw_fit()
+
+    def draw_fit(self):
         if self.mode == 'Log':
-            logsafe = np.maximum(fit_counts_full, 1)
-            self.fit().setData(x=roi_chans_full, y=np.log2(logsafe))
+            self.fit().setData(x=self.fit_chans,\
+                y=self.log_scale(self.fit_counts, 'fit'))
         else:
-            self.fit().setData(x=roi_chans_full, y=fit_counts_full)
+            self.fit().setData(x=self.fit_chans, y=self.fit_counts)
 
-        return popts
+    def set_mode(self, mode):
+        # switching scale only re-maps what is already drawn, no refit
+        self.mode = mode
+        self.redraw()
+        self.draw_fit()
+
+    def log_scale(self, values, name):
+        # log2 into a reusable buffer instead of allocating new arrays;
+        # log is monotonic so it can be applied after decimation
+        buf = self.log_bufs.get(name)
+        if buf is None or len(buf) < len(values):
+            buf = np.empty(max(len(values), self.minimumWidth()))
+            self.log_bufs[name] = buf
+        out = buf[:len(values)]
+        np.maximum(values, 1, out=out)
+        np.log2(out, out=out)
+        return out
 
     def update(self, chans, counts, roi_mask, mode):
         self.rebin = counts.reshape((chans, -1)).sum(axis=1)
         self.roi_rebin_mask = roi_mask.reshape((chans, -1)).any(axis=1)
         self.roi_rebin = np.where(self.roi_rebin_mask, self.rebin, 0)
-
-        # update plot ranges
-        self.setXRange(0, chans, padding=0)
+        self.pyramid = max_pyramid(self.rebin)
+        self.roi_pyramid = max_pyramid(self.roi_rebin)
         self.mode = mode
-        if self.mode == 'Log':
-            ylim = 31
-        else:
-            ylim = 1<<int(self.rebin.max()).bit_length()
-        self.setYRange(0, ylim, padding=0)
-
-        # update histograms
-        if self.mode == 'Log':
-            logsafe = np.maximum(self.rebin, 1)
-            roi_logsafe = np.maximum(1, self.roi_rebin)
-            self.hist().setOpts(x0=np.arange(chans), height=np.log2(logsafe))
-            self.roi().setOpts(x0=np.arange(chans), height=np.log2(roi_logsafe))
-        else:
-            self.hist().setOpts(x0=np.arange(chans), height=self.rebin)
-            self.roi().setOpts(x0=np.arange(chans), height=self.roi_rebin)
 
         old_chans = self.chans
         old_ylim = self.ylim
         self.chans = chans
-        self.ylim = ylim
+        self.view.chans = chans
+
+        # keep the zoomed region when the number of channels changes
+        (x0, x1), _ = self.viewRange()
+        self.view.setLimits(xMin=0, xMax=chans,\
+            minXRange=min(self.chan_min, chans))
+        if chans != old_chans:
+            self.setXRange(x0 * chans / old_chans, x1 * chans / old_chans,\
+                padding=0)
+        self.redraw()
 
         # update position of line
         self.line().setValue(self.line().value() * self.chans / old_chans)
@@ -158,8 +150,26 @@ class MCBPlot(pg.PlotWidget):
             self.box().setSize((self.box().size().x() * self.chans / old_chans,\
                 self.box().size().y() * self.ylim / old_ylim))
 
-    def gauss_bg(self, x, A, mu, sig, m, b):
-        return A * np.exp( - (x - mu)**2 / (2 * sig**2) ) + m*x + b
+    def redraw(self):
+        # draw O(pixels) bars for the visible channels instead of all of them
+        (x0, x1), _ = self.viewRange()
+        npix = int(self.view.width()) or self.minimumWidth()
+        x, width, height = envelope(self.pyramid, x0, x1, npix)
+        roi_x, roi_width, roi_height = envelope(self.roi_pyramid, x0, x1, npix)
+
+        # update y range to the visible peak
+        if self.mode == 'Log':
+            self.ylim = 31
+        else:
+            self.ylim = 1<<int(height.max(initial=0)).bit_length()
+        self.setYRange(0, self.ylim, padding=0)
+
+        # update histograms
+        if self.mode == 'Log':
+            height = self.log_scale(height, 'hist')
+            roi_height = self.log_scale(roi_height, 'roi')
+        self.hist().setOpts(x0=x, width=width, height=height)
+        self.roi().setOpts(x0=roi_x, width=roi_width, height=roi_height)
 
 class MCBViewBox(pg.ViewBox):
     hist_color = (0, 191, 255)
@@ -168,6 +178,7 @@ class MCBViewBox(pg.ViewBox):
     def __init__(self, chan_max, rebin, roi_rebin, **kwargs):
         super().__init__(**kwargs)
         self.contextMenu = []
+        self.chans = chan_max
 
         # create initial histogram
         self.hist = pg.BarGraphItem(x0=np.arange(chan_max), height=rebin,\
@@ -195,7 +206,12 @@ class MCBViewBox(pg.ViewBox):
         self.line.sigDragged.connect(self.box.hide)
 
     def mouseClickEvent(self, ev):
-        if ev.button() == QtCore.Qt.LeftButton:
+        if ev.button() == QtCore.Qt.LeftButton and ev.double():
+            # zoom back out to the full spectrum
+            self.setXRange(0, self.chans, padding=0)
+
+            ev.accept()
+        elif ev.button() == QtCore.Qt.LeftButton:
             # move line to click location
             pos = self.hist.mapFromScene(ev.scenePos())
             self.line.setValue(pos)
@@ -218,6 +234,9 @@ class MCBViewBox(pg.ViewBox):
             self.line.setValue((corner1.x() + corner0.x())/2)
 
             ev.accept()
+        elif ev.button() == QtCore.Qt.MidButton:
+            # pan along channels
+            super().mouseDragEvent(ev)
         else:
             ev.ignore()
 
@@ -247,17 +266,18 @@ class MCBROI(pg.ROI):
         self.menu.addAction(self.mark)
         self.menu.addAction(self.clear)
 
+    # visible is set first so sigRegionChanged listeners see the new state
     def show(self, corner0, corner1):
+        self.visible = True
         self.setPos((min(corner0.x(), corner1.x()),\
             min(corner0.y(), corner1.y())))
         self.setSize((abs(corner1.x() - corner0.x()),\
             abs(corner1.y() - corner0.y())))
-        self.visible = True
 
     def hide(self):
+        self.visible = False
         self.setPos((0,-1))
         self.setSize((0,0))
-        self.visible = False
 
     # override parent function so left/mid click is ignored
     def hoverEvent(self, ev):
@@ -0,0 +1,136 @@
+from mcbroi import mask_rois
+import numpy as np
+
+class RateStats:
+    def __init__(self, chan_max, window=4, alpha=0.25):
+        # rolling statistics over the last window status snapshots; all
+        # buffers are allocated up front and reused every tick
+        self.window = window
+        self.alpha = alpha
+        self.dreals = np.zeros(window)
+        self.dlives = np.zeros(window)
+        self.dtotals = np.zeros(window)
+        self.csum = np.zeros(chan_max+1)
+        self.mask = np.zeros(chan_max, dtype=bool)
+        self.mask_diff = np.zeros(chan_max, dtype=bool)
+        self.set_rois(np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+        self.reset()
+
+    def set_rois(self, starts, ends):
+        # ROI's as [start, end) channel ranges; only reallocates when the
+        # ROI's change
+        self.starts = starts
+        self.ends = ends
+        self.droi_buf = np.zeros((self.window, len(starts)))
+        self.roi_totals = np.zeros(len(starts))
+        self.roi_lo = np.zeros(len(starts))
+        self.last_rois = np.zeros(len(starts))
+        self.roi_rates = np.zeros(len(starts))
+        self.roi_inst = np.zeros(len(starts))
+        self.roi_ema = np.zeros(len(starts))
+
+    def update_rois(self, roi_mask):
+        np.not_equal(roi_mask, self.mask, out=self.mask_diff)
+        if self.mask_diff.any():
+            self.mask[:] = roi_mask
+            self.set_rois(*mask_rois(self.mask))
+            return True
+        return False
+
+    def reset(self):
+        self.dreals.fill(0)
+        self.dlives.fill(0)
+        self.dtotals.fill(0)
+        self.droi_buf.fill(0)
+        self.pos = 0
+        self.last = None
+
+        # windowed values: dead time in %, output (counts per real second)
+        # and input (counts per live second) rates in cps, ROI rates per
+        # live second
+        self.dead = 0.
+        self.output_rate = 0.
+        self.input_rate = 0.
+        self.roi_rates.fill(0)
+
+        # exponentially smoothed values of the same
+        self.dead_ema = None
+        self.output_ema = 0.
+        self.input_ema = 0.
+        self.roi_ema.fill(0)
+
+    def ready(self):
+        return self.dreals.sum() > 0
+
+    def update(self, real, live, counts, roi_mask=None):
+        # feed one status snapshot (times in msec, the full spectrum)
+        changed = roi_mask is not None and self.update_rois(roi_mask)
+        total = float(counts.sum())
+        np.cumsum(counts, out=self.csum[1:])
+        np.take(self.csum, self.ends, out=self.roi_totals)
+        np.take(self.csum, self.starts, out=self.roi_lo)
+        self.roi_totals -= self.roi_lo
+        if changed:
+            self.last_rois[:] = self.roi_totals
+
+        last = self.last
+        self.last = (real, live, total)
+        if last is None or real < last[0] or total < last[2]:
+            # first snapshot or the MCB was cleared
+            self.last_rois[:] = self.roi_totals
+            return
+        dreal = real - last[0]
+        dlive = live - last[1]
+        if dreal <= 0:
+            return
+
+        # replace the oldest deltas in the rings
+        n = self.pos
+        self.pos = (n + 1) % self.window
+        self.dreals[n] = dreal
+        self.dlives[n] = dlive
+        self.dtotals[n] = total - last[2]
+        np.subtract(self.roi_totals, self.last_rois, out=self.droi_buf[n])
+        self.last_rois[:] = self.roi_totals
+
+        # windowed rates
+        sreal = self.dreals.sum() / 1000
+        slive = self.dlives.sum() / 1000
+        stotal = self.dtotals.sum()
+        self.dead = max(1 - slive/sreal, 0) * 100
+        self.output_rate = stotal / sreal
+        self.input_rate = stotal / slive if slive > 0 else 0.
+        np.sum(self.droi_buf, axis=0, out=self.roi_rates)
+        if slive > 0:
+            self.roi_rates /= slive
+        else:
+            self.roi_rates.fill(0)
+
+        # this tick's rates folded into the moving averages
+        dreal /= 1000
+        dlive /= 1000
+        dead = max(1 - dlive/dreal, 0) * 100
+        output_rate = (total - last[2]) / dreal
+        input_rate = (total - last[2]) / dlive if dlive > 0 else 0.
+        np.divide(self.droi_buf[n], max(dlive, 1e-3), out=self.roi_inst)
+        if self.dead_ema is None:
+            self.dead_ema = dead
+            self.output_ema = output_rate
+            self.input_ema = input_rate
+            self.roi_ema[:] = self.roi_inst
+        else:
+            a = self.alpha
+            self.dead_ema += a * (dead - self.dead_ema)
+            self.output_ema += a * (output_rate - self.output_ema)
+            self.input_ema += a * (input_rate - self.input_ema)
+            self.roi_inst -= self.roi_ema
+            self.roi_inst *= a
+            self.roi_ema += self.roi_inst
+
+    def snapshot(self):
+        # plain values for logging
+        return {'dead': self.dead, 'output_rate': self.output_rate,\
+            'input_rate': self.input_rate,\
+            'roi_rates': self.roi_rates.tolist(),\
+            'dead_ema': self.dead_ema or 0., 'output_ema': self.output_ema,\
+            'input_ema': self.input_ema, 'roi_ema': self.roi_ema.tolist()}
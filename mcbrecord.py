@@ -0,0 +1,249 @@
+from mcbdriver import MCBDriver, MCBError
+from mcbremote import methods, opcodes, pack, unpack, remote_error
+import numpy as np
+import struct
+import threading
+import time
+import zlib
+
+trace_magic = b'MCBTRACE'
+trace_version = 1
+trace_header = struct.Struct('<8sBd')
+
+# opcode, failed, seconds since recording start, call duration, payload size
+record_header = struct.Struct('<BBdfI')
+
+class MCBTraceMiss(MCBError):
+    # the replayed program made a call the recording never saw
+    pass
+
+class MCBRecorder:
+    error_codes = MCBDriver.error_codes
+    macro_codes = MCBDriver.macro_codes
+    macro_error_codes = MCBDriver.macro_error_codes
+    micro_codes = MCBDriver.micro_codes
+
+    def __init__(self, mcb_driver, path):
+        self.driver = mcb_driver
+        self.file = open(path, 'wb')
+        self.lock = threading.Lock()
+        self.t0 = time.perf_counter()
+        self.file.write(trace_header.pack(trace_magic, trace_version,\
+            time.time()))
+
+        # last get_data buffer per (hdet, start_chan, num_chans) for deltas
+        self.last_data = {}
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def record(self, name, *args):
+        # failures are stored like mcbremote sends them, as the MIO codes
+        # when there are any, so replay raises the same MCBError type
+        t = time.perf_counter()
+        error = None
+        try:
+            result = getattr(self.driver, name)(*args)
+            failed = False
+        except MCBError as err:
+            error = err
+            result = str(err) if err.error is None else (err.call,\
+                err.error, err.macro_err, err.micro_err)
+            failed = True
+        except Exception as err:
+            error = err
+            result = str(err)
+            failed = True
+        duration = time.perf_counter() - t
+
+        with self.lock:
+            if name == 'get_data' and not failed:
+                value = self.encode_data(args, result)
+            else:
+                value = result
+            parts = []
+            pack((tuple(args), value), parts)
+            payload = b''.join(parts)
+            self.file.write(record_header.pack(opcodes[name], failed,\
+                t - self.t0, duration, len(payload)) + payload)
+
+        if failed:
+            raise error
+        return result
+
+    def encode_data(self, args, result):
+        # store counts as a compressed delta from the previous read of the
+        # same channel window, which is mostly zeros during a run
+        counts, roi_mask = result
+        key = tuple(args)
+        counts = np.asarray(counts, dtype=np.int64)
+        last = self.last_data.get(key)
+        if last is None or last.shape != counts.shape:
+            delta = counts
+            is_delta = False
+        else:
+            delta = counts - last
+            is_delta = True
+        self.last_data[key] = counts.copy()
+        return (is_delta, counts.size,\
+            zlib.compress(delta.astype('<i8').tobytes(), 1),\
+            zlib.compress(np.packbits(roi_mask).tobytes(), 1))
+
+    def get_det_length(self, hdet):
+        return self.record('get_det_length', hdet)
+
+    def get_last_error(self):
+        return self.record('get_last_error')
+
+    def open_detector(self, ndet):
+        return self.record('open_detector', ndet)
+
+    def close_detector(self, hdet):
+        self.record('close_detector', hdet)
+
+    def comm(self, hdet, cmd):
+        return self.record('comm', hdet, cmd)
+
+    def get_config_max(self):
+        return self.record('get_config_max')
+
+    def get_config_name(self, ndet):
+        return self.record('get_config_name', ndet)
+
+    def get_data(self, hdet, start_chan=0, num_chans=1):
+        return self.record('get_data', hdet, start_chan, num_chans)
+
+    def get_start_time(self, hdet):
+        return self.record('get_start_time', hdet)
+
+    def is_active(self, hdet):
+        return self.record('is_active', hdet)
+
+def read_trace(path):
+    # return the recording start time and a list of
+    # (name, args, failed, t, duration, result) with get_data decoded
+    with open(path, 'rb') as file:
+        buf = file.read()
+    magic, version, start = trace_header.unpack_from(buf, 0)
+    assert magic == trace_magic, 'Not a PySTRO trace file'
+    assert version == trace_version, 'Unsupported trace version'
+
+    records = []
+    last_data = {}
+    pos = trace_header.size
+    while pos + record_header.size <= len(buf):
+        opcode, failed, t, duration, size = record_header.unpack_from(buf, pos)
+        pos += record_header.size
+        (args, result), end = unpack(buf, pos)
+        pos += size
+        name = methods[opcode]
+        if name == 'get_data' and not failed:
+            is_delta, num_chans, zdelta, zmask = result
+            counts = np.frombuffer(zlib.decompress(zdelta), dtype='<i8')
+            if is_delta:
+                counts = last_data[args] + counts
+            last_data[args] = counts
+            roi_mask = np.unpackbits(np.frombuffer(zlib.decompress(zmask),\
+                dtype=np.uint8), count=num_chans).astype(bool)
+            result = (counts.astype(np.int32), roi_mask)
+        records.append((name, args, bool(failed), t, duration, result))
+    return start, records
+
+class MCBReplayDriver:
+    error_codes = MCBDriver.error_codes
+    macro_codes = MCBDriver.macro_codes
+    macro_error_codes = MCBDriver.macro_error_codes
+    micro_codes = MCBDriver.micro_codes
+
+    def __init__(self, path, speed=1.0, latency=False):
+        # path may carry a speed suffix, e.g. 'run.trace@10'; speed 0 steps
+        # through recorded responses one call at a time, as fast as possible
+        if isinstance(path, str) and '@' in path:
+            path, speed = path.rsplit('@', 1)
+        self.speed = float(speed)
+        self.latency = latency
+        self.start, records = read_trace(path)
+
+        # recorded responses per distinct call, in recording order
+        self.calls = {}
+        for name, args, failed, t, duration, result in records:
+            self.calls.setdefault((name, args), []).append((t, duration,\
+                failed, result))
+        self.index = {key: 0 for key in self.calls}
+        self.lock = threading.Lock()
+        self.t0 = time.perf_counter()
+
+    def rewind(self):
+        with self.lock:
+            self.index = {key: 0 for key in self.calls}
+            self.t0 = time.perf_counter()
+
+    def clock(self):
+        # position in the recording, in recorded seconds
+        return (time.perf_counter() - self.t0) * self.speed
+
+    def replay(self, name, *args):
+        key = (name, args)
+        if key not in self.calls:
+            # setters that were never recorded just succeed like the MCB
+            if name == 'comm' and not args[1].startswith('SHOW'):
+                return ''
+            raise MCBTraceMiss('Call not in trace: {}{}'.format(name, args),\
+                call=name)
+
+        with self.lock:
+            responses = self.calls[key]
+            n = self.index[key]
+            if self.speed > 0:
+                # latest response recorded at or before the replay clock
+                now = self.clock()
+                while n + 1 < len(responses) and responses[n+1][0] <= now:
+                    n += 1
+            t, duration, failed, result = responses[n]
+            if self.speed <= 0:
+                n = min(n + 1, len(responses) - 1)
+            self.index[key] = n
+
+        if self.latency and self.speed > 0:
+            time.sleep(duration / self.speed)
+        if failed:
+            raise remote_error(result)
+        if name == 'get_data':
+            counts, roi_mask = result
+            return counts.copy(), roi_mask.copy()
+        return result
+
+    def get_det_length(self, hdet):
+        return self.replay('get_det_length', hdet)
+
+    def get_last_error(self):
+        return self.replay('get_last_error')
+
+    def open_detector(self, ndet):
+        return self.replay('open_detector', ndet)
+
+    def close_detector(self, hdet):
+        self.replay('close_detector', hdet)
+
+    def comm(self, hdet, cmd):
+        return self.replay('comm', hdet, cmd)
+
+    def get_config_max(self):
+        return self.replay('get_config_max')
+
+    def get_config_name(self, ndet):
+        return self.replay('get_config_name', ndet)
+
+    def get_data(self, hdet, start_chan=0, num_chans=1):
+        return self.replay('get_data', hdet, start_chan, num_chans)
+
+    def get_start_time(self, hdet):
+        return self.replay('get_start_time', hdet)
+
+    def is_active(self, hdet):
+        return self.replay('is_active', hdet)
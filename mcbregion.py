@@ -0,0 +1,95 @@
+import numpy as np
+
+class RegionIndex:
+    # channels on each side of a region averaged for its linear background
+    edge = 3
+
+    def __init__(self, counts):
+        # prefix sums of counts and of chan * counts, so any [lo, hi)
+        # channel interval integrates in O(1)
+        counts = np.asarray(counts, dtype=np.float64)
+        self.chan_max = len(counts)
+        self.csum = np.zeros(self.chan_max+1)
+        self.cmom = np.zeros(self.chan_max+1)
+        np.cumsum(counts, out=self.csum[1:])
+        np.cumsum(counts * np.arange(self.chan_max), out=self.cmom[1:])
+
+    def clip(self, lo, hi):
+        lo, hi = sorted((lo, hi))
+        return min(max(int(lo), 0), self.chan_max),\
+            min(max(int(np.ceil(hi)), 0), self.chan_max)
+
+    def gross(self, lo, hi):
+        lo, hi = self.clip(lo, hi)
+        return self.csum[hi] - self.csum[lo]
+
+    def background(self, lo, hi):
+        # straight line through the mean counts just outside the region, as
+        # (counts under the line, its variance)
+        lo, hi = self.clip(lo, hi)
+        left = max(lo - self.edge, 0)
+        right = min(hi + self.edge, self.chan_max)
+        nleft = lo - left
+        nright = right - hi
+        if nleft + nright == 0:
+            return 0., 0.
+        sides = []
+        if nleft:
+            sides.append((self.csum[lo] - self.csum[left], nleft))
+        if nright:
+            sides.append((self.csum[right] - self.csum[hi], nright))
+        width = hi - lo
+        mean = sum(total / n for total, n in sides) / len(sides)
+        var = sum(total / n**2 for total, n in sides) / len(sides)**2
+        return mean * width, var * width**2
+
+    def centroid(self, lo, hi):
+        lo, hi = self.clip(lo, hi)
+        total = self.csum[hi] - self.csum[lo]
+        if total <= 0:
+            return None
+        return float((self.cmom[hi] - self.cmom[lo]) / total)
+
+    def net_centroid(self, lo, hi):
+        # centroid above the flat mean of the background estimate, None
+        # without net counts
+        lo, hi = self.clip(lo, hi)
+        width = hi - lo
+        if width == 0:
+            return None
+        bg, bg_var = self.background(lo, hi)
+        level = bg / width
+        net = self.csum[hi] - self.csum[lo] - bg
+        if net <= 0:
+            return None
+        moment = self.cmom[hi] - self.cmom[lo] - level * (lo + hi - 1) *\
+            width / 2
+        return float(moment / net)
+
+    def region(self, lo, hi, factor=1, live=0):
+        # summary of the interval [lo, hi) in channels of a spectrum rebinned
+        # by factor (centroid in the same channels); rates need the live
+        # time in msec
+        lo, hi = self.clip(lo * factor, hi * factor)
+        gross = float(self.gross(lo, hi))
+        bg, bg_var = map(float, self.background(lo, hi))
+        centroid = self.centroid(lo, hi)
+        live = live / 1000
+        return {
+            'lo': lo / factor,
+            'hi': hi / factor,
+            'gross': gross,
+            'net': gross - bg,
+            'net_err': float(np.sqrt(gross + bg_var)),
+            'centroid': None if centroid is None else\
+                (centroid + 0.5) / factor - 0.5,
+            'rate': gross / live if live > 0 else None,
+            'net_rate': (gross - bg) / live if live > 0 else None
+        }
+
+    def energy_region(self, e0, e1, energies, live=0):
+        # same for an energy interval, through the per-channel calibration
+        # (increasing with channel)
+        e0, e1 = sorted((e0, e1))
+        return self.region(np.searchsorted(energies, e0),\
+            np.searchsorted(energies, e1), live=live)
@@ -0,0 +1,359 @@
+from mcbdriver import MCBDriver, MCBError, mcb_error
+import numpy as np
+import argparse
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+default_port = 7008
+
+# driver methods that may be forwarded, indexed by a one byte opcode
+methods = [
+    'get_det_length',
+    'get_last_error',
+    'open_detector',
+    'close_detector',
+    'comm',
+    'get_config_max',
+    'get_config_name',
+    'get_data',
+    'get_start_time',
+    'is_active'
+]
+opcodes = {name: n for n, name in enumerate(methods)}
+
+# every frame is (payload length, number of calls or results) + payload
+frame_header = struct.Struct('!IH')
+size_fmt = struct.Struct('!I')
+count_fmt = struct.Struct('!H')
+int_fmt = struct.Struct('!q')
+float_fmt = struct.Struct('!d')
+
+# largest payload accepted, so a corrupt header cannot make us allocate
+# gigabytes; far above a batch of full 64k channel spectra
+max_frame = 64*2**20
+
+def pack(value, out):
+    # append a tagged binary encoding of value to the list out
+    if value is None:
+        out.append(b'n')
+    elif isinstance(value, (bool, np.bool_)):
+        out.append(b'T' if value else b'F')
+    elif isinstance(value, (int, np.integer)):
+        out.append(b'q' + int_fmt.pack(int(value)))
+    elif isinstance(value, (float, np.floating)):
+        out.append(b'd' + float_fmt.pack(float(value)))
+    elif isinstance(value, str):
+        data = value.encode()
+        out.append(b's' + size_fmt.pack(len(data)) + data)
+    elif isinstance(value, bytes):
+        out.append(b'b' + size_fmt.pack(len(value)) + value)
+    elif isinstance(value, np.ndarray) and value.dtype == bool:
+        # ROI masks go over the wire as bits
+        out.append(b'm' + size_fmt.pack(value.size) +\
+            np.packbits(value).tobytes())
+    elif isinstance(value, np.ndarray):
+        dtype = value.dtype.newbyteorder('<')
+        data = np.ascontiguousarray(value, dtype=dtype).tobytes()
+        out.append(b'a' + bytes([len(dtype.str)]) + dtype.str.encode() +\
+            size_fmt.pack(value.size) + data)
+    elif isinstance(value, (tuple, list)):
+        out.append(b't' + count_fmt.pack(len(value)))
+        for item in value:
+            pack(item, out)
+    else:
+        raise TypeError('Cannot send {}'.format(type(value).__name__))
+
+def unpack(buf, pos=0):
+    # decode one value from buf starting at pos, return (value, new pos)
+    tag = buf[pos:pos+1]
+    pos += 1
+    if tag == b'n':
+        return None, pos
+    if tag == b'T':
+        return True, pos
+    if tag == b'F':
+        return False, pos
+    if tag == b'q':
+        return int_fmt.unpack_from(buf, pos)[0], pos + int_fmt.size
+    if tag == b'd':
+        return float_fmt.unpack_from(buf, pos)[0], pos + float_fmt.size
+    if tag == b's':
+        size = size_fmt.unpack_from(buf, pos)[0]
+        pos += size_fmt.size
+        return bytes(buf[pos:pos+size]).decode(), pos + size
+    if tag == b'b':
+        size = size_fmt.unpack_from(buf, pos)[0]
+        pos += size_fmt.size
+        return bytes(buf[pos:pos+size]), pos + size
+    if tag == b'm':
+        size = size_fmt.unpack_from(buf, pos)[0]
+        pos += size_fmt.size
+        nbytes = (size + 7) // 8
+        bits = np.frombuffer(buf, dtype=np.uint8, count=nbytes, offset=pos)
+        return np.unpackbits(bits, count=size).astype(bool), pos + nbytes
+    if tag == b'a':
+        dtype = np.dtype(bytes(buf[pos+1:pos+1+buf[pos]]).decode())
+        pos += 1 + buf[pos]
+        size = size_fmt.unpack_from(buf, pos)[0]
+        pos += size_fmt.size
+        array = np.frombuffer(buf, dtype=dtype, count=size, offset=pos)
+        return array.astype(dtype.newbyteorder('=')), pos + size*dtype.itemsize
+    if tag == b't':
+        count = count_fmt.unpack_from(buf, pos)[0]
+        pos += count_fmt.size
+        items = []
+        for i in range(count):
+            item, pos = unpack(buf, pos)
+            items.append(item)
+        return tuple(items), pos
+    raise ValueError('Bad value tag {}'.format(tag))
+
+def recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n = sock.recv_into(view[pos:])
+        if n == 0:
+            raise EOFError('Connection closed')
+        pos += n
+    return buf
+
+def send_frame(sock, parts, count):
+    payload = b''.join(parts)
+    sock.sendall(frame_header.pack(len(payload), count) + payload)
+
+def recv_frame(sock):
+    size, count = frame_header.unpack(recv_exact(sock, frame_header.size))
+    if size > max_frame:
+        raise ValueError('Frame of {} bytes is too large'.format(size))
+    return recv_exact(sock, size), count
+
+class MCBConnectionError(MCBError):
+    # the server could not be reached, or the connection failed or sent
+    # garbage during a call; the call may succeed on a new connection
+    retryable = True
+
+def remote_error(error):
+    # a failure sent back by the server: MIO codes or a message
+    if isinstance(error, tuple):
+        call, code, macro_err, micro_err = error
+        if code is not None:
+            return mcb_error(call, code, macro_err, micro_err)
+        error = '{} failed'.format(call)
+    return MCBError(error)
+
+class MCBRemoteDriver:
+    error_codes = MCBDriver.error_codes
+    macro_codes = MCBDriver.macro_codes
+    macro_error_codes = MCBDriver.macro_error_codes
+    micro_codes = MCBDriver.micro_codes
+
+    def __init__(self, address='localhost', pool_size=4, timeout=10.0):
+        host, sep, port = address.partition(':')
+        self.address = (host, int(port) if sep else default_port)
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        # idle connections are reused, at most pool_size are ever opened;
+        # None in the pool is a slot freed by a broken connection
+        self.pool = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.nconn = 0
+
+    def __del__(self):
+        while not self.pool.empty():
+            sock = self.pool.get_nowait()
+            if sock is not None:
+                sock.close()
+
+    def connect(self):
+        sock = socket.create_connection(self.address, self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def acquire(self):
+        # an idle connection, a new one while fewer than pool_size are
+        # open, else the first one released within the timeout
+        try:
+            sock = self.pool.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                grow = self.nconn < self.pool_size
+                if grow:
+                    self.nconn += 1
+            try:
+                sock = None if grow else self.pool.get(timeout=self.timeout)
+            except queue.Empty:
+                raise socket.timeout('No free connection within {} s'\
+                    .format(self.timeout)) from None
+        if sock is None:
+            try:
+                return self.connect()
+            except OSError:
+                # hand the slot on, a waiter may have better luck
+                self.pool.put(None)
+                raise
+        return sock
+
+    def discard(self, sock):
+        # the slot goes back to the pool, waking a caller blocked in
+        # acquire, who opens a replacement
+        sock.close()
+        self.pool.put(None)
+
+    def batch(self, calls):
+        # send a list of (method name, args) in one round trip; transport
+        # failures are raised as MCBConnectionError, so callers only ever
+        # see MCBErrors like with the other backends
+        parts = []
+        for name, args in calls:
+            if name not in opcodes:
+                raise MCBError('Unknown call {}'.format(name), call=name)
+            parts.append(bytes([opcodes[name]]))
+            pack(tuple(args), parts)
+        call = calls[0][0] if len(calls) == 1 else 'batch'
+
+        try:
+            sock = self.acquire()
+        except OSError as err:
+            raise MCBConnectionError('Connecting to {0}:{1} failed: {2}'\
+                .format(*self.address, err), call=call) from err
+        try:
+            send_frame(sock, parts, len(calls))
+            buf, count = recv_frame(sock)
+        except (OSError, EOFError, ValueError) as err:
+            self.discard(sock)
+            raise MCBConnectionError('{0} to {1}:{2} failed: {3}'.format(\
+                call, *self.address, err), call=call) from err
+        self.pool.put(sock)
+
+        # decode results, re-raising the first remote failure
+        results = []
+        error = None
+        pos = 0
+        try:
+            for i in range(count):
+                failed = buf[pos]
+                value, pos = unpack(buf, pos + 1)
+                if failed and error is None:
+                    error = value
+                results.append(value)
+        except (IndexError, ValueError, struct.error) as err:
+            raise MCBConnectionError('Bad reply from {0}:{1}: {2}'.format(\
+                *self.address, err), call=call) from err
+        if error is not None:
+            raise remote_error(error)
+        return results
+
+    def call(self, name, *args):
+        return self.batch([(name, args)])[0]
+
+    def get_det_length(self, hdet):
+        return self.call('get_det_length', hdet)
+
+    def get_last_error(self):
+        return self.call('get_last_error')
+
+    def open_detector(self, ndet):
+        return self.call('open_detector', ndet)
+
+    def close_detector(self, hdet):
+        self.call('close_detector', hdet)
+
+    def comm(self, hdet, cmd):
+        return self.call('comm', hdet, cmd)
+
+    def get_config_max(self):
+        return self.call('get_config_max')
+
+    def get_config_name(self, ndet):
+        return self.call('get_config_name', ndet)
+
+    def get_data(self, hdet, start_chan=0, num_chans=1):
+        return self.call('get_data', hdet, start_chan, num_chans)
+
+    def get_start_time(self, hdet):
+        return self.call('get_start_time', hdet)
+
+    def is_active(self, hdet):
+        return self.call('is_active', hdet)
+
+class MCBRequestHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        while True:
+            try:
+                buf, count = recv_frame(self.request)
+            except (OSError, EOFError, ValueError):
+                return
+
+            parts = []
+            pos = 0
+            for i in range(count):
+                # a payload that does not decode leaves no way to find the
+                # next call, so the connection is dropped
+                try:
+                    opcode = buf[pos]
+                    args, pos = unpack(buf, pos + 1)
+                except (IndexError, ValueError, struct.error) as err:
+                    log.warning('Dropping %s: bad request (%s)',\
+                        self.client_address, err)
+                    return
+                if opcode >= len(methods) or not isinstance(args, tuple):
+                    parts.append(b'\x01')
+                    pack('Unknown request {}'.format(opcode), parts)
+                    continue
+                name = methods[opcode]
+                try:
+                    with self.server.lock:
+                        value = getattr(self.server.driver, name)(*args)
+                    parts.append(b'\x00')
+                    pack(value, parts)
+                except MCBError as err:
+                    # sent as codes so the client raises the same type
+                    parts.append(b'\x01')
+                    pack((err.call, err.error, err.macro_err,\
+                        err.micro_err), parts)
+                except Exception as err:
+                    parts.append(b'\x01')
+                    pack(str(err) or type(err).__name__, parts)
+            send_frame(self.request, parts, count)
+
+class MCBDriverServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mcb_driver, address=('127.0.0.1', default_port)):
+        # anyone who can connect can start, clear and set the MCBs, so
+        # only local clients by default; other interfaces must be named
+        super().__init__(address, MCBRequestHandler)
+        self.driver = mcb_driver
+
+        # the vendor library is not known to be thread safe
+        self.lock = threading.Lock()
+
+if __name__ == '__main__':
+    from mcbbackend import get_driver
+
+    parser = argparse.ArgumentParser(\
+        description='Serve locally attached MCBs to remote PySTRO clients')
+    parser.add_argument('--host', default='127.0.0.1',\
+        help='interface to listen on; 0.0.0.0 serves other machines, '\
+        'without authentication')
+    parser.add_argument('--port', type=int, default=default_port)
+    parser.add_argument('--backend', default='dll')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,\
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    server = MCBDriverServer(get_driver(args.backend), (args.host, args.port))
+    server.serve_forever()
@@ -0,0 +1,127 @@
+import numpy as np
+
+def mask_rois(roi_mask):
+    # [start, end) channel ranges of the runs set in an ROI mask
+    edges = np.diff(np.concatenate(([0], roi_mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def coalesce_windows(starts, ends, gap=64):
+    # merge ranges less than gap channels apart into (start, num) windows,
+    # trading a few extra channels for fewer MIOGetData calls
+    windows = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if windows and start - windows[-1][1] <= gap:
+            windows[-1][1] = max(end, windows[-1][1])
+        else:
+            windows.append([start, end])
+    return [(start, end-start) for start, end in windows]
+
+def merge_runs(runs):
+    # sort [start, end) runs and merge those that overlap or touch
+    runs = runs[runs[:, 1] > runs[:, 0]]
+    if len(runs) == 0:
+        return runs
+    runs = runs[np.argsort(runs[:, 0], kind='stable')]
+    ends = np.maximum.accumulate(runs[:, 1])
+    first = np.ones(len(runs), dtype=bool)
+    first[1:] = runs[1:, 0] > ends[:-1]
+    last = np.append(np.flatnonzero(first)[1:] - 1, len(runs) - 1)
+    return np.stack([runs[first, 0], ends[last]], axis=1)
+
+def covered(runs, chans):
+    # whether each channel lies inside one of the sorted, disjoint runs
+    if len(runs) == 0:
+        return np.zeros(len(chans), dtype=bool)
+    i = np.searchsorted(runs[:, 0], chans, 'right') - 1
+    return (i >= 0) & (chans < runs[np.maximum(i, 0), 1])
+
+class ROISet:
+    def __init__(self, runs=()):
+        # ROI's as sorted, disjoint, non-touching [start, end) channel runs
+        # in an (n, 2) array
+        runs = np.asarray(runs, dtype=np.int64).reshape(-1, 2)
+        self.runs = merge_runs(runs)
+
+    @classmethod
+    def from_rois(cls, rois):
+        # from (start, num) pairs as used by the MCB and .Spe files
+        rois = np.asarray(rois, dtype=np.int64).reshape(-1, 2)
+        return cls(np.stack([rois[:, 0], rois[:, 0] + rois[:, 1]], axis=1))
+
+    @classmethod
+    def from_mask(cls, roi_mask):
+        return cls(np.stack(mask_rois(roi_mask), axis=1))
+
+    @classmethod
+    def load(cls, path):
+        # text file of 'first last' channel lines (inclusive, like the .Spe
+        # $ROI section); blank lines and '#' comments are skipped
+        runs = np.loadtxt(path, dtype=np.int64, comments='#', ndmin=2)
+        runs = runs.reshape(-1, 2)
+        runs[:, 1] += 1
+        return cls(runs)
+
+    def save(self, path):
+        np.savetxt(path, self.runs - [0, 1], fmt='%d',\
+            header='first last')
+
+    def rois(self):
+        return [(start, end-start) for start, end in self.runs.tolist()]
+
+    def mask(self, chan_max):
+        edges = np.zeros(chan_max+1, dtype=np.int8)
+        np.add.at(edges, np.minimum(self.runs[:, 0], chan_max), 1)
+        np.add.at(edges, np.minimum(self.runs[:, 1], chan_max), -1)
+        return np.cumsum(edges[:-1]) > 0
+
+    def __len__(self):
+        return len(self.runs)
+
+    def __iter__(self):
+        return iter(self.rois())
+
+    def __eq__(self, other):
+        return np.array_equal(self.runs, other.runs)
+
+    def __contains__(self, chan):
+        return bool(covered(self.runs, np.array([chan]))[0])
+
+    def channels(self):
+        return int(np.sum(self.runs[:, 1] - self.runs[:, 0]))
+
+    def combine(self, other, op):
+        # split the channel axis at every run edge and keep the pieces where
+        # op(in self, in other) holds
+        edges = np.unique(np.concatenate([self.runs.ravel(),\
+            other.runs.ravel()]))
+        if len(edges) < 2:
+            return ROISet()
+        keep = op(covered(self.runs, edges[:-1]),\
+            covered(other.runs, edges[:-1]))
+        return ROISet(np.stack([edges[:-1][keep], edges[1:][keep]], axis=1))
+
+    def union(self, other):
+        return self.combine(other, np.logical_or)
+
+    def intersection(self, other):
+        return self.combine(other, np.logical_and)
+
+    def subtract(self, other):
+        return self.combine(other, lambda a, b: a & ~b)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = subtract
+
+    def commands(self, target):
+        # minimal MCB commands turning this (current) set into target: clear
+        # only what target lacks, mark only what it adds
+        cmds = []
+        for start_chan, num_chans in self.subtract(target):
+            cmds.append('SET_WINDOW {}, {}'.format(start_chan, num_chans))
+            cmds.append('CLEAR_ROI')
+        if cmds:
+            cmds.append('SET_WINDOW')
+        for start_chan, num_chans in target.subtract(self):
+            cmds.append('SET_ROI {}, {}'.format(start_chan, num_chans))
+        return cmds
@@ -0,0 +1,251 @@
+from mcbbackend import get_driver
+from mcbdetector import MCBDetector
+from mcbdriver import MCBError
+from mcbspectrum import format_spe
+from datetime import datetime
+import argparse
+import json
+import os
+import threading
+import time
+
+default_pattern = '{id:04d}_{job:03d}_{run:03d}_{start:%Y%m%d_%H%M%S}.Spe'
+
+class MCBJob:
+    def __init__(self, ndet, real_preset=0, live_preset=0, runs=1,\
+            sample='', calib=(0, 0, 0), units='keV', clear=True, id=None):
+        # presets are in msec like MCBWidget; id names the job in the
+        # journal, by default it is named by its settings
+        assert real_preset > 0 or live_preset > 0,\
+            'Job needs a real or live time preset'
+        self.id = id
+        self.ndet = ndet
+        self.real_preset = real_preset
+        self.live_preset = live_preset
+        self.runs = runs
+        self.sample = sample
+        self.calib = tuple(calib)
+        self.units = units
+        self.clear = clear
+
+    def settings(self):
+        return json.dumps([self.ndet, self.real_preset, self.live_preset,\
+            self.sample, self.calib, self.units, self.clear])
+
+class MCBSequencer:
+    # bounds on the time between is_active checks of a running detector
+    min_poll = 0.25
+    max_poll = 10.0
+
+    def __init__(self, mcb_driver, jobs, out_dir='.', journal=None,\
+            pattern=default_pattern, verbose=False):
+        self.driver = mcb_driver
+        self.jobs = list(jobs)
+        self.keys = self.job_keys()
+        self.out_dir = out_dir
+        self.pattern = pattern
+        self.verbose = verbose
+        self.journal_path = journal or os.path.join(out_dir,\
+            'sequence.journal')
+        self.done = self.load_journal()
+        self.detectors = {}
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def job_keys(self):
+        # journal key of every job, stable when jobs are added or reordered
+        # in the job file between runs; identical jobs without an id are
+        # told apart by their order among themselves
+        keys = []
+        seen = {}
+        for job in self.jobs:
+            if job.id is not None:
+                keys.append('id:{}'.format(job.id))
+            else:
+                settings = job.settings()
+                seen[settings] = seen.get(settings, 0) + 1
+                keys.append('{0}#{1}'.format(settings, seen[settings]))
+        return keys
+
+    def load_journal(self):
+        # (job key, run) pairs already saved by an earlier, possibly
+        # crashed, run
+        done = set()
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # torn last line from a crash mid-write
+                        continue
+                    if entry['event'] == 'saved':
+                        done.add((entry['job'], entry['run']))
+        return done
+
+    def log(self, **entry):
+        entry['time'] = datetime.now().isoformat()
+        self.journal.write(json.dumps(entry) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        if self.verbose:
+            print(json.dumps(entry))
+
+    def pending(self):
+        # queue of (job, run) still to do for each detector
+        queues = {}
+        for n, job in enumerate(self.jobs):
+            for run in range(job.runs):
+                if (self.keys[n], run) not in self.done:
+                    queues.setdefault(job.ndet, []).append((n, run))
+        return queues
+
+    def detector(self, ndet):
+        if ndet not in self.detectors:
+            self.detectors[ndet] = MCBDetector(self.driver, ndet)
+        return self.detectors[ndet]
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        # one scheduler loop drives every detector's queue concurrently; a
+        # run that fails is journaled and skipped, the other detectors and
+        # the next runs on the same detector carry on
+        queues = self.pending()
+        running = {}
+        self.journal = open(self.journal_path, 'a')
+        try:
+            while (queues or running) and not self.stop_event.is_set():
+                # start the next run on every idle detector
+                for ndet in list(queues):
+                    if ndet not in running:
+                        n, run = queues[ndet].pop(0)
+                        if not queues[ndet]:
+                            del queues[ndet]
+                        try:
+                            running[ndet] = (n, run, self.begin(ndet, n, run))
+                        except MCBError as err:
+                            self.failed(ndet, n, run, err)
+
+                # check only the detectors that could have finished by now
+                now = time.monotonic()
+                finished = False
+                for ndet, (n, run, check) in list(running.items()):
+                    if check > now:
+                        continue
+                    try:
+                        det = self.detector(ndet)
+                        if det.is_active():
+                            running[ndet] = (n, run,\
+                                now + self.remaining(det, self.jobs[n]))
+                            continue
+                        self.finish(det, n, run)
+                    except (MCBError, OSError) as err:
+                        self.failed(ndet, n, run, err)
+                    del running[ndet]
+                    finished = True
+
+                # sleep until the next detector is due
+                if running and not finished:
+                    wait = min(check for n, run, check in running.values())
+                    self.stop_event.wait(max(wait - time.monotonic(), 0))
+        finally:
+            # leave no MCB counting or held open after a stop or a crash
+            for ndet, (n, run, check) in running.items():
+                self.halt(ndet)
+                self.log(event='interrupted', job=self.keys[n], run=run,\
+                    ndet=ndet)
+            self.close()
+            self.journal.close()
+
+    def failed(self, ndet, n, run, err):
+        self.halt(ndet)
+        self.log(event='failed', job=self.keys[n], run=run, ndet=ndet,\
+            error=str(err))
+
+    def halt(self, ndet):
+        # stop a detector if it can still be reached
+        det = self.detectors.get(ndet)
+        if det is not None:
+            try:
+                det.stop()
+            except MCBError:
+                pass
+
+    def close(self):
+        for det in self.detectors.values():
+            try:
+                self.driver.close_detector(det.hdet)
+            except MCBError:
+                pass
+        self.detectors = {}
+
+    def begin(self, ndet, n, run):
+        det = self.detector(ndet)
+        job = self.jobs[n]
+        if det.is_active():
+            det.stop()
+        if job.clear:
+            det.clear()
+        det.set_real_preset(job.real_preset)
+        det.set_live_preset(job.live_preset)
+        det.start()
+        self.log(event='started', job=self.keys[n], run=run, ndet=ndet)
+        return time.monotonic() + self.remaining(det, job)
+
+    def remaining(self, det, job):
+        # earliest time a preset can be reached (live never outruns real)
+        remaining = []
+        if job.real_preset > 0:
+            remaining.append(job.real_preset - det.get_real())
+        if job.live_preset > 0:
+            remaining.append(job.live_preset - det.get_live())
+        return min(max(min(remaining) / 1000, self.min_poll), self.max_poll)
+
+    def finish(self, det, n, run):
+        job = self.jobs[n]
+        spec = det.spectrum(sample=job.sample, calib=job.calib,\
+            units=job.units)
+        path = os.path.join(self.out_dir, self.pattern.format(id=det.id,\
+            name=det.name, ndet=job.ndet, job=n, run=run, sample=job.sample,\
+            start=spec.start))
+
+        # write to a temporary file and rename so a crash never leaves a
+        # partial spectrum behind
+        with open(path + '.tmp', 'w') as file:
+            file.write(format_spe(spec))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+
+        self.done.add((self.keys[n], run))
+        self.log(event='saved', job=self.keys[n], run=run, ndet=job.ndet,\
+            file=path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(\
+        description='Run a queue of preset acquisitions on all MCBs')
+    parser.add_argument('jobs', help='JSON list of jobs, e.g. [{"ndet": 1, '\
+        '"real_preset": 60000, "runs": 10}]')
+    parser.add_argument('--out', default='.')
+    parser.add_argument('--journal', default=None)
+    parser.add_argument('--pattern', default=default_pattern)
+    parser.add_argument('--backend', default=None)
+    args = parser.parse_args()
+
+    with open(args.jobs, 'r') as file:
+        jobs = [MCBJob(**job) for job in json.load(file)]
+    sequencer = MCBSequencer(get_driver(args.backend), jobs, args.out,\
+        args.journal, args.pattern, verbose=True)
+    sequencer.run()
@@ -0,0 +1,126 @@
+from PyQt5 import QtCore
+import json
+
+def decode(value):
+    # values are stored as JSON text so they come back typed on every
+    # platform; anything else is a plain string from before
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+def encode(value):
+    return json.dumps(value, default=lambda value: value.tolist())
+
+class SettingsStore:
+    # delay after the last change before changes are written, in msec
+    flush_delay = 1000
+
+    def __init__(self, organization='pystro', application='pystro'):
+        # every setting is held in memory as {group: {key: value}}, where a
+        # group is a detector title and '' is the station itself
+        self.organization = organization
+        self.qsettings = QtCore.QSettings(organization, application)
+        self.groups = {}
+        self.dirty = set()
+
+        # write changes in one batch once they stop coming
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.flush_delay)
+        self.timer.timeout.connect(self.flush)
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.flush)
+
+        self.load()
+
+    def load(self):
+        # read all groups in one pass
+        self.groups = {}
+        for path in self.qsettings.allKeys():
+            group, sep, key = path.rpartition('/')
+            self.groups.setdefault(group, {})[key] = \
+                decode(self.qsettings.value(path))
+
+    def group(self, name):
+        if name not in self.groups:
+            self.groups[name] = {}
+            self.migrate(name)
+        return SettingsGroup(self, name)
+
+    def migrate(self, name):
+        # pick up settings a detector kept in its own file before the store
+        legacy = QtCore.QSettings(self.organization, name)
+        for key in legacy.allKeys():
+            self.set(name, key, decode(legacy.value(key)))
+
+    def get(self, group, key, default=None):
+        return self.groups.get(group, {}).get(key, default)
+
+    def set(self, group, key, value):
+        values = self.groups.setdefault(group, {})
+        if key in values and values[key] == value:
+            return
+        values[key] = value
+        self.dirty.add((group, key))
+        self.timer.start()
+
+    def remove(self, group, key):
+        values = self.groups.get(group, {})
+        if key in values:
+            del values[key]
+            self.dirty.add((group, key))
+            self.timer.start()
+
+    def flush(self):
+        self.timer.stop()
+        if not self.dirty:
+            return
+        for group, key in self.dirty:
+            path = group + '/' + key if group else key
+            values = self.groups.get(group, {})
+            if key in values:
+                self.qsettings.setValue(path, encode(values[key]))
+            else:
+                self.qsettings.remove(path)
+        self.dirty.clear()
+        self.qsettings.sync()
+
+    def export_profile(self, path):
+        # the whole station configuration as one JSON file
+        with open(path, 'w') as file:
+            json.dump(self.groups, file, indent=2, sort_keys=True,\
+                default=lambda value: value.tolist())
+
+    def import_profile(self, path):
+        with open(path, 'r') as file:
+            groups = json.load(file)
+        for group, values in groups.items():
+            for key in list(self.groups.get(group, {})):
+                if key not in values:
+                    self.remove(group, key)
+            for key, value in values.items():
+                self.set(group, key, value)
+        self.flush()
+        return list(groups)
+
+class SettingsGroup:
+    # QSettings-like view of one group of a SettingsStore
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def contains(self, key):
+        return key in self.store.groups.get(self.name, {})
+
+    def value(self, key, default=None):
+        return self.store.get(self.name, key, default)
+
+    def setValue(self, key, value):
+        self.store.set(self.name, key, value)
+
+    def remove(self, key):
+        self.store.remove(self.name, key)
@@ -0,0 +1,253 @@
+import numpy as np
+from datetime import datetime
+import struct
+
+class Spectrum:
+    def __init__(self, counts, live=0, real=0, variances=None, sample='',\
+            det_id=0, det_name='', start=None, rois=(), lpre=0, rpre=0,\
+            calib=(0, 0, 0), units='keV'):
+        # times are in msec like MCBWidget; calib is (a, b, c) of
+        # energy = a*chan**2 + b*chan + c
+        self.counts = np.asarray(counts)
+        if variances is None:
+            variances = np.maximum(self.counts, 0)
+        self.variances = np.asarray(variances, dtype=np.float64)
+        self.live = live
+        self.real = real
+        self.sample = sample
+        self.det_id = det_id
+        self.det_name = det_name
+        self.start = datetime.now() if start is None else start
+        self.rois = list(rois)
+        self.lpre = lpre
+        self.rpre = rpre
+        self.calib = tuple(calib)
+        self.units = units
+
+    def copy(self, counts=None, variances=None, **kwargs):
+        attrs = dict(live=self.live, real=self.real, sample=self.sample,\
+            det_id=self.det_id, det_name=self.det_name, start=self.start,\
+            rois=self.rois, lpre=self.lpre, rpre=self.rpre, calib=self.calib,\
+            units=self.units)
+        attrs.update(kwargs)
+        return Spectrum(self.counts if counts is None else counts,\
+            variances=self.variances if variances is None else variances,\
+            **attrs)
+
+    def errors(self):
+        return np.sqrt(self.variances)
+
+def read_spe(path):
+    with open(path, 'r') as file:
+        lines = file.read().splitlines()
+
+    # index the $SECTION: headers
+    sections = {}
+    for i, line in enumerate(lines):
+        if line.startswith('$'):
+            sections[line.rstrip(':')] = i + 1
+
+    spec = {}
+    if '$SPEC_ID' in sections:
+        sample = lines[sections['$SPEC_ID']]
+        if sample != 'No sample description was entered.':
+            spec['sample'] = sample
+    if '$SPEC_REM' in sections:
+        i = sections['$SPEC_REM']
+        while i < len(lines) and not lines[i].startswith('$'):
+            if lines[i].startswith('DET# '):
+                spec['det_id'] = int(lines[i][5:])
+            elif lines[i].startswith('DETDESC# '):
+                spec['det_name'] = lines[i][9:]
+            i += 1
+    if '$DATE_MEA' in sections:
+        spec['start'] = datetime.strptime(lines[sections['$DATE_MEA']],\
+            '%m/%d/%Y %H:%M:%S')
+    if '$MEAS_TIM' in sections:
+        live, real = map(float, lines[sections['$MEAS_TIM']].split())
+        spec['live'] = int(live * 1000)
+        spec['real'] = int(real * 1000)
+
+    # parse all counts in one numpy conversion
+    i = sections['$DATA']
+    first_chan, last_chan = map(int, lines[i].split())
+    counts = np.array(lines[i+1:i+2+last_chan-first_chan], dtype=np.int64)
+
+    if '$ROI' in sections:
+        i = sections['$ROI']
+        nrois = int(lines[i])
+        rois = []
+        for line in lines[i+1:i+1+nrois]:
+            first, last = map(int, line.split())
+            rois.append((first, last-first+1))
+        spec['rois'] = rois
+    if '$PRESETS' in sections:
+        i = sections['$PRESETS']
+        pre_type = lines[i]
+        if pre_type == 'Live Time':
+            spec['lpre'] = int(lines[i+1]) * 1000
+            spec['rpre'] = int(lines[i+2]) * 1000
+        elif pre_type == 'Real Time':
+            spec['rpre'] = int(lines[i+1]) * 1000
+            spec['lpre'] = int(lines[i+2]) * 1000
+    if '$MCA_CAL' in sections:
+        c, b, a, units = lines[sections['$MCA_CAL']+1].split(' ')
+        spec['calib'] = (float(a), float(b), float(c))
+        spec['units'] = units
+
+    return Spectrum(counts, **spec)
+
+def format_spe(spec):
+    # same layout MAESTRO writes
+    a, b, c = spec.calib
+    parts = ['$SPEC_ID:\n',\
+        (spec.sample or 'No sample description was entered.') + '\n',\
+        '$SPEC_REM:\n',\
+        'DET# {}\n'.format(spec.det_id),\
+        'DETDESC# {}\n'.format(spec.det_name),\
+        'AP# Pystro\n',\
+        '$DATE_MEA:\n',\
+        spec.start.strftime('%m/%d/%Y %H:%M:%S') + '\n',\
+        '$MEAS_TIM:\n',\
+        '{} {}\n'.format(int(spec.live / 1000), int(spec.real / 1000)),\
+        '$DATA:\n',\
+        '0 {}\n'.format(len(spec.counts)-1)]
+
+    # write data
+    counts = np.rint(spec.counts).astype(np.int64)
+    parts.append(''.join(['{:>8}\n'.format(n) for n in counts.tolist()]))
+
+    # write ROI's
+    parts.append('$ROI:\n{} \n'.format(len(spec.rois)))
+    for start_chan, num_chans in spec.rois:
+        parts.append('{} {}\n'.format(start_chan, start_chan+num_chans-1))
+
+    # write presets
+    parts.append('$PRESETS:\n')
+    if spec.lpre == 0 and spec.rpre == 0:
+        parts.append('None\n0\n0\n')
+    elif spec.rpre == 0 or spec.lpre > spec.rpre:
+        parts.append('Live Time\n{}\n{}\n'.format(int(spec.lpre / 1000),\
+            int(spec.rpre / 1000)))
+    else:
+        parts.append('Real Time\n{}\n{}\n'.format(int(spec.rpre / 1000),\
+            int(spec.lpre / 1000)))
+
+    # write calibration
+    parts.append('$ENER_FIT:\n' +\
+        '{0:.6f} {1:.6f}\n'.format(c, b) +\
+        '$MCA_CAL:\n' +\
+        '3\n' +\
+        '{0:.6E} {1:.6E} {2:.6E} {3}\n'.format(c, b, a, spec.units))
+
+    # TODO: currently unsupported
+    parts.append('$SHAPE_CAL:\n' +\
+        '3\n' +\
+        '0.000000E+000 0.000000E+000 0.000000E+000\n')
+    return ''.join(parts)
+
+def write_spe(spec, path):
+    with open(path, 'w') as file:
+        file.write(format_spe(spec))
+
+# Ortec .Chn binary: 32 byte header, int32 counts, 512 byte trailer
+chn_header = struct.Struct('<hhh2sii8s4shh')
+chn_trailer = struct.Struct('<hh3f3f228sB63sB63s128s')
+
+def write_chn(spec, path):
+    a, b, c = spec.calib
+    start = spec.start
+    date = start.strftime('%d%b%y').upper() + ('1' if start.year >= 2000\
+        else '0')
+    counts = np.rint(spec.counts).astype('<i4')
+    det_name = spec.det_name.encode()[:63]
+    sample = spec.sample.encode()[:63]
+    with open(path, 'wb') as file:
+        file.write(chn_header.pack(-1, spec.det_id, 1,\
+            start.strftime('%S').encode(), int(spec.real / 20),\
+            int(spec.live / 20), date.encode(),\
+            start.strftime('%H%M').encode(), 0, len(counts)))
+        file.write(counts.tobytes())
+        file.write(chn_trailer.pack(-102, 0, c, b, a, 0, 0, 0, b'',\
+            len(det_name), det_name, len(sample), sample, b''))
+
+# arithmetic on single spectra, propagating Poisson variances
+
+def scale(spec, factor):
+    return spec.copy(counts=spec.counts * factor,\
+        variances=spec.variances * factor**2)
+
+def normalize(spec, live):
+    # scale counts to what would have been collected in live msec
+    if spec.live <= 0:
+        raise ValueError('Spectrum has no live time to normalize')
+    return scale(spec, live / spec.live).copy(live=live,\
+        real=spec.real * live / spec.live)
+
+def add(spec, other):
+    return spec.copy(counts=spec.counts + other.counts,\
+        variances=spec.variances + other.variances,\
+        live=spec.live + other.live, real=spec.real + other.real)
+
+def subtract(spec, background, normalized=True):
+    # subtract background, scaled to the same live time by default
+    if normalized:
+        if background.live <= 0:
+            raise ValueError('Background has no live time')
+        background = normalize(background, spec.live)
+    return spec.copy(counts=spec.counts - background.counts,\
+        variances=spec.variances + background.variances)
+
+# stacks of many spectra as 2D (spectra x channels) arrays, which may be
+# np.memmap's; work is done a chunk of rows at a time to bound memory
+
+def build_stack(paths, out_path=None, read=read_spe):
+    # read many files into one stack, memory-mapped to out_path if given
+    first = read(paths[0])
+    shape = (len(paths), len(first.counts))
+    if out_path is None:
+        counts = np.empty(shape, dtype=np.int64)
+    else:
+        counts = np.lib.format.open_memmap(out_path, mode='w+',\
+            dtype=np.int64, shape=shape)
+    lives = np.empty(len(paths))
+    reals = np.empty(len(paths))
+    for n, path in enumerate(paths):
+        spec = first if n == 0 else read(path)
+        if len(spec.counts) != shape[1]:
+            raise ValueError('{0} has {1} channels, {2} has {3}'.format(\
+                path, len(spec.counts), paths[0], shape[1]))
+        counts[n] = spec.counts
+        lives[n] = spec.live
+        reals[n] = spec.real
+    return counts, lives, reals, first
+
+def stack_sum(counts, weights=None, chunk=1024):
+    # weighted sum of stack rows and its Poisson variance
+    total = np.zeros(counts.shape[1])
+    variance = np.zeros(counts.shape[1])
+    for i in range(0, counts.shape[0], chunk):
+        rows = np.asarray(counts[i:i+chunk], dtype=np.float64)
+        if weights is None:
+            total += rows.sum(axis=0)
+            variance += np.maximum(rows, 0).sum(axis=0)
+        else:
+            w = np.asarray(weights[i:i+chunk], dtype=np.float64)
+            total += w @ rows
+            variance += (w**2) @ np.maximum(rows, 0)
+    return total, variance
+
+def sum_stack(counts, lives, reals, template=None, live=None, chunk=1024):
+    # sum a stack; with live given the sum is normalized to that live time
+    total, variance = stack_sum(counts, chunk=chunk)
+    if template is None:
+        template = Spectrum(total)
+    spec = template.copy(counts=total, variances=variance,\
+        live=float(np.sum(lives)), real=float(np.sum(reals)))
+    if live is not None:
+        spec = normalize(spec, live)
+    return spec
+
+def sum_files(paths, out_path=None, live=None, chunk=1024):
+    counts, lives, reals, first = build_stack(paths, out_path)
+    return sum_stack(counts, lives, reals, first, live, chunk)
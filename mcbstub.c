@@ -0,0 +1,149 @@
+/* Minimal stand-in for mcbcio32 implementing the MIO calls MCBDriver uses,
+ * so the ctypes binding layer can be loaded and benchmarked off Windows:
+ *
+ *     gcc -shared -fPIC -O2 -o libmcbstub.so mcbstub.c
+ *     MCBCIO_LIBRARY=./libmcbstub.so python mcbbench.py
+ *
+ * One detector with CHAN_MAX channels; every channel counts up by one on
+ * each MIOGetData call while acquisition is active.
+ *
+ * Link faults can be injected for trying the driver's retry policy:
+ * MCBSTUB_FAIL_EVERY=n makes every nth MIOComm/MIOGetData call time out
+ * (-2) and MCBSTUB_BREAK_EVERY=n breaks the link (-1) on every nth call
+ * until the detector is closed and opened again. */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#define CHAN_MAX 16384
+#define DATA_MASK 0x7fffffffu
+#define ROI_MASK 0x80000000u
+
+static unsigned int data[CHAN_MAX];
+static int active = 0;
+static long start_time = 0;
+static int last_error = 0;
+static int broken = 0;
+static int handle = 0;
+static long ncalls = 0;
+
+static long env_every(const char *name)
+{
+    const char *value = getenv(name);
+    return value ? atol(value) : 0;
+}
+
+/* nonzero when this call should fail, with last_error set */
+static int fault(int hdet)
+{
+    long fail_every = env_every("MCBSTUB_FAIL_EVERY");
+    long break_every = env_every("MCBSTUB_BREAK_EVERY");
+    ncalls++;
+    if (hdet != handle)
+        last_error = 1;
+    else if (broken || (break_every && ncalls % break_every == 0))
+        broken = 1, last_error = -1;
+    else if (fail_every && ncalls % fail_every == 0)
+        last_error = -2;
+    else
+        return 0;
+    return 1;
+}
+
+int MIOStartup(void) { return 1; }
+int MIOCleanup(void) { return 1; }
+int MIOGetDetLength(int hdet) { return CHAN_MAX; }
+
+int MIOGetLastError(int *macro_err, int *micro_err)
+{
+    *macro_err = 0;
+    *micro_err = 0;
+    return last_error;
+}
+
+int MIOOpenDetector(int ndet, const char *app, const char *password)
+{
+    if (ndet != 1) {
+        last_error = 1;
+        return 0;
+    }
+    broken = 0;
+    return ++handle;
+}
+
+int MIOCloseDetector(int hdet) { return 1; }
+
+int MIOComm(int hdet, const char *cmd, const char *cmd_prefix,
+    const char *resp_prefix, int max_resp, char *resp, int *resp_len)
+{
+    int n;
+    if (fault(hdet))
+        return 0;
+    if (strcmp(cmd, "START") == 0) {
+        active = 1;
+        start_time = (long)time(NULL);
+    } else if (strcmp(cmd, "STOP") == 0) {
+        active = 0;
+    } else if (strcmp(cmd, "CLEAR") == 0) {
+        memset(data, 0, sizeof(data));
+    }
+    if (strncmp(cmd, "SHOW_ROI", 8) == 0 || strncmp(cmd, "SHOW_NEXT", 9) == 0)
+        n = snprintf(resp, max_resp, "$D0000000000cccn");
+    else if (strncmp(cmd, "SHOW_GATE", 9) == 0)
+        n = snprintf(resp, max_resp, "$F0OFFn");
+    else if (strncmp(cmd, "SHOW_LLD", 8) == 0 ||
+            strncmp(cmd, "SHOW_ULD", 8) == 0)
+        n = snprintf(resp, max_resp, "$C00000cccn");
+    else if (strncmp(cmd, "SHOW_", 5) == 0)
+        n = snprintf(resp, max_resp, "$G0000000000cccn");
+    else
+        n = snprintf(resp, max_resp, "%s", "");
+    if (resp_len)
+        *resp_len = n;
+    return 1;
+}
+
+int MIOGetConfigMax(const char *app, int *det_max)
+{
+    *det_max = 1;
+    return 1;
+}
+
+int MIOGetConfigName(int ndet, const char *app, int name_max, char *name,
+    int *id, int *owner)
+{
+    snprintf(name, name_max, "stub");
+    *id = ndet;
+    return 1;
+}
+
+int MIOGetData(int hdet, unsigned int start_chan, unsigned int num_chans,
+    unsigned int *buffer, short *ret_chans, unsigned int *data_mask,
+    unsigned int *roi_mask, const char *password)
+{
+    unsigned int i;
+    if (fault(hdet))
+        return 0;
+    if (start_chan + num_chans > CHAN_MAX) {
+        last_error = 1;
+        return 0;
+    }
+    for (i = 0; i < num_chans; i++) {
+        if (active)
+            data[start_chan + i]++;
+        buffer[i] = data[start_chan + i];
+    }
+    *ret_chans = (short)num_chans;
+    *data_mask = DATA_MASK;
+    *roi_mask = ROI_MASK;
+    return (int)num_chans;
+}
+
+unsigned int MIOGetStartTime(int hdet, long *current_time)
+{
+    return (unsigned int)start_time;
+}
+
+int MIOIsActive(int hdet) { return active; }
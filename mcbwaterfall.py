@@ -0,0 +1,128 @@
+from PyQt5 import QtCore
+import pyqtgraph as pg
+import numpy as np
+import time
+
+class WaterfallBuffer:
+    def __init__(self, chan_max, bins=512, rows=1440, period=10.0):
+        # counts gained per period seconds in bins channel groups, for the
+        # last rows periods (4 hours by default); every row is written twice,
+        # at n and n + rows, so buf[n+1:n+1+rows] is always the history in
+        # time order without copying
+        self.bins = min(bins, chan_max)
+        self.factor = chan_max // self.bins
+        self.rows = rows
+        self.period = period
+        self.buf = np.zeros((2*rows, self.bins), dtype=np.float32)
+
+        # the same rows log scaled and the largest count of each row, kept
+        # up to date row by row so a redraw never rescans the history
+        self.log = np.zeros((2*rows, self.bins), dtype=np.float32)
+        self.peaks = np.zeros(2*rows, dtype=np.float32)
+        self.version = 0
+        self.n = 0
+        self.row_start = None
+        self.last = None
+
+    def reset(self):
+        self.buf[:] = 0
+        self.log[:] = 0
+        self.peaks[:] = 0
+        self.version += 1
+        self.n = 0
+        self.row_start = None
+        self.last = None
+
+    def rebase(self):
+        # the next push only sets the reference (e.g. after loading a
+        # spectrum), so the jump is not counted as gained
+        self.last = None
+
+    def rebin(self, counts):
+        return counts[:self.bins*self.factor].reshape((self.bins, -1))\
+            .sum(axis=1)
+
+    def push(self, counts, now=None):
+        # add the counts gained since the last push to the current row, and
+        # start a new row once the period is over
+        now = time.monotonic() if now is None else now
+        counts = self.rebin(counts)
+        if self.last is None or np.any(counts < self.last):
+            # first spectrum or cleared since: nothing to difference against
+            self.last = counts
+            if self.row_start is None:
+                self.row_start = now
+            return
+        delta = counts - self.last
+        self.last = counts
+
+        if now - self.row_start >= self.period:
+            # skip periods without data as empty rows, at most a full buffer
+            steps = min(int((now - self.row_start) // self.period), self.rows)
+            for i in range(steps):
+                self.n = (self.n + 1) % self.rows
+                for row in (self.n, self.n + self.rows):
+                    self.buf[row] = 0
+                    self.log[row] = 0
+                    self.peaks[row] = 0
+            self.row_start += steps * self.period
+            if steps == self.rows:
+                self.row_start = now
+        self.buf[self.n] += delta
+        np.log1p(self.buf[self.n], out=self.log[self.n])
+        self.peaks[self.n] = self.buf[self.n].max()
+        for array in (self.buf, self.log, self.peaks):
+            array[self.n + self.rows] = array[self.n]
+        self.version += 1
+
+    def history(self, log=False):
+        # (rows, bins) view, oldest row first and the current one last
+        buf = self.log if log else self.buf
+        return buf[self.n+1:self.n+1+self.rows]
+
+    def peak(self, log=False):
+        # largest value in the history
+        peak = float(self.peaks[self.n+1:self.n+1+self.rows].max())
+        return float(np.log1p(peak)) if log else peak
+
+class MCBWaterfall(pg.PlotWidget):
+    def __init__(self, chan_max, bins=512, rows=1440, period=10.0, **kwargs):
+        super().__init__(**kwargs)
+        self.chan_max = chan_max
+        self.buffer = WaterfallBuffer(chan_max, bins, rows, period)
+        self.log = False
+        self.drawn = None
+
+        # one image of time (up) x channels, redrawn once per update
+        self.image = pg.ImageItem(axisOrder='row-major')
+        self.image.setLookupTable(pg.colormap.get('viridis').getLookupTable())
+        self.image.setRect(QtCore.QRectF(0, 0, chan_max, rows))
+        self.addItem(self.image)
+
+        self.setMouseEnabled(False, False)
+        self.setMenuEnabled(False)
+        self.hideButtons()
+        self.hideAxis('bottom')
+        self.hideAxis('left')
+        self.setXRange(0, chan_max, padding=0)
+        self.setYRange(0, rows, padding=0)
+
+    def push(self, counts):
+        self.buffer.push(counts)
+
+    def rebase(self):
+        self.buffer.rebase()
+
+    def reset(self):
+        self.buffer.reset()
+        self.redraw()
+
+    def redraw(self):
+        # only when rows changed or the scale was switched since last time
+        drawn = (self.buffer.version, self.buffer.n, self.log)
+        if drawn == self.drawn:
+            return
+        self.drawn = drawn
+        top = self.buffer.peak(self.log) or 1.
+        self.image.setImage(self.buffer.history(self.log), autoLevels=False,\
+            levels=(0, top))
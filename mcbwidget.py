@@ -1,24 +1,38 @@
-from mcbdriver import MCBDriver
+from mcbdriver import MCBError
+from mcbdetector import MCBCommands
+from mcbinventory import probe_detector, idle_state
+from mcbroi import ROISet, mask_rois, coalesce_windows
 from mcbplot import MCBPlot
+from mcbrates import RateStats
+from mcbregion import RegionIndex
+from mcbwaterfall import MCBWaterfall
+from mcbdrift import DriftMonitor
+from mcbcalib import Calibration
+from mcbsettings import SettingsStore
+from mcbspectrum import Spectrum
+from mcbnuclides import default_library, unit_factors
 from spoiler import Spoiler
 from PyQt5 import QtWidgets, QtGui, QtCore
 import pyqtgraph as pg
 import numpy as np
-from collections import deque
 from datetime import datetime
+import logging
 
-class MCBWidget(QtWidgets.QGroupBox):
+log = logging.getLogger(__name__)
+
+class MCBWidget(QtWidgets.QGroupBox, MCBCommands):
     white = '#ffffff'
     red = '#ff0000'
     gray = '#cccccc'
 
-    gate_index = {
-        'OFF' : 0,
-        'COIN': 1,
-        'ANTI': 2
-    }
+    # full spectrum read interval (in updates) in ROI monitor mode
+    full_every = 20
+
+    # emitted with the widget when counting stopped at a preset
+    sigPresetReached = QtCore.Signal(object)
 
-    def __init__(self, mcb_driver, ndet, **kwargs):
+    def __init__(self, mcb_driver, ndet, store=None, info=None, fitter=None,\
+            cache=None, **kwargs):
         super().__init__(**kwargs)
         self.setObjectName('MCBBox')
         self.setStyleSheet('QGroupBox#MCBBox{' +\
@@ -30,17 +44,32 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.int_only = QtGui.QIntValidator()
         self.float_only = QtGui.QDoubleValidator()
 
-        # establish connection with MCB and get info from it
+        # establish connection with MCB and get info from it, unless it was
+        # probed already; a cached inventory entry (no hdet) builds the panel
+        # disabled until attach() hands over the opened detector
         self.driver = mcb_driver
-        self.hdet = self.driver.open_detector(ndet)
-        self.name, self.id = self.driver.get_config_name(ndet)
-        self.chan_max = self.driver.get_det_length(self.hdet)
+        self.ndet = ndet
+        if info is None:
+            info = probe_detector(self.driver, ndet)
+        elif info.get('hdet') is None:
+            info = idle_state(info)
+        self.hdet = info['hdet']
+        self.name = info['name']
+        self.id = info['id']
+        self.chan_max = info['chan_max']
         self.chan_min = 8
-        self.active = self.is_active()
-        self.start_datetime = datetime.fromtimestamp(\
-            self.driver.get_start_time(self.hdet))
-        self.start_time_str = self.start_datetime.strftime('%I:%M:%S %p')
-        self.start_date_str = self.start_datetime.strftime('%m/%d/%Y')
+        self.load_state(info)
+
+        # set while the MCB keeps failing, see guard
+        self.failing = False
+
+        # ROI's are fitted by a shared FitService if given, else right here;
+        # fits of a stopped spectrum (e.g. one opened from a file) are kept
+        # in the AnalysisCache if given
+        self.fitter = fitter
+        self.cache = cache
+        self.popts = []
+        self.peak_ids = []
 
         # create label displaying MCB ID and name
         self.title = '{0:04d} {1}'.format(self.id, self.name)
@@ -48,12 +77,14 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.sample = QtWidgets.QLineEdit()
         self.sample.setPlaceholderText('Sample Description')
 
-        # setup settings for storing memory
-        self.settings = QtCore.QSettings('pystro', self.title)
+        # setup settings for storing memory (in the station's shared store)
+        if store is None:
+            store = SettingsStore()
+        self.settings = store.group(self.title)
 
         # load sample description settings
         if self.settings.contains('sample'):
-            self.sample.setText(self.settings.value('sample'))
+            self.sample.setText(str(self.settings.value('sample')))
 
         # add response function for sample textbox
         def sample_change():
@@ -73,6 +104,7 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.init_adc_grp()
         self.init_plot_grp()
         self.init_calib_grp()
+        self.init_drift_grp()
         self.init_plotwidget()
 
         # layout widgets
@@ -92,6 +124,7 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.plot_layout.addWidget(self.label, 0, 0)
         self.plot_layout.addWidget(self.sample, 0, 1)
         self.plot_layout.addWidget(self.plot, 1, 0, 1, 2)
+        self.plot_layout.addWidget(self.waterfall, 2, 0, 1, 2)
         self.marker_layout.addWidget(QtWidgets.QLabel('Marker: '))
         self.marker_layout.addWidget(self.chan_lbl)
         self.marker_layout.addWidget(QtWidgets.QLabel(' ('))
@@ -99,6 +132,8 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.marker_layout.addWidget(QtWidgets.QLabel(') = '))
         self.marker_layout.addWidget(self.count_lbl)
         self.marker_layout.addWidget(QtWidgets.QLabel(' Counts'))
+        self.marker_layout.addWidget(QtWidgets.QWidget(), 1)
+        self.marker_layout.addWidget(self.region_lbl)
         self.marker_layout.addWidget(QtWidgets.QWidget(), 10)
         self.fit_layout.addWidget(QtWidgets.QLabel('ROI Fit:  μ = '))
         self.fit_layout.addWidget(self.mu_chan_lbl)
@@ -108,7 +143,8 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.fit_layout.addWidget(self.sig_chan_lbl)
         self.fit_layout.addWidget(QtWidgets.QLabel(' ('))
         self.fit_layout.addWidget(self.sig_energy_lbl)
-        self.fit_layout.addWidget(QtWidgets.QLabel(')'))
+        self.fit_layout.addWidget(QtWidgets.QLabel('),  ID: '))
+        self.fit_layout.addWidget(self.nuclide_lbl)
         self.fit_layout.addWidget(QtWidgets.QWidget(), 10)
 
         self.right_layout.addWidget(self.data_grp)
@@ -117,8 +153,56 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.right_layout.addWidget(self.adc_grp)
         self.right_layout.addWidget(self.plot_grp)
         self.right_layout.addWidget(self.calib_grp)
+        self.right_layout.addWidget(self.drift_grp)
         self.right_layout.addWidget(QtWidgets.QWidget(), 10)
 
+        if self.hdet is None:
+            self.label.setText(self.title + ' (connecting)')
+            self.setEnabled(False)
+
+    def load_state(self, info):
+        # detector state as read by probe_detector
+        self.active = info['active']
+        self.start_datetime = datetime.fromtimestamp(info['start_time'])
+        self.start_time_str = self.start_datetime.strftime('%I:%M:%S %p')
+        self.start_date_str = self.start_datetime.strftime('%m/%d/%Y')
+        self.real = info['real']
+        self.live = info['live']
+        self.rpre = info['real_preset']
+        self.lpre = info['live_preset']
+        self.gate = info['gate']
+        self.lld = info['lld']
+        self.uld = info['uld']
+        self.counts = info['counts']
+        self.roi_mask = info['roi_mask']
+
+    def attach(self, info):
+        # take over a detector opened in the background: its handle and
+        # state replace the cached placeholders, without writing the values
+        # just read back to the MCB
+        self.hdet = info['hdet']
+        self.load_state(info)
+        self.windows = coalesce_windows(*mask_rois(self.roi_mask))
+        self.full_countdown = 0
+
+        boxes = [self.rpre_txt, self.lpre_txt, self.gate_box, self.lld_txt,\
+            self.uld_txt]
+        for box in boxes:
+            box.blockSignals(True)
+        self.rpre_str = self.preset_str(self.rpre)
+        self.lpre_str = self.preset_str(self.lpre)
+        self.rpre_txt.setText(self.rpre_str)
+        self.lpre_txt.setText(self.lpre_str)
+        self.gate_box.setCurrentIndex(self.gate)
+        self.lld_txt.setText(str(self.lld))
+        self.uld_txt.setText(str(self.uld))
+        for box in boxes:
+            box.blockSignals(False)
+
+        self.show_active()
+        self.label.setText(self.title)
+        self.setEnabled(True)
+
     def get_neutral_color(self):
         # get neutral button color
         btn_color = QtWidgets.QPushButton().palette().color(\
@@ -127,13 +211,19 @@ class MCBWidget(QtWidgets.QGroupBox):
             btn_color.red(), btn_color.green(), btn_color.blue())
 
     def init_plotwidget(self):
-        self.counts, self.roi_mask = self.get_data()
+        self.windows = coalesce_windows(*mask_rois(self.roi_mask))
+        self.full_countdown = self.full_every
         self.chans = self.chan_max
 
         # create MCB plot widget (with initial histogram and markers)
         self.plot = MCBPlot(self.chans, self.counts, self.roi_mask,\
             enableMenu=False)
 
+        # create waterfall of the counts gained over time (shown on demand)
+        self.waterfall = MCBWaterfall(self.chan_max, enableMenu=False)
+        self.waterfall.setMinimumHeight(200)
+        self.waterfall.hide()
+
         # create line info labels
         self.chan_lbl = QtWidgets.QLabel()
         self.count_lbl = QtWidgets.QLabel()
@@ -145,6 +235,11 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.count_lbl.setMinimumWidth(70)
         self.calib_lbl.setMinimumWidth(80)
 
+        # create dragged region label, from a prefix-sum index of the
+        # current spectrum that is rebuilt at most once per update
+        self.region_lbl = QtWidgets.QLabel()
+        self.index = None
+
         # create ROI fit info labels
         self.mu_chan_lbl = QtWidgets.QLabel()
         self.mu_energy_lbl = QtWidgets.QLabel()
@@ -159,12 +254,20 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.sig_chan_lbl.setMinimumWidth(100)
         self.sig_energy_lbl.setMinimumWidth(130)
 
+        # create nuclide identification label
+        self.nuclide_lbl = QtWidgets.QLabel()
+        self.nuclide_lbl.setMinimumWidth(130)
+
         # update marker and ROI fit
+        self.fit_rois()
         self.update_marker()
 
         # add response function for line position change
         self.plot.line().sigPositionChanged.connect(self.update_marker)
 
+        # integrate the box live while it is dragged
+        self.plot.box().sigRegionChanged.connect(self.update_region)
+
         # add response function for ROI menu actions
         def roi_mark():
             pos = self.plot.box().pos()
@@ -174,6 +277,7 @@ class MCBWidget(QtWidgets.QGroupBox):
                 self.chan_max-1)
 
             self.set_roi(x0, x1-x0+1)
+            self.full_countdown = 0
         def roi_clear():
             pos = self.plot.box().pos()
             size = self.plot.box().size()
@@ -182,6 +286,7 @@ class MCBWidget(QtWidgets.QGroupBox):
                 self.chan_max-1)
 
             self.clear_roi(x0, x1-x0+1)
+            self.full_countdown = 0
         self.plot.box().sigMark.connect(roi_mark)
         self.plot.box().sigClear.connect(roi_clear)
 
@@ -205,9 +310,9 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.clear_btn.setIconSize(QtCore.QSize(20,20))
 
         # add response functions for data acq buttons
-        self.start_btn.clicked.connect(self.start)
-        self.stop_btn.clicked.connect(self.stop)
-        self.clear_btn.clicked.connect(self.clear)
+        self.start_btn.clicked.connect(lambda: self.guard(self.start))
+        self.stop_btn.clicked.connect(lambda: self.guard(self.stop))
+        self.clear_btn.clicked.connect(lambda: self.guard(self.clear))
 
         # layout data acq buttons
         self.data_layout.addWidget(self.start_btn)
@@ -223,14 +328,12 @@ class MCBWidget(QtWidgets.QGroupBox):
             self.disable_btn(self.stop_btn)
 
     def init_time_grp(self):
-        self.real = self.get_real()
         self.real_str = '{0:.2f}'.format(self.real / 1000)
-        self.live = self.get_live()
         self.live_str = '{0:.2f}'.format(self.live / 1000)
         self.dead = 0
         self.dead_str = '%'
-        self.dreals = deque([0]*4)
-        self.dlives = deque([0]*4)
+        self.rate_str = 'cps'
+        self.rates = RateStats(self.chan_max)
 
         # create a group for timing information
         self.time_grp = QtWidgets.QGroupBox('Timing')
@@ -243,16 +346,19 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.real_lbl = QtWidgets.QLabel(self.real_str)
         self.live_lbl = QtWidgets.QLabel(self.live_str)
         self.dead_lbl = QtWidgets.QLabel(self.dead_str)
+        self.rate_lbl = QtWidgets.QLabel(self.rate_str)
         self.start_time_lbl.setAlignment(QtCore.Qt.AlignRight)
         self.start_date_lbl.setAlignment(QtCore.Qt.AlignRight)
         self.real_lbl.setAlignment(QtCore.Qt.AlignRight)
         self.live_lbl.setAlignment(QtCore.Qt.AlignRight)
         self.dead_lbl.setAlignment(QtCore.Qt.AlignRight)
+        self.rate_lbl.setAlignment(QtCore.Qt.AlignRight)
         self.start_time_lbl.setMinimumWidth(50)
         self.start_date_lbl.setMinimumWidth(50)
         self.real_lbl.setMinimumWidth(50)
         self.live_lbl.setMinimumWidth(50)
         self.dead_lbl.setMinimumWidth(50)
+        self.rate_lbl.setMinimumWidth(50)
 
         # layout timing labels
         self.time_layout.addWidget(QtWidgets.QLabel('Start: '), 0, 0)
@@ -260,23 +366,22 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.time_layout.addWidget(QtWidgets.QLabel('Real: '), 2, 0)
         self.time_layout.addWidget(QtWidgets.QLabel('Live: '), 3, 0)
         self.time_layout.addWidget(QtWidgets.QLabel('Dead: '), 4, 0)
+        self.time_layout.addWidget(QtWidgets.QLabel('Rate: '), 5, 0)
         self.time_layout.addWidget(self.start_time_lbl, 0, 1)
         self.time_layout.addWidget(self.start_date_lbl, 1, 1)
         self.time_layout.addWidget(self.real_lbl, 2, 1)
         self.time_layout.addWidget(self.live_lbl, 3, 1)
         self.time_layout.addWidget(self.dead_lbl, 4, 1)
+        self.time_layout.addWidget(self.rate_lbl, 5, 1)
+
+    def preset_str(self, preset):
+        if preset > 0:
+            return '{0:.2f}'.format(preset / 1000)
+        return ''
 
     def init_preset_grp(self):
-        self.rpre = self.get_real_preset()
-        if self.rpre > 0:
-            self.rpre_str = '{0:.2f}'.format(self.rpre / 1000)
-        else:
-            self.rpre_str = ''
-        self.lpre = self.get_live_preset()
-        if self.lpre > 0:
-            self.lpre_str = '{0:.2f}'.format(self.lpre / 1000)
-        else:
-            self.lpre_str = ''
+        self.rpre_str = self.preset_str(self.rpre)
+        self.lpre_str = self.preset_str(self.lpre)
 
             # create a group for preset limits
         self.preset_grp = Spoiler(title='Preset Limits')
@@ -344,10 +449,6 @@ class MCBWidget(QtWidgets.QGroupBox):
             self.lpre_txt.setReadOnly(False)
 
     def init_adc_grp(self):
-        self.gate = self.get_gate()
-        self.lld = self.get_lld()
-        self.uld = self.get_uld()
-
         # create a group for ADC settings
         self.adc_grp = Spoiler(title='ADC Settings')
         self.adc_layout = QtWidgets.QGridLayout()
@@ -421,6 +522,7 @@ class MCBWidget(QtWidgets.QGroupBox):
 
     def init_plot_grp(self):
         self.mode = 'Auto'
+        self.monitor = False
 
         # create a group for plot settings
         self.plot_grp = Spoiler(title='Plot Settings')
@@ -438,19 +540,51 @@ class MCBWidget(QtWidgets.QGroupBox):
             self.mode = 'Log'
             self.disable_btn(self.log_btn)
             self.enable_btn(self.auto_btn)
-            self.plot.update(self.chans, self.counts, self.roi_mask, self.mode)   
-            self.popts = self.plot.fit_roi(self.get_roi(), self.calibrated,\
-                self.a, self.b, self.c)
+            self.plot.set_mode(self.mode)
+            self.waterfall.log = True
+            self.waterfall.redraw()
         def auto_click():
             self.mode = 'Auto'
             self.enable_btn(self.log_btn)
             self.disable_btn(self.auto_btn)
-            self.plot.update(self.chans, self.counts, self.roi_mask, self.mode)
-            self.popts = self.plot.fit_roi(self.get_roi(), self.calibrated,\
-                self.a, self.b, self.c)
+            self.plot.set_mode(self.mode)
+            self.waterfall.log = False
+            self.waterfall.redraw()
         self.log_btn.clicked.connect(log_click)
         self.auto_btn.clicked.connect(auto_click)
 
+        # create waterfall toggle button
+        self.waterfall_btn = QtWidgets.QPushButton('Waterfall')
+        self.waterfall_btn.setCheckable(True)
+        self.waterfall_btn.setMinimumWidth(20)
+
+        # add response function for waterfall toggle
+        def waterfall_toggle(checked):
+            self.waterfall.setVisible(checked)
+            if checked:
+                self.waterfall.redraw()
+        self.waterfall_btn.toggled.connect(waterfall_toggle)
+
+        # create read mode buttons (whole spectrum or only around ROI's)
+        self.full_btn = QtWidgets.QPushButton('Full')
+        self.monitor_btn = QtWidgets.QPushButton('ROI')
+        self.full_btn.setMinimumWidth(20)
+        self.monitor_btn.setMinimumWidth(20)
+        self.disable_btn(self.full_btn)
+
+        # add response functions for buttons
+        def full_click():
+            self.monitor = False
+            self.disable_btn(self.full_btn)
+            self.enable_btn(self.monitor_btn)
+        def monitor_click():
+            self.monitor = True
+            self.full_countdown = 0
+            self.enable_btn(self.full_btn)
+            self.disable_btn(self.monitor_btn)
+        self.full_btn.clicked.connect(full_click)
+        self.monitor_btn.clicked.connect(monitor_click)
+
         # create rebinning dropdown menu
         self.chan_box = QtWidgets.QComboBox()
         self.chan_box.setEditable(True)
@@ -468,9 +602,9 @@ class MCBWidget(QtWidgets.QGroupBox):
         # add response function for rebinning menu
         def chan_change():
             self.chans = int(self.chan_max / (1<<self.chan_box.currentIndex()))
-            self.plot.update(self.chans, self.counts, self.roi_mask, self.mode)
-            self.popts = self.plot.fit_roi(self.get_roi(), self.calibrated,\
-                self.a, self.b, self.c)
+            self.plot.update(self.chans, self.display_counts(),\
+                self.roi_mask, self.mode)
+            self.fit_rois()
         self.chan_box.currentIndexChanged.connect(chan_change)
 
         # layout plot widgets
@@ -479,6 +613,10 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.plot_layout.addWidget(self.log_btn, 1, 0)
         self.plot_layout.addWidget(self.auto_btn, 1, 1)
         self.plot_layout.addWidget(self.chan_box, 2, 1)
+        self.plot_layout.addWidget(QtWidgets.QLabel('Read: '), 3, 0, 1, 2)
+        self.plot_layout.addWidget(self.full_btn, 4, 0)
+        self.plot_layout.addWidget(self.monitor_btn, 4, 1)
+        self.plot_layout.addWidget(self.waterfall_btn, 5, 0, 1, 2)
         self.plot_grp.setContentLayout(self.plot_layout)
 
     def init_calib_grp(self):
@@ -499,6 +637,12 @@ class MCBWidget(QtWidgets.QGroupBox):
             self.c = self.settings.value('c')
         else:
             self.c = 0
+        self.calib = Calibration(self.chan_max)
+        self.calib.set_coeffs([self.a, self.b, self.c])
+        if self.settings.contains('fwhm'):
+            self.calib.set_fwhm_coeffs(self.settings.value('fwhm'))
+        self.calibrated = self.calib.calibrated
+        self.a, self.b, self.c = self.calib.abc()
 
         # create a group for calibrations
         self.calib_grp = Spoiler(title='Calibration')
@@ -566,67 +710,22 @@ class MCBWidget(QtWidgets.QGroupBox):
         else:
             self.units = 'keV'
 
-        # add response functions to calibration textboxes
-        def update_calib():
-            calib_pts = np.array([(self.chan1, self.energy1),\
-                (self.chan2, self.energy2), (self.chan3, self.energy3)])
-            # ignore points where chan = 0 or energy = 0
-            valid_pts = calib_pts[np.logical_and(calib_pts[:,0] > 0,\
-                calib_pts[:,1] > 0), :]
-            npts = valid_pts.shape[0]
-
-            # calculate quadratic fit parameters
-            try:
-                if npts == 0:
-                    self.calibrated = False
-                    self.a = 0
-                    self.b = 0
-                    self.c = 0
-                elif npts == 1:
-                    self.calibrated = True
-                    self.a = 0
-                    self.b = valid_pts[0,1]/valid_pts[0,0]
-                    self.c = 0
-                elif npts == 2:
-                    self.calibrated = True
-                    self.a = 0
-                    self.b = (valid_pts[1,1] - valid_pts[0,1]) /\
-                        (valid_pts[1,0] - valid_pts[0,0])
-                    self.c = valid_pts[0,1] - self.b * valid_pts[0,0]
-                else:
-                    A0 = -valid_pts[0,0]**2 + valid_pts[1,0]**2
-                    B0 = -valid_pts[0,0] + valid_pts[1,0]
-                    D0 = -valid_pts[0,1] + valid_pts[1,1]
-                    A1 = -valid_pts[1,0]**2 + valid_pts[2,0]**2
-                    B1 = -valid_pts[1,0] + valid_pts[2,0]
-                    D1 = -valid_pts[1,1] + valid_pts[2,1]
-                    A2 = -B1/B0 * A0 + A1
-                    D2 = -B1/B0 * D0 + D1
-                    self.calibrated = True
-                    self.a = D2/A2
-                    self.b = (D0 - A0*self.a) / B0
-                    self.c = valid_pts[0,1] - self.a*valid_pts[0,0]**2 -\
-                        self.b*valid_pts[0,0]
-            except:
-                self.calibrated = False
-                self.a = 0
-                self.b = 0
-                self.c = 0
+        # refit at most once per pause in typing
+        self.calib_timer = QtCore.QTimer()
+        self.calib_timer.setSingleShot(True)
+        self.calib_timer.setInterval(300)
+        self.calib_timer.timeout.connect(self.update_calib)
 
-            self.settings.setValue('calibrated', self.calibrated)
-            self.settings.setValue('a', self.a)
-            self.settings.setValue('b', self.b)
-            self.settings.setValue('c', self.c)
+        # create button to calibrate from the identified ROI peaks
+        self.calib_fit_btn = QtWidgets.QPushButton("Fit ROI's")
 
-            # update marker info label
-            self.update_marker()
+        # add response functions to calibration textboxes
         def chan1_change():
             chan1_str = self.chan1_txt.text()
             if chan1_str == '':
                 self.chan1_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.chan1 = 0
-                self.settings.remove('chan1')
             elif chan1_str == '-' or int(chan1_str) < 0\
                     or int(chan1_str) >= self.chan_max:
                 self.chan1_txt.setStyleSheet(\
@@ -635,15 +734,13 @@ class MCBWidget(QtWidgets.QGroupBox):
                 self.chan1_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.chan1 = int(chan1_str)
-                self.settings.setValue('chan1', self.chan1)
-            update_calib()
+            self.calib_timer.start()
         def chan2_change():
             chan2_str = self.chan2_txt.text()
             if chan2_str == '':
                 self.chan2_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.chan2 = 0
-                self.settings.remove('chan2')
             elif chan2_str == '-' or int(chan2_str) < 0\
                     or int(chan2_str) >= self.chan_max:
                 self.chan2_txt.setStyleSheet(\
@@ -652,15 +749,13 @@ class MCBWidget(QtWidgets.QGroupBox):
                 self.chan2_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.chan2 = int(chan2_str)
-                self.settings.setValue('chan2', self.chan2)
-            update_calib()
+            self.calib_timer.start()
         def chan3_change():
             chan3_str = self.chan3_txt.text()
             if chan3_str == '':
                 self.chan3_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.chan3 = 0
-                self.settings.remove('chan3')
             elif chan3_str == '-' or int(chan3_str) < 0\
                     or int(chan3_str) >= self.chan_max:
                 self.chan3_txt.setStyleSheet(\
@@ -669,15 +764,13 @@ class MCBWidget(QtWidgets.QGroupBox):
                 self.chan3_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.chan3 = int(chan3_str)
-                self.settings.setValue('chan3', self.chan3)
-            update_calib()
+            self.calib_timer.start()
         def energy1_change():
             energy1_str = self.energy1_txt.text()
             if energy1_str == '':
                 self.energy1_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.energy1 = 0
-                self.settings.remove('energy1')
             elif energy1_str == '-' or float(energy1_str) < 0:
                 self.energy1_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.red))
@@ -685,15 +778,13 @@ class MCBWidget(QtWidgets.QGroupBox):
                 self.energy1_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.energy1 = float(energy1_str)
-                self.settings.setValue('energy1', self.energy1)
-            update_calib()
+            self.calib_timer.start()
         def energy2_change():
             energy2_str = self.energy2_txt.text()
             if energy2_str == '':
                 self.energy2_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.energy2 = 0
-                self.settings.remove('energy2')
             elif energy2_str == '-' or float(energy2_str) < 0:
                 self.energy2_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.red))
@@ -701,15 +792,13 @@ class MCBWidget(QtWidgets.QGroupBox):
                 self.energy2_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.energy2 = float(energy2_str)
-                self.settings.setValue('energy2', self.energy2)
-            update_calib()
+            self.calib_timer.start()
         def energy3_change():
             energy3_str = self.energy3_txt.text()
             if energy3_str == '':
                 self.energy3_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.energy3 = 0
-                self.settings.remove('energy3')
             elif energy3_str == '-' or float(energy3_str) < 0:
                 self.energy3_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.red))
@@ -717,8 +806,7 @@ class MCBWidget(QtWidgets.QGroupBox):
                 self.energy3_txt.setStyleSheet(\
                     'background-color: {0}'.format(self.white))
                 self.energy3 = float(energy3_str)
-                self.settings.setValue('energy3', self.energy3)
-            update_calib()
+            self.calib_timer.start()
         def units_change():
             units_str = self.units_txt.text()
             if units_str == '':
@@ -738,6 +826,17 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.energy3_txt.textChanged.connect(energy3_change)
         self.units_txt.textChanged.connect(units_change)
 
+        # add response function for calibration fit button
+        def calib_fit_click():
+            # refine with each fitted ROI centroid at its best library line
+            factor = unit_factors.get(self.units)
+            energies = [ids[0][1] / factor if len(ids) > 0 and factor\
+                else np.nan for ids in self.peak_ids]
+            self.calib.fit_peaks(self.popts, energies)
+            self.set_calib()
+            self.fit_rois()
+        self.calib_fit_btn.clicked.connect(calib_fit_click)
+
         # layout calibration widgets
         self.calib_layout.addWidget(QtWidgets.QLabel('Channel'), 0, 0)
         self.calib_layout.addWidget(QtWidgets.QLabel('Energy/Time'), 0, 2)
@@ -752,74 +851,248 @@ class MCBWidget(QtWidgets.QGroupBox):
         self.calib_layout.addWidget(self.energy2_txt, 2, 2)
         self.calib_layout.addWidget(self.energy3_txt, 3, 2)
         self.calib_layout.addWidget(self.units_txt, 4, 1, 1, 2)
+        self.calib_layout.addWidget(self.calib_fit_btn, 5, 0, 1, 3)
         self.calib_grp.setContentLayout(self.calib_layout)
 
-    def update_mcb(self):
-        self.counts, self.roi_mask = self.get_data()
+    def init_drift_grp(self):
+        self.drift = DriftMonitor()
+        self.correcting = False
+
+        # create a group for gain stabilization
+        self.drift_grp = Spoiler(title='Gain Stabilization')
+        self.drift_layout = QtWidgets.QGridLayout()
+
+        # create track/correct buttons and status labels
+        self.track_btn = QtWidgets.QPushButton('Track ROI\'s')
+        self.correct_btn = QtWidgets.QPushButton('Correct')
+        self.track_btn.setCheckable(True)
+        self.correct_btn.setCheckable(True)
+        self.correct_btn.setEnabled(False)
+        self.gain_lbl = QtWidgets.QLabel()
+        self.drift_lbl = QtWidgets.QLabel()
+        self.gain_lbl.setAlignment(QtCore.Qt.AlignRight)
+        self.drift_lbl.setAlignment(QtCore.Qt.AlignRight)
+
+        # add response functions for buttons; the ROI's marked when
+        # tracking starts are the reference peaks
+        def track_toggle(checked):
+            if checked:
+                self.drift.set_references(zip(*mask_rois(self.roi_mask)))
+            else:
+                self.drift.set_references([])
+                self.correct_btn.setChecked(False)
+            self.correct_btn.setEnabled(checked)
+            self.update_drift()
+        def correct_toggle(checked):
+            self.correcting = checked
+            self.index = None
+            self.plot.update(self.chans, self.display_counts(),\
+                self.roi_mask, self.mode)
+            self.fit_rois()
+        self.track_btn.toggled.connect(track_toggle)
+        self.correct_btn.toggled.connect(correct_toggle)
+
+        # layout gain stabilization widgets
+        self.drift_layout.addWidget(self.track_btn, 0, 0)
+        self.drift_layout.addWidget(self.correct_btn, 0, 1)
+        self.drift_layout.addWidget(QtWidgets.QLabel('Gain: '), 1, 0)
+        self.drift_layout.addWidget(QtWidgets.QLabel('Drift: '), 2, 0)
+        self.drift_layout.addWidget(self.gain_lbl, 1, 1)
+        self.drift_layout.addWidget(self.drift_lbl, 2, 1)
+        self.drift_grp.setContentLayout(self.drift_layout)
+
+    def update_drift(self):
+        if not self.drift.peaks:
+            self.gain_lbl.setText('')
+            self.drift_lbl.setText('')
+            self.drift_grp.setStyleSheet('')
+            return
+        self.gain_lbl.setText('{0:+.2f} %'.format(100*(self.drift.gain - 1)))
+        self.drift_lbl.setText('{0:+.2f} %/h'.format(100*self.drift.rate))
+
+        # alert on the drift thresholds
+        if self.drift.alerts:
+            self.drift_grp.setStyleSheet('QLabel{{color: {0}}}'.format(\
+                self.red))
+        else:
+            self.drift_grp.setStyleSheet('')
+
+    def display_counts(self):
+        # spectrum as displayed and saved, gain corrected when enabled
+        if self.correcting:
+            return self.drift.correct(self.counts)
+        return self.counts
+
+    def apply_settings(self):
+        # show settings changed underneath, e.g. by a profile import
+        self.sample.setText(str(self.settings.value('sample', '')))
+        for n in range(1, 4):
+            chan = self.settings.value('chan{}'.format(n), 0)
+            energy = self.settings.value('energy{}'.format(n), 0)
+            getattr(self, 'chan{}_txt'.format(n)).setText(\
+                str(chan) if chan else '')
+            getattr(self, 'energy{}_txt'.format(n)).setText(\
+                '{0:.2f}'.format(energy) if energy else '')
+        units = self.settings.value('units', 'keV')
+        self.units_txt.setText('' if units == 'keV' else units)
+        self.calib_timer.stop()
+        self.update_calib()
+
+    def update_calib(self):
+        # fit the calibration boxes and save them with the result in one go
+        self.calib.fit([self.chan1, self.chan2, self.chan3],\
+            [self.energy1, self.energy2, self.energy3])
+        for key in ('chan1', 'chan2', 'chan3', 'energy1', 'energy2',\
+                'energy3'):
+            if getattr(self, key) == 0:
+                self.settings.remove(key)
+            else:
+                self.settings.setValue(key, getattr(self, key))
+        self.set_calib()
+
+    def set_calib(self):
+        self.calibrated = self.calib.calibrated
+        self.a, self.b, self.c = self.calib.abc()
+        self.settings.setValue('calibrated', self.calibrated)
+        self.settings.setValue('a', self.a)
+        self.settings.setValue('b', self.b)
+        self.settings.setValue('c', self.c)
+        if self.calib.fwhm_coeffs is not None:
+            self.settings.setValue('fwhm', self.calib.fwhm_coeffs.tolist())
+
+        # update marker info label
+        self.update_marker()
+
+    def update_mcb(self, redraw=True):
+        if self.hdet is None:
+            return
+
+        # in ROI monitor mode only the windows covering ROI's are read, and
+        # the whole spectrum every full_every updates
+        full = not self.monitor or self.full_countdown <= 0 or\
+            not self.windows
+        if full:
+            self.counts, self.roi_mask = self.get_data()
+            self.windows = coalesce_windows(*mask_rois(self.roi_mask))
+            self.full_countdown = self.full_every
+        else:
+            self.read_windows(self.windows, self.counts, self.roi_mask)
+        self.full_countdown -= 1
 
-        # update plot
-        self.plot.update(self.chans, self.counts, self.roi_mask, self.mode)
+        self.index = None
 
-        # fit ROI's
-        self.popts = self.plot.fit_roi(self.get_roi(), self.calibrated, self.a,\
-            self.b, self.c)
+        # follow the reference peaks in the counts gained while counting
+        if self.active and self.drift.update(self.counts):
+            self.update_drift()
+
+        # update plot and fit ROI's (skipped while the panel is not shown)
+        if redraw:
+            self.plot.update(self.chans, self.display_counts(),\
+                self.roi_mask, self.mode)
+            self.fit_rois()
 
         # enable/disable data buttons and preset boxes
         old_state = self.active
         self.active = self.is_active()
         state_changed = (self.active != old_state)
 
+        # counting may have stopped after the counts above were read, so a
+        # run that ended at its preset is read again before it is reported
+        preset_reached = False
+        if state_changed and not self.active:
+            real = self.get_real()
+            live = self.get_live()
+            preset_reached = (self.rpre > 0 and real >= self.rpre) or\
+                (self.lpre > 0 and live >= self.lpre)
+            if preset_reached:
+                self.counts, self.roi_mask = self.get_data()
+                self.windows = coalesce_windows(*mask_rois(self.roi_mask))
+                self.index = None
+
         if state_changed:
-            if self.active:
-                self.disable_btn(self.start_btn)
-                self.enable_btn(self.stop_btn)
-    
-                self.rpre_txt.setReadOnly(True)
-                self.lpre_txt.setReadOnly(True)
-            else:
-                self.enable_btn(self.start_btn)
-                self.disable_btn(self.stop_btn)
-    
-                self.rpre_txt.setReadOnly(False)
-                self.lpre_txt.setReadOnly(False)
+            self.show_active()
 
         # update timing
         self.start_datetime = datetime.fromtimestamp(\
             self.driver.get_start_time(self.hdet))
         self.start_time_str = self.start_datetime.strftime('%I:%M:%S %p')
         self.start_date_str = self.start_datetime.strftime('%m/%d/%Y')
-        old_real = self.real
         self.real = self.get_real()
         self.real_str = '{0:.2f}'.format(self.real / 1000)
-        old_live = self.live
         self.live = self.get_live()
         self.live_str = '{0:.2f}'.format(self.live / 1000)
 
+        # dead time and count rate over the last few full reads
+        if self.active and full:
+            self.rates.update(self.real, self.live, self.counts,\
+                self.roi_mask)
+        elif not self.active:
+            self.rates.reset()
+        # spectrum history for the waterfall, only while counting and from
+        # full reads (in ROI monitor mode the rest of the spectrum is only
+        # brought up to date by those)
         if self.active:
-            self.dreals.append(self.real - old_real)
-            self.dreals.popleft()
-            dreal = sum(self.dreals)
-            self.dlives.append(self.live - old_live)
-            self.dlives.popleft()
-            dlive = sum(self.dlives)
-            if dreal > dlive:
-                self.dead = (1 - dlive/dreal) * 100
-                self.dead_str = '{0:.2f} %'.format(self.dead)
-            else:
-                self.dead = 0
-                self.dead_str = '%'
+            if state_changed:
+                self.waterfall.rebase()
+            if full:
+                self.waterfall.push(self.counts)
+                if redraw and not self.waterfall.isHidden():
+                    self.waterfall.redraw()
+
+        if self.rates.ready():
+            self.dead = self.rates.dead
+            self.dead_str = '{0:.2f} %'.format(self.dead)
+            self.rate_str = '{0:.1f} cps'.format(self.rates.output_rate)
         else:
             self.dead = 0
             self.dead_str = '%'
+            self.rate_str = 'cps'
 
         self.start_time_lbl.setText(self.start_time_str)
         self.start_date_lbl.setText(self.start_date_str)
         self.real_lbl.setText(self.real_str)
         self.live_lbl.setText(self.live_str)
         self.dead_lbl.setText(self.dead_str)
+        self.rate_lbl.setText(self.rate_str)
 
         # update line info label
-        self.update_marker()
+        if redraw:
+            self.update_marker()
+
+        if preset_reached:
+            self.sigPresetReached.emit(self)
+
+    def guard(self, action, *args):
+        # run an MCB action, returning False if it failed after the driver's
+        # retries; failures are reported once, until the MCB answers again
+        try:
+            action(*args)
+        except MCBError as err:
+            if not self.failing:
+                self.failing = True
+                log.warning('%s: %s', self.title, err)
+                self.label.setText(self.title + ' (error)')
+            return False
+        if self.failing:
+            self.failing = False
+            log.info('%s: recovered', self.title)
+            self.label.setText(self.title)
+        return True
+
+    def show_active(self):
+        # data buttons and preset boxes follow the active state
+        if self.active:
+            self.disable_btn(self.start_btn)
+            self.enable_btn(self.stop_btn)
+
+            self.rpre_txt.setReadOnly(True)
+            self.lpre_txt.setReadOnly(True)
+        else:
+            self.enable_btn(self.start_btn)
+            self.disable_btn(self.stop_btn)
+
+            self.rpre_txt.setReadOnly(False)
+            self.lpre_txt.setReadOnly(False)
 
     def update_marker(self):
         # get marker line channel and counts
@@ -832,8 +1105,9 @@ class MCBWidget(QtWidgets.QGroupBox):
 
         # if calibrated, set energy label
         if self.calibrated:
-            self.calib_lbl.setText('{0:.2f} {1}'.format(self.a*self.line_x**2 +\
-                self.b*self.line_x + self.c, self.units))
+            chan = int(self.line_x * self.chan_max / self.chans)
+            self.calib_lbl.setText('{0:.2f} {1}'.format(\
+                self.calib.energies()[chan], self.units))
         else:
             self.calib_lbl.setText('uncalibrated')
 
@@ -841,8 +1115,8 @@ class MCBWidget(QtWidgets.QGroupBox):
         chan = self.line_x * self.chan_max / self.chans
         nroi = self.get_nroi(chan)
 
-        # if in an ROI, set fit labels
-        if nroi is not None:
+        # if in an ROI, set fit labels (fits may still be on their way)
+        if nroi is not None and nroi < len(self.popts):
             popt = self.popts[nroi]
             try:
                 self.mu_chan_lbl.setText('{0:.2f} ± {1:.2f}'\
@@ -866,11 +1140,100 @@ class MCBWidget(QtWidgets.QGroupBox):
             else:
                 self.mu_energy_lbl.setText('uncalibrated')
                 self.sig_energy_lbl.setText('uncalibrated')
+
+            # best library line, ranked by how many of its lines are found
+            if len(self.peak_ids[nroi]) > 0:
+                name, energy, score = self.peak_ids[nroi][0]
+                self.nuclide_lbl.setText('{0} ({1:.2f} keV)'.format(name,\
+                    energy))
+            elif self.calibrated:
+                self.nuclide_lbl.setText('unknown')
+            else:
+                self.nuclide_lbl.setText('uncalibrated')
         else:
             self.mu_chan_lbl.setText('')
             self.mu_energy_lbl.setText('')
             self.sig_chan_lbl.setText('')
             self.sig_energy_lbl.setText('')
+            self.nuclide_lbl.setText('')
+
+        # counts in the dragged box follow the spectrum
+        self.update_region()
+
+    def region_index(self):
+        if self.index is None:
+            self.index = RegionIndex(self.display_counts())
+        return self.index
+
+    def region(self, lo, hi):
+        # gross/net counts, centroid and rates of channels [lo, hi)
+        return self.region_index().region(lo, hi, live=self.live)
+
+    def energy_region(self, e0, e1):
+        if not self.calibrated:
+            return None
+        return self.region_index().energy_region(e0, e1,\
+            self.calib.energies(), self.live)
+
+    def update_region(self):
+        box = self.plot.box()
+        if not box.visible:
+            self.region_lbl.setText('')
+            return
+
+        # box edges are in plotted (rebinned) channels
+        x0 = box.pos().x()
+        x1 = x0 + box.size().x()
+        factor = self.chan_max // self.chans
+        region = self.region_index().region(x0, x1, factor, self.live)
+        text = 'Region: {0:.0f} gross, {1:.0f} ± {2:.0f} net'.format(\
+            region['gross'], region['net'], region['net_err'])
+        if region['centroid'] is not None:
+            text += ', centroid {0:.2f}'.format(region['centroid'])
+            if self.calibrated:
+                text += ' ({0:.2f} {1})'.format(self.calib.energy(\
+                    (region['centroid'] + 0.5) * factor - 0.5), self.units)
+        if region['rate'] is not None:
+            text += ', {0:.1f} cps'.format(region['rate'])
+        self.region_lbl.setText(text)
+
+    def fit_rois(self):
+        rois = self.get_roi()
+        energies = self.calib.energies() if self.calibrated else None
+        cache = None if self.active else self.cache
+        if self.fitter is None:
+            self.popts = self.plot.fit_roi(rois, energies, cache)
+            self.peak_ids = self.identify_peaks()
+        else:
+            self.fitter.submit(self, self.plot.fit_job(rois, energies,\
+                cache), self.fitted)
+
+    def fitted(self, result):
+        # fit of the latest snapshot, delivered by the FitService
+        self.popts, fit_chans, fit_counts = result
+        self.plot.set_fit(fit_chans, fit_counts)
+        self.peak_ids = self.identify_peaks()
+        self.update_marker()
+
+    def identify_peaks(self):
+        # match fitted ROI centroids against the nuclide library
+        factor = unit_factors.get(self.units)
+        if not self.calibrated or factor is None:
+            return [[] for popt in self.popts]
+        energies = np.full(len(self.popts), np.nan)
+        tols = np.zeros(len(self.popts))
+        for n, popt in enumerate(self.popts):
+            if popt['mu_energy_opt'] is not None and\
+                    popt['sig_energy_opt'] is not None:
+                energies[n] = popt['mu_energy_opt'] * factor
+                fwhm = self.calib.fwhm_energy(popt['mu_chan_opt'])
+                if fwhm is None:
+                    fwhm = 2 * abs(popt['sig_energy_opt'])
+                tols[n] = fwhm * factor
+        emin = self.calib.energies()[0] * factor
+        emax = self.calib.energies()[-1] * factor
+        return default_library.identify(energies, tols, min(emin, emax),\
+            max(emin, emax))
 
     def keyPressEvent(self, event):
         if event.key() == QtCore.Qt.Key_Left:
@@ -901,9 +1264,6 @@ class MCBWidget(QtWidgets.QGroupBox):
                 return i
         return None
 
-    def is_active(self):
-        return self.driver.is_active(self.hdet)
-
     def start(self):
         self.driver.comm(self.hdet, 'START')
         self.start_time = datetime.fromtimestamp(\
@@ -916,90 +1276,96 @@ class MCBWidget(QtWidgets.QGroupBox):
 
     def clear(self):
         self.driver.comm(self.hdet, 'CLEAR')
+        self.full_countdown = 0
         self.update()
 
-    def get_data(self):
-        return self.driver.get_data(self.hdet, 0, self.chan_max)
-
-    def get_real(self):
-        resp = self.driver.comm(self.hdet, 'SHOW_TRUE')
-        msec = int(resp[2:-4]) * 20
-        return msec
-
-    def get_live(self):
-        resp = self.driver.comm(self.hdet, 'SHOW_LIVE')
-        msec = int(resp[2:-4]) * 20
-        return msec
-
-    def get_real_preset(self):
-        resp = self.driver.comm(self.hdet, 'SHOW_TRUE_PRESET')
-        msec = int(resp[2:-4]) * 20
-        return msec
-
-    def get_live_preset(self):
-        resp = self.driver.comm(self.hdet, 'SHOW_LIVE_PRESET')
-        msec = int(resp[2:-4]) * 20
-        return msec
-
-    def get_gate(self):
-        resp = self.driver.comm(self.hdet, 'SHOW_GATE')
-        index = self.gate_index[resp[3:-1]]
-        return index
-
-    def get_lld(self):
-        resp = self.driver.comm(self.hdet, 'SHOW_LLD')
-        lld = int(resp[2:-4])
-        return lld
-
-    def get_uld(self):
-        resp = self.driver.comm(self.hdet, 'SHOW_ULD')
-        uld = int(resp[2:-4])
-        return uld
-
-    def get_roi(self):
-        rois = []
-        resp = self.driver.comm(self.hdet, 'SHOW_ROI')
-        while int(resp[7:12]) > 0:
-            rois.append((int(resp[2:7]), int(resp[7:12])))
-            resp = self.driver.comm(self.hdet, 'SHOW_NEXT')
-        return rois
-
-    def set_data(self, start_chan, num_chans=1, value=0):
-        self.driver.comm(self.hdet, 'SET_DATA {}, {}, {}'.format(start_chan,\
-            num_chans, value))
-
-    def set_real(self, msec):
-        ticks = int(msec / 20)
-        self.driver.comm(self.hdet, 'SET_TRUE {}'.format(ticks))
-
-    def set_live(self, msec):
-        ticks = int(msec / 20)
-        self.driver.comm(self.hdet, 'SET_LIVE {}'.format(ticks))
-
-    def set_real_preset(self, msec):
-        ticks = int(msec / 20)
-        self.driver.comm(self.hdet, 'SET_TRUE_PRESET {}'.format(ticks))
-
-    def set_live_preset(self, msec):
-        ticks = int(msec / 20)
-        self.driver.comm(self.hdet, 'SET_LIVE_PRESET {}'.format(ticks))
-
-    def set_gate(self, index):
-        options = ['OFF', 'COINCIDENT', 'ANTICOINCIDENT']
-        self.driver.comm(self.hdet, 'SET_GATE_{}'.format(options[index]))
-
-    def set_lld(self, disc):
-        self.driver.comm(self.hdet, 'SET_LLD {}'.format(disc))
-
-    def set_uld(self, disc):
-        self.driver.comm(self.hdet, 'SET_ULD {}'.format(disc))
-
-    def set_roi(self, start_chan, num_chans):
-        self.driver.comm(self.hdet, 'SET_ROI {}, {}'.format(start_chan,\
-            num_chans))
-
-    def clear_roi(self, start_chan, num_chans):
-        self.driver.comm(self.hdet, 'SET_WINDOW {}, {}'.format(start_chan,\
-            num_chans))
-        self.driver.comm(self.hdet, 'CLEAR_ROI')
-        self.driver.comm(self.hdet, 'SET_WINDOW')
\ No newline at end of file
+    def spectrum(self):
+        return Spectrum(self.display_counts(), live=self.live,\
+            real=self.real, sample=self.sample.text(), det_id=self.id,\
+            det_name=self.name, start=self.start_datetime,\
+            rois=self.get_roi(), lpre=self.lpre, rpre=self.rpre,\
+            calib=(self.a, self.b, self.c), units=self.units)
+
+    def snapshot(self):
+        # spectrum as of the last update from memory only: counts, ROI's and
+        # times are all from the same update and the counts are copied, so
+        # it can be written in another thread while counting goes on
+        return Spectrum(np.array(self.display_counts()), live=self.live,\
+            real=self.real, sample=self.sample.text(), det_id=self.id,\
+            det_name=self.name, start=self.start_datetime,\
+            rois=ROISet.from_mask(self.roi_mask).rois(), lpre=self.lpre,\
+            rpre=self.rpre, calib=(self.a, self.b, self.c), units=self.units)
+
+    def load_roi_set(self, path):
+        self.apply_rois(ROISet.load(path), ROISet.from_mask(self.roi_mask))
+        self.full_countdown = 0
+
+    def load_spectrum(self, spec):
+        # make sure channels match
+        assert len(spec.counts) == self.chan_max,\
+            'File and MCB have different channels'
+        self.waterfall.rebase()
+
+        # set sample description
+        self.sample.setText(spec.sample)
+
+        # set live/real time
+        self.set_live(spec.live)
+        self.set_real(spec.real)
+
+        # set data, one command per run of equal counts
+        counts = np.rint(spec.counts).astype(np.int64)
+        starts = np.flatnonzero(np.diff(counts, prepend=counts[0]-1))
+        ends = np.append(starts[1:], len(counts))
+        for start_chan, end_chan in zip(starts.tolist(), ends.tolist()):
+            self.set_data(start_chan, end_chan-start_chan, counts[start_chan])
+
+        # set ROI's, only changing those that differ
+        self.apply_rois(ROISet.from_rois(spec.rois),\
+            ROISet.from_mask(self.roi_mask))
+        self.full_countdown = 0
+
+        # set presets
+        if spec.lpre > 0:
+            self.lpre_txt.setText('{0:.2f}'.format(spec.lpre / 1000))
+        else:
+            self.lpre_txt.setText('')
+        if spec.rpre > 0:
+            self.rpre_txt.setText('{0:.2f}'.format(spec.rpre / 1000))
+        else:
+            self.rpre_txt.setText('')
+
+        # load sample points to match calibration
+        a, b, c = spec.calib
+        if a == 0:
+            if c == 0: # only one point is needed
+                self.chan1_txt.setText('1000')
+                self.energy1_txt.setText('{0:.4f}'.format(b*1000))
+                self.chan2_txt.setText('')
+                self.energy2_txt.setText('')
+                self.chan3_txt.setText('')
+                self.energy3_txt.setText('')
+            else: # only two points are needed
+                self.chan1_txt.setText('1000')
+                self.energy1_txt.setText('{0:.4f}'.format(b*1000 + c))
+                self.chan2_txt.setText('2000')
+                self.energy2_txt.setText('{0:.4f}'.format(b*2000 + c))
+                self.chan3_txt.setText('')
+                self.energy3_txt.setText('')
+        else: # all three points are needed
+            self.chan1_txt.setText('500')
+            self.energy1_txt.setText('{0:.4f}'.format(a*500**2 + b*500 + c))
+            self.chan2_txt.setText('1000')
+            self.energy2_txt.setText('{0:.4f}'.format(a*1000**2 + b*1000 +\
+                c))
+            self.chan3_txt.setText('1500')
+            self.energy3_txt.setText('{0:.4f}'.format(a*1500**2 + b*1500 +\
+                c))
+
+        # apply the calibration now rather than after the typing pause
+        self.calib_timer.stop()
+        self.update_calib()
+        if spec.units == 'keV':
+            self.units_txt.setText('')
+        else:
+            self.units_txt.setText(spec.units)
\ No newline at end of file
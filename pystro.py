@@ -1,6 +1,11 @@
 from pystrowidget import PySTROWidget
 from PyQt5 import QtWidgets
 import pyqtgraph as pg
+import logging
+
+# detector errors, failed saves and the like are reported here
+logging.basicConfig(level=logging.INFO,\
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
 
 # set background and foreground colors
 pg.setConfigOption('background', (223, 223, 223))
@@ -12,6 +17,9 @@ app.setStyle('fusion')
 pystrowidget = PySTROWidget()
 pystrowidget.setWindowTitle('Pystro')
 pystrowidget.showMaximized()
+
+# write spectra still queued before quitting
+app.aboutToQuit.connect(pystrowidget.writer.close)
 # pystrowidget.show()
 
 app.exec_()
\ No newline at end of file
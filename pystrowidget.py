@@ -1,8 +1,21 @@
-from mcbdriver import MCBDriver
+from mcbbackend import get_driver, default_backend
+from mcbrecord import MCBRecorder
 from mcbwidget import MCBWidget
+from mcbinventory import InventoryLoader, discover, inventory_entry
+from mcbfitter import FitService
+from mcbautosave import SpectrumWriter, save_path
+from mcbcatalog import SpectrumCatalog, default_path
+from mcbcache import AnalysisCache
+from mcboverview import MCBOverview
+from mcbspectrum import read_spe
+from mcbroi import ROISet
+from mcbsettings import SettingsStore
 from PyQt5 import QtWidgets, QtGui, QtCore
 import numpy as np
-import os.path
+import logging
+import os
+
+log = logging.getLogger(__name__)
 
 class PySTROWidget(QtWidgets.QWidget):
     gray = '#cccccc'
@@ -12,28 +25,59 @@ class PySTROWidget(QtWidgets.QWidget):
         self.layout = QtWidgets.QVBoxLayout()
         self.setLayout(self.layout)
 
-        # initialize driver and get number of MCBs
-        self.driver = MCBDriver()
+        # load station and detector settings in one read
+        self.store = SettingsStore()
+        self.settings = self.store.group('')
+
+        # initialize driver backend chosen by $PYSTRO_BACKEND or settings
+        self.driver = get_driver(os.environ.get('PYSTRO_BACKEND',\
+            self.settings.value('backend', default_backend)))
+
+        # optionally record all driver traffic for offline replay
+        if os.environ.get('PYSTRO_RECORD'):
+            self.driver = MCBRecorder(self.driver, os.environ['PYSTRO_RECORD'])
 
         # get neutral button color
         self.get_neutral_color()
 
+        # ROI fits of all detectors run on one bounded worker pool, and
+        # results on unchanging spectra are kept on disk between sessions
+        self.fitter = FitService()
+        self.cache = AnalysisCache()
+
+        # spectra are written by a background thread from snapshots
+        self.writer = SpectrumWriter()
+        self.writer.sigFailed.connect(self.save_failed)
+
+        # spectra saved or opened here are indexed for search
+        self.catalog = SpectrumCatalog(self.settings.value('catalog',\
+            default_path), self.cache)
+        self.writer.sigSaved.connect(self.catalog_add)
+
         # initialize sections of PySTROWidget
         self.init_mcb_grp()
         self.init_file_grp()
         self.init_data_grp()
+        self.init_view_grp()
 
         # layout widgets
         self.top_layout = QtWidgets.QHBoxLayout()
         self.bottom_layout = QtWidgets.QVBoxLayout()
 
         self.layout.addLayout(self.top_layout)
-        self.layout.addLayout(self.bottom_layout)
+        self.layout.addWidget(self.stack)
 
         self.top_layout.addWidget(self.file_grp)
         self.top_layout.addWidget(self.data_grp)
+        self.top_layout.addWidget(self.view_grp)
         self.top_layout.addWidget(QtWidgets.QWidget(), 10)
 
+        # full MCB panels and the overview share the bottom of the window
+        self.panels = QtWidgets.QWidget()
+        self.panels.setLayout(self.bottom_layout)
+        self.stack.addWidget(self.panels)
+        self.stack.addWidget(self.overview)
+
         for mcb in self.mcbs:
             self.bottom_layout.addWidget(mcb)
 
@@ -54,12 +98,57 @@ class PySTROWidget(QtWidgets.QWidget):
             btn_color.red(), btn_color.green(), btn_color.blue())
 
     def init_mcb_grp(self):
-        self.det_max = self.driver.get_config_max()
-
-        # connect with MCBs and _layout MCBWidgets
+        # with the detector inventory of the last session the panels come up
+        # straight away and the MCBs are opened in the background; without
+        # one all MCBs are opened in parallel before the window shows
+        self.inventory = self.settings.value('inventory')
         self.mcbs = []
-        for n in range(self.det_max):
-            self.mcbs.append(MCBWidget(self.driver, ndet=n+1))
+        if self.inventory:
+            for entry in self.inventory:
+                self.mcbs.append(MCBWidget(self.driver, entry['ndet'],\
+                    store=self.store, info=entry, fitter=self.fitter,\
+                    cache=self.cache))
+            self.loader = InventoryLoader(self.driver)
+            self.loader.sigProbed.connect(self.mcb_probed)
+            self.loader.sigFailed.connect(self.mcb_failed)
+            self.loader.sigFinished.connect(self.inventory_found)
+            self.loader.start()
+        else:
+            infos = discover(self.driver)
+            for info in infos:
+                self.mcbs.append(MCBWidget(self.driver, info['ndet'],\
+                    store=self.store, info=info, fitter=self.fitter,\
+                    cache=self.cache))
+            self.inventory_found([inventory_entry(info) for info in infos])
+        self.det_max = len(self.mcbs)
+        for mcb in self.mcbs:
+            mcb.sigPresetReached.connect(self.preset_reached)
+
+    def mcb_probed(self, info):
+        # a detector answered: hand it to its panel unless the station has
+        # changed since the inventory was saved
+        entry = inventory_entry(info)
+        for mcb in self.mcbs:
+            if mcb.ndet == entry['ndet']:
+                if (mcb.name, mcb.id, mcb.chan_max) == (entry['name'],
+                        entry['id'], entry['chan_max']):
+                    mcb.attach(info)
+                else:
+                    mcb.label.setText(mcb.title + ' (changed, restart)')
+                return
+
+    def mcb_failed(self, ndet, err):
+        log.warning('MCB %s: %s', ndet, err)
+        for mcb in self.mcbs:
+            if mcb.ndet == ndet:
+                mcb.label.setText(mcb.title + ' (unavailable)')
+
+    def inventory_found(self, inventory):
+        # the panels follow the new inventory from the next start
+        if self.inventory and inventory != self.inventory:
+            log.warning('Detector inventory changed, restart to update the '\
+                'panels')
+        self.settings.setValue('inventory', inventory)
 
     def init_file_grp(self):
         # create a group for file i/o buttons
@@ -87,194 +176,112 @@ class PySTROWidget(QtWidgets.QWidget):
             nmcb = self.mcb_box.currentIndex()
             mcb = self.mcbs[nmcb]
             file_name, file_type  = QtGui.QFileDialog.getOpenFileName(self,\
-                'Open File', filter='ASCII (*.Spe);;All Files (*)')
+                'Open File', filter='ASCII (*.Spe);;ROI List (*.Roi);;' +\
+                'All Files (*)')
             try:
-                file = open(file_name, 'r')
-                lines = file.readlines()
-
-                # get sample description
-                if lines[1][:-1] != 'No sample description was entered.':
-                    mcb.sample.setText(lines[1][:-1])
-                else:
-                    mcb.sample.setText('')
-
-                # get live/real time
-                live, real = map(int, lines[9].split(' '))
-                mcb.set_live(live * 1000)
-                mcb.set_real(real * 1000)
-
-                # make sure channels match
-                first_chan, last_chan = map(int, lines[11].split(' '))
-                chan_max = mcb.chan_max
-                assert last_chan+1 == chan_max,\
-                    'File and MCB have different channels'
-
-                # get data
-                for i in range(chan_max):
-                    mcb.set_data(start_chan=i, value=int(lines[12+i]))
-
-                # get ROI's
-                mcb.clear_roi(0, chan_max)
-                nrois = int(lines[13+chan_max][:-1])
-                for i in range(nrois):
-                    first_chan, last_chan = map(int, lines[14+chan_max+i]\
-                        .split(' '))
-                    mcb.set_roi(first_chan, last_chan-first_chan+1)
-
-                # get presets
-                pre_type = lines[15+chan_max+nrois]
-                if pre_type == 'Live Time\n':
-                    mcb.lpre_txt.setText(lines[16+chan_max+nrois][:-1] + '.00')
-                    if lines[17+chan_max+nrois][:-1] == '0':
-                        mcb.rpre_txt.setText('')
-                    else:
-                        mcb.rpre_txt.setText(lines[17+chan_max+nrois][:-1] +\
-                            '.00')
-                elif pre_type == 'Real Time\n':
-                    mcb.rpre_txt.setText(lines[16+chan_max+nrois][:-1] + '.00')
-                    if lines[17+chan_max+nrois][:-1] == '0':
-                        mcb.lpre_txt.setText('')
-                    else:
-                        mcb.lpre_txt.setText(lines[17+chan_max+nrois][:-1] +\
-                            '.00')
-                else:
-                    mcb.lpre_txt.setText('')
-                    mcb.rpre_txt.setText('')
-
-                # get calibration
-                c, b, a, units = lines[22+chan_max+nrois].split(' ')
-                a = float(a)
-                b = float(b)
-                c = float(c)
-                units = units[:-1]
-                # load sample points to match opened calibration
-                if a == 0:
-                    if c == 0: # only one point is needed
-                        mcb.chan1_txt.setText('1000')
-                        mcb.energy1_txt.setText('{0:.4f}'.format(b*1000))
-                        mcb.chan2_txt.setText('')
-                        mcb.energy2_txt.setText('')
-                        mcb.chan3_txt.setText('')
-                        mcb.energy3_txt.setText('')
-                    else: # only two points are needed
-                        mcb.chan1_txt.setText('1000')
-                        mcb.energy1_txt.setText('{0:.4f}'.format(b*1000 + c))
-                        mcb.chan2_txt.setText('2000')
-                        mcb.energy2_txt.setText('{0:.4f}'.format(b*2000 + c))
-                        mcb.chan3_txt.setText('')
-                        mcb.energy3_txt.setText('')
-                else: # all three points are needed
-                    mcb.chan1_txt.setText('500')
-                    mcb.energy1_txt.setText('{0:.4f}'.format(a*500**2 + b*500\
-                        + c))
-                    mcb.chan2_txt.setText('1000')
-                    mcb.energy2_txt.setText('{0:.4f}'.format(a*1000**2 + b*1000\
-                        + c))
-                    mcb.chan3_txt.setText('1500')
-                    mcb.energy3_txt.setText('{0:.4f}'.format(a*1500**2 + b*1500\
-                        + c))
-                if units == 'keV':
-                    mcb.units_txt.setText('')
+                if file_name.lower().endswith('.roi'):
+                    mcb.load_roi_set(file_name)
                 else:
-                    mcb.units_txt.setText(units)
-
-                file.close()
-
-                # update line info
-                mcb.line_x = int(mcb.line.value())
-                mcb.line_y = mcb.rebin[mcb.line_x]
-
-                mcb.line_x_lbl.setText(str(mcb.line_x))
-                mcb.line_y_lbl.setText(str(mcb.line_y))
+                    spec = read_spe(file_name)
+                    mcb.load_spectrum(spec)
+                    self.catalog_add(file_name, spec)
             except:
                 pass
         def save_click():
             nmcb = self.mcb_box.currentIndex()
             mcb = self.mcbs[nmcb]
             file_name, file_type = QtGui.QFileDialog.getSaveFileName(self,\
-                'Save File', filter='ASCII (*.Spe);;All Files (*)')
+                'Save File', filter='ASCII (*.Spe);;ROI List (*.Roi);;' +\
+                'All Files (*)')
             try:
-                file = open(file_name, 'w')
-
-                # write sample description
-                file.write('$SPEC_ID:\n')
-                sample = mcb.sample.text()
-                if sample == '':
-                    file.write('No sample description was entered.\n')
-                else:
-                    file.write(sample + '\n')
-                file.write('$SPEC_REM:\n')
-
-                # write MCB ID and name
-                file.write('DET# ' + str(mcb.id) + '\n' +\
-                    'DETDESC# ' + mcb.name + '\n')
-
-                # write start date and time
-                file.write(('AP# Pystro\n' +\
-                    '$DATE_MEA:\n' +\
-                    mcb.start_datetime.strftime('%m/%d/%Y %H:%M:%S') + '\n'))
-
-                # write live/real time
-                file.write('$MEAS_TIM:\n' +\
-                    '{} {}\n'.format(int(mcb.live / 1000),\
-                    int(mcb.real / 1000)))
-
-                # write number of channels
-                file.write('$DATA:\n' +\
-                    '0 ' + str(mcb.chan_max-1) + '\n')
-
-                # write data
-                for i in range(mcb.chan_max):
-                    file.write(str(int(mcb.counts[i])).rjust(8) + '\n')
-
-                # write number of ROI's
-                rois = mcb.get_roi()
-                file.write('$ROI:\n' +\
-                    '{} \n'.format(len(rois)))
-
-                # write ROI's
-                for roi in rois:
-                    file.write(str(roi[0]) + ' ' + str(roi[0]+roi[1]-1) + '\n')
-
-                # write presets
-                file.write('$PRESETS:\n')
-                if mcb.lpre == 0 and mcb.rpre == 0:
-                    file.write('None\n' +\
-                    '0\n' +\
-                    '0\n')
-                elif mcb.rpre == 0 or mcb.lpre > mcb.rpre:
-                    file.write('Live Time\n' +\
-                    '{}\n'.format(int(mcb.lpre / 1000)) +\
-                    '{}\n'.format(int(mcb.rpre / 1000)))
-                else:
-                    file.write('Real Time\n' +\
-                    '{}\n'.format(int(mcb.rpre / 1000)) +\
-                    '{}\n'.format(int(mcb.lpre / 1000)))
-
-                # write calibration
-                file.write('$ENER_FIT:\n' +\
-                    '{0:.6f} {1:.6f}\n'.format(mcb.c, mcb.b) +\
-                    '$MCA_CAL:\n' +\
-                    '3\n' +\
-                    '{0:.6E} {1:.6E} {2:.6E} {3}\n'.format(mcb.c, mcb.b, mcb.a,\
-                        mcb.units))
-
-                # TODO: currently unsupported
-                file.write('$SHAPE_CAL:\n' +\
-                    '3\n' +\
-                    '0.000000E+000 0.000000E+000 0.000000E+000\n')
-
-                file.close()
+                if file_name.lower().endswith('.roi'):
+                    ROISet.from_mask(mcb.roi_mask).save(file_name)
+                elif file_name:
+                    self.writer.submit([(mcb.snapshot(), file_name)])
             except:
                 pass
         self.open_btn.clicked.connect(open_click)
         self.save_btn.clicked.connect(save_click)
 
+        # create save all and auto-save buttons
+        self.save_all_btn = QtWidgets.QPushButton('Save All')
+        self.autosave_btn = QtWidgets.QPushButton('Auto-save')
+        self.autosave_btn.setCheckable(True)
+        self.autosave_btn.setChecked(bool(self.settings.value('autosave')))
+
+        # add response functions for save all and auto-save buttons
+        def save_all_click():
+            out_dir = QtGui.QFileDialog.getExistingDirectory(self,\
+                'Save All', self.settings.value('save_dir', ''))
+            if out_dir:
+                self.settings.setValue('save_dir', out_dir)
+                self.save_all(out_dir)
+        def autosave_toggle(checked):
+            if checked and not self.settings.value('save_dir', ''):
+                out_dir = QtGui.QFileDialog.getExistingDirectory(self,\
+                    'Auto-save Folder')
+                if not out_dir:
+                    self.autosave_btn.setChecked(False)
+                    return
+                self.settings.setValue('save_dir', out_dir)
+            self.settings.setValue('autosave', checked)
+        self.save_all_btn.clicked.connect(save_all_click)
+        self.autosave_btn.toggled.connect(autosave_toggle)
+
+        # create station profile buttons
+        self.import_btn = QtWidgets.QPushButton('Import Profile')
+        self.export_btn = QtWidgets.QPushButton('Export Profile')
+
+        # add response functions for profile buttons
+        def import_click():
+            file_name, file_type  = QtGui.QFileDialog.getOpenFileName(self,\
+                'Import Profile', filter='Profile (*.json);;All Files (*)')
+            try:
+                self.store.import_profile(file_name)
+                for mcb in self.mcbs:
+                    mcb.apply_settings()
+            except:
+                pass
+        def export_click():
+            file_name, file_type = QtGui.QFileDialog.getSaveFileName(self,\
+                'Export Profile', filter='Profile (*.json);;All Files (*)')
+            try:
+                self.store.export_profile(file_name)
+            except:
+                pass
+        self.import_btn.clicked.connect(import_click)
+        self.export_btn.clicked.connect(export_click)
+
         # layout master data acq buttons
         self.file_layout.addWidget(QtWidgets.QLabel('MCB to Open/Save:'), 0, 0)
         self.file_layout.addWidget(self.mcb_box, 1, 0)
         self.file_layout.addWidget(self.open_btn, 0, 1, 2, 1)
         self.file_layout.addWidget(self.save_btn, 0, 2, 2, 1)
+        self.file_layout.addWidget(self.import_btn, 2, 0)
+        self.file_layout.addWidget(self.export_btn, 2, 1, 1, 2)
+        self.file_layout.addWidget(self.save_all_btn, 3, 0)
+        self.file_layout.addWidget(self.autosave_btn, 3, 1, 1, 2)
+
+    def save_all(self, out_dir):
+        # snapshot every connected detector in the same update and write
+        # them as one batch
+        self.writer.submit([(spec, save_path(out_dir, spec)) for spec in\
+            [mcb.snapshot() for mcb in self.mcbs if mcb.hdet is not None]])
+
+    def preset_reached(self, mcb):
+        if self.autosave_btn.isChecked():
+            out_dir = self.settings.value('save_dir', '')
+            spec = mcb.snapshot()
+            self.writer.submit([(spec, save_path(out_dir, spec))])
+
+    def save_failed(self, path, err):
+        log.error('Saving %s failed: %s', path, err)
+
+    def catalog_add(self, path, spec=None):
+        try:
+            self.catalog.add(path, spec)
+        except Exception as err:
+            log.warning('Cataloging %s failed: %s', path, err)
 
     def init_data_grp(self):
         # create a group for master data acq buttons
@@ -323,6 +330,44 @@ class PySTROWidget(QtWidgets.QWidget):
         self.start_btn.setStyleSheet(\
             'QLineEdit { background-color: #ffffff }')
 
+    def init_view_grp(self):
+        # create a group for switching between full panels and overview
+        self.view_grp = QtWidgets.QGroupBox('View')
+        self.view_layout = QtWidgets.QVBoxLayout()
+        self.view_grp.setLayout(self.view_layout)
+
+        self.stack = QtWidgets.QStackedWidget()
+        self.overview = MCBOverview(self.mcbs)
+
+        # create overview toggle button
+        self.overview_btn = QtWidgets.QPushButton('Overview')
+        self.overview_btn.setCheckable(True)
+
+        # add response functions for overview toggle and thumbnail clicks
+        def overview_toggle(checked):
+            if checked:
+                self.stack.setCurrentWidget(self.overview)
+            else:
+                for mcb in self.mcbs:
+                    mcb.show()
+                self.stack.setCurrentWidget(self.panels)
+            self.update_mcb()
+        def overview_select(nmcb):
+            # show only the selected MCB's full panel; the button is
+            # unchecked quietly since its toggle would show all panels again
+            self.overview_btn.blockSignals(True)
+            self.overview_btn.setChecked(False)
+            self.overview_btn.blockSignals(False)
+            for n, mcb in enumerate(self.mcbs):
+                mcb.setVisible(n == nmcb)
+            self.mcb_box.setCurrentIndex(nmcb)
+            self.stack.setCurrentWidget(self.panels)
+            self.update_mcb()
+        self.overview_btn.toggled.connect(overview_toggle)
+        self.overview.sigSelected.connect(overview_select)
+
+        self.view_layout.addWidget(self.overview_btn)
+
     def update_self(self):
         # enable/disable data buttons
         old_active = self.active_mcbs
@@ -343,9 +388,16 @@ class PySTROWidget(QtWidgets.QWidget):
                 self.enable_btn(self.stop_btn)
 
     def update_mcb(self):
-        # update mcb widgets
+        # update mcb widgets, only redrawing panels that are on screen
+        overview = self.stack.currentWidget() is self.overview
         for mcb in self.mcbs:
-            mcb.update_mcb()
+            # a detector that still fails after the driver's retries misses
+            # this update, the others carry on
+            mcb.guard(mcb.update_mcb, not overview and not mcb.isHidden())
+
+        # redraw all thumbnails in one pass
+        if overview:
+            self.overview.update_overview()
 
     def enable_btn(self, btn):
         btn.setEnabled(True)
@@ -357,7 +409,8 @@ class PySTROWidget(QtWidgets.QWidget):
 
     def start(self):
         for mcb in self.mcbs:
-            mcb.start()
+            if mcb.hdet is not None:
+                mcb.guard(mcb.start)
 
         # enable/disable data buttons
         old_active = self.active_mcbs
@@ -379,12 +432,14 @@ class PySTROWidget(QtWidgets.QWidget):
 
     def stop(self):
         for mcb in self.mcbs:
-            mcb.stop()
+            if mcb.hdet is not None:
+                mcb.guard(mcb.stop)
 
         self.update_self()
 
     def clear(self):
         for mcb in self.mcbs:
-            mcb.clear()
+            if mcb.hdet is not None:
+                mcb.guard(mcb.clear)
 
         self.update_self()
\ No newline at end of file
@@ -0,0 +1,19 @@
+from mcbdriver import MCBError
+from mcbdriver_test import MCBDriver
+from mcbrecord import MCBRecorder, MCBReplayDriver, MCBTraceMiss
+import pytest
+
+def test_replay_call_missing_from_trace(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    recorder = MCBRecorder(MCBDriver(), path)
+    hdet = recorder.open_detector(1)
+    resp = recorder.comm(hdet, 'SHOW_TRUE')
+    recorder.close()
+
+    replay = MCBReplayDriver(path, speed=0)
+    assert replay.open_detector(1) == hdet
+    assert replay.comm(hdet, 'SHOW_TRUE') == resp
+    with pytest.raises(MCBTraceMiss):
+        replay.is_active(hdet)
+    with pytest.raises(MCBError):
+        replay.comm(hdet, 'SHOW_LIVE')
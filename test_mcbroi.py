@@ -0,0 +1,20 @@
+from mcbroi import ROISet
+import numpy as np
+
+def test_empty_set_operations():
+    empty = ROISet()
+    rois = ROISet.from_rois([(100, 20), (300, 10)])
+    assert (empty | rois).rois() == rois.rois()
+    assert (rois | empty).rois() == rois.rois()
+    assert (rois - empty).rois() == rois.rois()
+    assert (empty - rois).rois() == []
+    assert (empty & rois).rois() == []
+    assert (empty | empty).rois() == []
+
+def test_commands_from_or_to_empty_set():
+    empty = ROISet()
+    rois = ROISet.from_rois([(100, 20)])
+    assert empty.commands(rois) == ['SET_ROI 100, 20']
+    assert rois.commands(empty) == ['SET_WINDOW 100, 20', 'CLEAR_ROI',\
+        'SET_WINDOW']
+    assert empty.commands(ROISet.from_mask(np.zeros(16, dtype=bool))) == []
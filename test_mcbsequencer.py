@@ -0,0 +1,41 @@
+from mcbsequencer import MCBJob, MCBSequencer
+from mcbdriver import MCBTimeout
+import mcbdriver_test
+import json
+
+class SimDriver(mcbdriver_test.MCBDriver):
+    # one handle per detector, presets reached at once, detector 2 fails
+    def __init__(self):
+        super().__init__()
+        self.closed = []
+
+    def open_detector(self, ndet):
+        return ndet
+
+    def close_detector(self, hdet):
+        self.closed.append(hdet)
+
+    def is_active(self, hdet):
+        if hdet == 2:
+            raise MCBTimeout('MIOIsActive timed out', -2, call='MIOIsActive')
+        return False
+
+def journal(path):
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file]
+
+def test_failed_detector_does_not_stop_others(tmp_path):
+    jobs = [MCBJob(1, real_preset=10, runs=2), MCBJob(2, real_preset=10)]
+    driver = SimDriver()
+    sequencer = MCBSequencer(driver, jobs, str(tmp_path))
+    sequencer.min_poll = 0.01
+    sequencer.run()
+    events = [(entry['event'], entry['ndet']) for entry in\
+        journal(sequencer.journal_path)]
+    assert events.count(('saved', 1)) == 2
+    assert events.count(('failed', 2)) == 1
+    assert sorted(driver.closed) == [1, 2]
+
+    # saved runs are found again when the job file is reordered
+    sequencer = MCBSequencer(SimDriver(), jobs[::-1], str(tmp_path))
+    assert list(sequencer.pending()) == [2]
@@ -0,0 +1,24 @@
+from mcbspectrum import Spectrum, normalize, subtract, build_stack
+import numpy as np
+import pytest
+
+def test_normalize_without_live_time():
+    with pytest.raises(ValueError):
+        normalize(Spectrum(np.ones(8)), 1000)
+    spec = normalize(Spectrum(np.full(8, 4.), live=2000, real=2100), 1000)
+    assert spec.live == 1000
+    assert np.all(spec.counts == 2)
+
+def test_subtract_background_without_live_time():
+    spec = Spectrum(np.full(8, 4.), live=2000)
+    with pytest.raises(ValueError):
+        subtract(spec, Spectrum(np.ones(8)))
+    assert np.all(subtract(spec, Spectrum(np.ones(8)), normalized=False)\
+        .counts == 3)
+
+def test_build_stack_different_channels():
+    specs = {'a': Spectrum(np.ones(8)), 'b': Spectrum(np.ones(4))}
+    with pytest.raises(ValueError):
+        build_stack(['a', 'b'], read=specs.get)
+    counts, lives, reals, first = build_stack(['a', 'a'], read=specs.get)
+    assert counts.shape == (2, 8)